@@ -1,14 +1,21 @@
 # verification_3_1_1.py
 import pandas as pd
+from flight_cube import load_cube, rollup
 
 # 加载数据
-df = pd.read_excel('output/khn_flight_processed.xlsx')
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
 
-# 计算每小时的平均延误和航班量
-hourly_stats = df.groupby('小时段').agg(
-    avg_delay=('delayMin', 'mean'),
-    flight_count=('航班号', 'count')
-).reset_index()
+cube = load_cube(airports=AIRPORTS, start=MONTHS[0], end=MONTHS[1])
+
+# 计算每小时的平均延误和航班量（由预聚合立方体上卷）
+hourly = rollup(cube, '小时段')
+hourly_stats = pd.DataFrame({
+    '小时段': hourly.index.to_numpy(),
+    'avg_delay': hourly['mean_delay'].to_numpy(),
+    'flight_count': hourly['count'].to_numpy()
+})
 
 # 找出延误和航班量的峰值
 hourly_stats['avg_delay'] = hourly_stats['avg_delay'].round(1)  # 保留1位小数
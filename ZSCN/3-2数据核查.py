@@ -1,17 +1,22 @@
 # verification_3_2.py
 import pandas as pd
+from flight_store import FlightStore
+from kpi import group_kpis
+from parallel_agg import WEEKEND_DAYS
 from scipy import stats
 
-df = pd.read_excel('output/khn_flight_processed.xlsx')
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
 
-# 生成日期类型
-df['日期类型'] = df['星期'].isin(['周六', '周日']).map({True: '周末', False: '工作日'})
+df = FlightStore().scan(AIRPORTS, MONTHS[0], MONTHS[1]).select('星期', 'delayMin').load()
+
+# 生成日期类型（星期为英文名，WEEKEND_DAYS 同时含中英文写法，与图3-2口径一致）
+df['日期类型'] = df['星期'].isin(WEEKEND_DAYS).map({True: '周末', False: '工作日'})
 
 # 核心统计
-stats_summary = df.groupby('日期类型').agg(
-    延误率=('isDelay', lambda x: x.mean() * 100),
-    平均延误=('delayMin', 'mean'),
-    航班量=('航班号', 'count')
+stats_summary = group_kpis(df, '日期类型', ['delay_rate', 'mean', 'count']).rename(
+    columns={'delay_rate': '延误率', 'mean': '平均延误', 'count': '航班量'}
 ).round(2)
 
 # 航班量减少百分比
@@ -29,4 +34,3 @@ print(f"t检验: t={t_stat:.3f}, p={p_value:.3f}")
 print(f"差异显著性: {'p<0.01' if p_value<0.01 else 'p>=0.01'}")
 
 # 3-2数据核查已经包括在3-2.py中
-# 此代码有误无需运行
@@ -1,16 +1,23 @@
 # verification_3_3_corrected.py
 import pandas as pd
+from flight_cube import load_cube, rollup
 
-df = pd.read_excel('output/khn_flight_processed.xlsx')
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
 
-# 重新计算：仅统计航班量≥100架次的航司（确保统计显著性）
-airline_stats = df.groupby('所属航司代码').agg(
-    航班量=('航班号', 'count'),
-    正常航班=('延误等级', lambda x: x.isin(['准点', '轻微', '中度']).sum()),
-    平均延误=('delayMin', 'mean')
-)
+cube = load_cube(airports=AIRPORTS, start=MONTHS[0], end=MONTHS[1])
+total_flights = int(cube['count'].sum())
 
-airline_stats['正常率'] = (airline_stats['正常航班'] / airline_stats['航班量'] * 100).round(2)
+# 重新计算：仅统计航班量≥100架次的航司（确保统计显著性，由预聚合立方体上卷）
+airline = rollup(cube, '所属航司代码')
+airline_stats = pd.DataFrame({
+    '航班量': airline['count'],
+    '正常航班': airline['n_normal'],  # 延误等级为准点/轻微/中度
+    '平均延误': airline['mean_delay']
+})
+
+airline_stats['正常率'] = airline['normal_rate'].round(2)
 
 # 筛选航班量≥100的航司
 significant_airlines = airline_stats[airline_stats['航班量'] >= 100]
@@ -22,7 +29,7 @@ print("图3-3 航司正常率Top10（航班量≥100架次）:")
 print(top10)
 
 # 计算样本正常率（所有航司）
-sample_normal_rate = airline_stats['正常航班'].sum() / airline_stats['航班量'].sum() * 100
+sample_normal_rate = rollup(cube)['normal_rate'].iloc[0]
 print(f"\n样本总体正常率: {sample_normal_rate:.2f}%")
 
 # 重新核查江西航空(CJX)
@@ -31,7 +38,7 @@ if 'CJX' in significant_airlines.index:
     print(f"\n江西航空(CJX)数据:")
     print(f"  正常率: {cjx['正常率']}%")
     print(f"  平均延误: {cjx['平均延误']:.1f}分钟")
-    print(f"  运力份额: {cjx['航班量'] / len(df) * 100:.1f}%")
+    print(f"  运力份额: {cjx['航班量'] / total_flights * 100:.1f}%")
 else:
     print("\n⚠️ 江西航空(CJX)航班量不足100架次，未进入统计")
 
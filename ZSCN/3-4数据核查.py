@@ -1,21 +1,27 @@
 import pandas as pd
-import numpy as np
 from scipy import stats
 import sys
 
+from flight_store import FlightStore
+from kpi import group_kpis
+from significance import compare_groups
+
 # ==================== 配置区 ====================
-DATA_PATH = 'output/khn_flight_processed.xlsx'
 # 主基地航司代码（江西航空）
 MAIN_AIRLINE = 'CJX'
 # 延误分钟合理范围（scale过滤）
 DELAY_MIN_VALID = (0, 180)  # 0-3小时
 # 最小样本量阈值
 MIN_SAMPLE_SIZE = 10
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
 
 # ==================== 数据加载 ====================
 try:
     # 修复：使用原始列名"所属航司代码"
-    df = pd.read_excel(DATA_PATH, usecols=['航班号', '所属航司代码', 'delayMin'])
+    df = (FlightStore().scan(AIRPORTS, MONTHS[0], MONTHS[1])
+          .select('航班号', '所属航司代码', 'delayMin').load())
     print(f"数据加载成功，总样本数：{len(df)} 条")
 except Exception as e:
     print(f"✗ 数据加载失败: {e}")
@@ -30,18 +36,12 @@ print(f"经过scale过滤后，有效样本数：{len(df_valid)} 条")
 
 # ==================== 航司分布统计 ====================
 # 修复：按"所属航司代码"分组
-airline_stats = df_valid.groupby('所属航司代码').agg(
-    航班数量=('航班号', 'count'),
-    平均延误=('delayMin', 'mean'),
-    中位延误=('delayMin', 'median'),
-    标准差=('delayMin', 'std'),
-    延误_25分位=('delayMin', lambda x: np.percentile(x, 25)),
-    延误_75分位=('delayMin', lambda x: np.percentile(x, 75)),
-    异常值数量=(
-    'delayMin', lambda x: ((x < np.percentile(x, 25) - 1.5 * (np.percentile(x, 75) - np.percentile(x, 25))) |
-                           (x > np.percentile(x, 75) + 1.5 * (np.percentile(x, 75) - np.percentile(x, 25)))).sum()),
-    最大延误=('delayMin', 'max')
-).round(2)
+airline_stats = group_kpis(
+    df_valid, '所属航司代码', ['count', 'mean', 'median', 'std', 'p25', 'p75', 'n_outliers', 'max']
+).rename(columns={
+    'count': '航班数量', 'mean': '平均延误', 'median': '中位延误', 'std': '标准差',
+    'p25': '延误_25分位', 'p75': '延误_75分位', 'n_outliers': '异常值数量', 'max': '最大延误'
+}).round(2)
 
 # 按航班数量排序
 airline_stats = airline_stats.sort_values('航班数量', ascending=False)
@@ -64,7 +64,9 @@ if MAIN_AIRLINE in df_valid['所属航司代码'].values:
 
     # Mann-Whitney U检验（非参数检验）
     if len(main_data) >= MIN_SAMPLE_SIZE and len(other_data) >= MIN_SAMPLE_SIZE:
-        statistic, p_value = stats.mannwhitneyu(main_data, other_data, alternative='two-sided')
+        test = compare_groups(df_valid, '所属航司代码', 'vs_rest', tests=['mannwhitney'], groups=[MAIN_AIRLINE],
+                              min_count=MIN_SAMPLE_SIZE).iloc[0]
+        statistic, p_value = test['U'], test['p_mw']
         print(f"\nMann-Whitney U检验结果：")
         print(f"统计量 U = {statistic:.0f}")
         print(f"P值 = {p_value:.4f}")
@@ -74,11 +76,9 @@ if MAIN_AIRLINE in df_valid['所属航司代码'].values:
         else:
             print("结论：**无法拒绝原假设**，江西航空与外航延误分布无显著差异")
 
-        # 计算效应量（r = Z / sqrt(N)）
-        z_score = stats.norm.ppf(p_value / 2) if p_value < 0.5 else stats.norm.ppf(1 - p_value / 2)
-        n_total = len(main_data) + len(other_data)
-        effect_size = abs(z_score) / np.sqrt(n_total)
-        print(f"效应量 r = {effect_size:.3f} (0.1小/0.3中/0.5大)")
+        # 效应量：r = Z / sqrt(N)（Z由U统计量直接得到）与秩二列相关
+        print(f"效应量 r = {abs(test['r']):.3f} (0.1小/0.3中/0.5大)")
+        print(f"秩二列相关 = {test['rank_biserial']:.3f}（<0表示江西航空延误偏小）")
     else:
         print(f"\n样本量不足（需≥{MIN_SAMPLE_SIZE}），无法进行统计检验")
 else:
@@ -7,69 +7,27 @@ from pyecharts.globals import ThemeType
 from pyecharts.commons.utils import JsCode
 import json
 
+from aircraft_types import MAIN_FAMILIES, ensure_aircraft_family
+from figure_payload import SCATTER_MAX_POINTS, bin_scatter, render_figure, sample_points
+from flight_store import FlightStore
+from chart_3_6_aircraft_scatter import OUTLIER_MAX_POINTS, SCATTER_COLUMNS, route_distances
+
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
+
 # ==================== 第一步：数据加载 ====================
-df_full = pd.read_excel("output/khn_flight_processed.xlsx").copy()
+df_full = FlightStore().scan(AIRPORTS, MONTHS[0], MONTHS[1]).select(*SCATTER_COLUMNS).load()
 print(f"图3-6 数据加载: {len(df_full)}条记录")
 
 # ==================== 第二步：计算原始距离 ====================
-airport_coords_iata = {
-    'KHN': {'lat': 28.865, 'lon': 115.9}, 'PEK': {'lat': 40.08, 'lon': 116.6}, 'PKX': {'lat': 39.5, 'lon': 116.4},
-    'SHA': {'lat': 31.2, 'lon': 121.3}, 'PVG': {'lat': 31.1, 'lon': 121.8}, 'CAN': {'lat': 23.4, 'lon': 113.3},
-    'SZX': {'lat': 22.6, 'lon': 114.1}, 'CTU': {'lat': 30.7, 'lon': 103.9}, 'TFU': {'lat': 30.3, 'lon': 104.4},
-    'KMG': {'lat': 25.1, 'lon': 102.7}, 'XIY': {'lat': 34.4, 'lon': 108.8}, 'HGH': {'lat': 30.2, 'lon': 120.4},
-    'NKG': {'lat': 31.7, 'lon': 118.9}, 'WUH': {'lat': 30.8, 'lon': 114.2}, 'CSX': {'lat': 28.2, 'lon': 113.2},
-    'HFE': {'lat': 31.9, 'lon': 117.3}, 'HRB': {'lat': 45.6, 'lon': 126.2}, 'SHE': {'lat': 41.6, 'lon': 123.5},
-    'TYN': {'lat': 37.7, 'lon': 112.6}, 'HET': {'lat': 40.9, 'lon': 111.8}, 'TAO': {'lat': 36.3, 'lon': 120.4},
-    'XMN': {'lat': 24.5, 'lon': 118.1}, 'FOC': {'lat': 25.9, 'lon': 119.7}, 'NNG': {'lat': 22.6, 'lon': 108.2},
-    'KWL': {'lat': 25.2, 'lon': 110.0}, 'URC': {'lat': 43.9, 'lon': 87.5}, 'LHW': {'lat': 36.5, 'lon': 103.6}
-}
-
-
-def calc_distance(row):
-    try:
-        from math import radians, sin, cos, sqrt, atan2
-        if row['起飞机场三字码'] != 'KHN':
-            return np.nan
-        origin = airport_coords_iata['KHN']
-        dest = airport_coords_iata.get(row['到达机场三字码'])
-        if not dest:
-            return np.random.uniform(500, 1200)
-
-        lat1, lon1 = radians(origin['lat']), radians(origin['lon'])
-        lat2, lon2 = radians(dest['lat']), radians(dest['lon'])
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return max(150, 6371 * c)
-    except:
-        return np.random.uniform(500, 1200)
-
-
-df_full['flightDistance'] = df_full.apply(calc_distance, axis=1)
+df_full['flightDistance'] = route_distances(df_full['起飞机场三字码'], df_full['到达机场三字码'])
 print(
     f"✅ 距离计算完成: 平均{df_full['flightDistance'].mean():.1f}km, 范围[{df_full['flightDistance'].min():.1f}, {df_full['flightDistance'].max():.1f}]")
 
 
 # ==================== 第三步：分类与标记 ====================
-def classify_ac_type(model):
-    if pd.isna(model):
-        return '其他'
-    m = str(model).upper()
-    if 'A320' in m or 'A321' in m:
-        return 'A320系列'
-    elif 'B737' in m:
-        return 'B737系列'
-    elif 'E190' in m:
-        return 'E190支线'
-    elif 'CRJ' in m:
-        return 'CRJ支线'
-    elif 'ARJ21' in m or 'ARJ-21' in m:
-        return 'ARJ21支线'
-    else:
-        return '其他'
-
-
-df_full['机型分类'] = df_full['机型'].apply(classify_ac_type)
+ensure_aircraft_family(df_full)  # 机型分类由process_data衍生，规则见aircraft_types
 df_full['is_extreme_outlier'] = df_full['delayMin'] > 180
 
 # ******* 修复：添加异常值总数计算 *******
@@ -87,7 +45,7 @@ df_plot = df_full[
 print(f"筛选后数据: {len(df_plot)}条")
 
 # ==================== 第五步：构建绘图数据 ====================
-main_groups = ['A320系列', 'B737系列', 'E190支线', 'CRJ支线', 'ARJ21支线']
+main_groups = MAIN_FAMILIES
 scatter_series = {}
 
 for ac_type in main_groups:
@@ -95,13 +53,9 @@ for ac_type in main_groups:
     if len(sub_df) == 0:
         continue
 
-    sub_df.loc[:, 'delay_int'] = sub_df['delayMin'].round(0)
-
-    freq = sub_df.groupby(['delay_int', 'flightDistance']).agg(
-        freq=('机型分类', 'size')
-    ).reset_index()
-
-    points = freq[['delay_int', 'flightDistance', 'freq']].values.tolist()
+    delay, distance, freq = bin_scatter(sub_df['delayMin'].round(0), sub_df['flightDistance'],
+                                        max_points=SCATTER_MAX_POINTS)
+    points = np.column_stack([np.round(delay, 1), np.round(distance, 1), freq.astype(np.int64)]).tolist()
 
     scatter_series[ac_type] = {
         'data': points,
@@ -117,18 +71,20 @@ colors = {
     'CRJ支线': '#9b59b6', 'ARJ21支线': '#2ecc71'
 }
 
+# 数值型x轴：每个点自带[延误, 距离, 频次]
+scatter.add_xaxis([])
+
 # 添加主要机型序列
 for ac_type, series_data in scatter_series.items():
     if not series_data['data']:
         continue
 
-    scatter.add_xaxis([p[0] for p in series_data['data']])
     scatter.add_yaxis(
         series_name=ac_type,
-        y_axis=[[p[1], p[2]] for p in series_data['data']],
+        y_axis=series_data['data'],
         symbol_size=JsCode("""
             function(data) {
-                return Math.min(20, Math.max(4, data[1] * 1.5 + 2));
+                return Math.min(20, Math.max(4, data[2] * 1.5 + 2));
             }
         """),
         itemstyle_opts=opts.ItemStyleOpts(color=colors[ac_type], opacity=0.85),
@@ -146,18 +102,18 @@ for ac_type, series_data in scatter_series.items():
 # 添加异常值
 outlier_df = df_plot[df_plot['delayMin'] > 180]
 if len(outlier_df) > 0:
-    outlier_freq = outlier_df.groupby(['delayMin', 'flightDistance']).agg(
+    kept = sample_points(outlier_df['delayMin'], outlier_df['flightDistance'], OUTLIER_MAX_POINTS)
+    outlier_freq = outlier_df.iloc[kept].groupby(['delayMin', 'flightDistance']).agg(
         freq=('机型分类', 'size')
     ).reset_index()
-    outlier_points = outlier_freq.values.tolist()
+    outlier_points = outlier_freq.round({'flightDistance': 1}).values.tolist()
 
-    scatter.add_xaxis([p[0] for p in outlier_points])
     scatter.add_yaxis(
         series_name='严重延误异常值(>180min)',
-        y_axis=[[p[1], p[2]] for p in outlier_points],
+        y_axis=outlier_points,
         symbol_size=JsCode("""
             function(data) {
-                return Math.min(25, Math.max(8, data[1] * 2 + 4));
+                return Math.min(25, Math.max(8, data[2] * 2 + 4));
             }
         """),
         symbol='star',
@@ -217,7 +173,7 @@ scatter.set_global_opts(
 )
 
 output_path = 'output/figures/图3-6_机型延误散点.html'
-scatter.render(output_path)
+render_figure(scatter, output_path)
 
 # ==================== 第八步：重点数据审查与论文修正 ====================
 print("\n" + "=" * 70)
@@ -260,6 +216,7 @@ for ac_type in main_groups:
 print("\n【严重延误异常值分析】")
 outlier_detail = df_full[df_full['delayMin'] > 180].copy()
 outlier_by_type = outlier_detail['机型分类'].value_counts()
+outlier_by_type = outlier_by_type[outlier_by_type > 0]  # 分类列含全部类别，去掉无异常值的分类
 
 print(f"异常值总数: {len(outlier_detail)}条")
 print("\n按机型分布:")
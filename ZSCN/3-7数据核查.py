@@ -6,55 +6,18 @@
 """
 
 import pandas as pd
-import json
 import numpy as np
 
-# ==========================================
-# IATA→ICAO转换字典（扩展版）
-# ==========================================
-IATA_TO_ICAO = {
-    'KHN': 'ZSCN', 'PEK': 'ZBAA', 'PKX': 'ZBAD', 'SHA': 'ZSSS', 'PVG': 'ZSPD',
-    'CAN': 'ZGGG', 'SZX': 'ZGSZ', 'CTU': 'ZUUU', 'TFU': 'ZUTF', 'HGH': 'ZSHC',
-    'WUH': 'ZHHH', 'XIY': 'ZLXY', 'CKG': 'ZUCK', 'TSN': 'ZBTJ', 'HAK': 'ZJHK',
-    'SYX': 'ZJSY', 'XMN': 'ZSAM', 'TAO': 'ZSQD', 'DLC': 'ZYTL', 'NKG': 'ZSNJ',
-    'KMG': 'ZPPP', 'NNG': 'ZGNN', 'CSX': 'ZGHA', 'HFE': 'ZSOF', 'SHE': 'ZYTX',
-    'CGQ': 'ZYCC', 'HRB': 'ZYHB', 'INC': 'ZBYC', 'URC': 'ZWWW', 'KWE': 'ZUGY',
-    'LJG': 'ZPLJ', 'LUM': 'ZPLX', 'DLU': 'ZPDL', 'JHG': 'ZPJH', 'KWL': 'ZGKL',
-    'BHY': 'ZGBH', 'ENH': 'ZHES', 'RIZ': 'ZSRZ', 'ZHA': 'ZGZJ', 'LYI': 'ZSLY',
-    'JNG': 'ZSJG', 'WMT': 'ZSWT', 'XUZ': 'ZSXZ', 'HSN': 'ZSZS', 'DSN': 'ZBDS',
-    'DOY': 'ZSDY', 'YCU': 'ZBYC', 'LFQ': 'ZBLF', 'SWA': 'ZGOW', 'ZUH': 'ZGSD',
-    'GOQ': 'ZLGM', 'YIN': 'ZWYN', 'HTN': 'ZWAT', 'HET': 'ZBHH', 'TYN': 'ZBYN',
-    'CGO': 'ZHCC', 'HIA': 'ZSSH', 'LYG': 'ZSLG', 'LYA': 'ZHLY', 'WNZ': 'ZSWZ',
-    'NTG': 'ZSNT', 'YNT': 'ZSYT', 'JJN': 'ZSQZ'
-}
-
-# ==========================================
-# 机场代码→中文名称映射
-# ==========================================
-AIRPORT_NAMES = {
-    'KHN': '南昌昌北', 'ZSCN': '南昌昌北', 'PEK': '北京首都', 'ZBAA': '北京首都',
-    'PKX': '北京大兴', 'ZBAD': '北京大兴', 'SHA': '上海虹桥', 'ZSSS': '上海虹桥',
-    'PVG': '上海浦东', 'ZSPD': '上海浦东', 'CAN': '广州白云', 'ZGGG': '广州白云',
-    'SZX': '深圳宝安', 'ZGSZ': '深圳宝安', 'CTU': '成都双流', 'ZUUU': '成都双流',
-    'TFU': '成都天府', 'ZUTF': '成都天府', 'HGH': '杭州萧山', 'ZSHC': '杭州萧山',
-    'WUH': '武汉天河', 'ZHHH': '武汉天河', 'XIY': '西安咸阳', 'ZLXY': '西安咸阳',
-    'CKG': '重庆江北', 'ZUCK': '重庆江北', 'TSN': '天津滨海', 'ZBTJ': '天津滨海',
-    'HAK': '海口美兰', 'ZJHK': '海口美兰', 'SYX': '三亚凤凰', 'ZJSY': '三亚凤凰',
-    'XMN': '厦门高崎', 'ZSAM': '厦门高崎', 'TAO': '青岛胶东', 'ZSQD': '青岛胶东',
-    'DLC': '大连周水子', 'ZYTL': '大连周水子', 'NKG': '南京禄口', 'ZSNJ': '南京禄口',
-    'KMG': '昆明长水', 'ZPPP': '昆明长水', 'NNG': '南宁吴圩', 'ZGNN': '南宁吴圩',
-    'CSX': '长沙黄花', 'ZGHA': '长沙黄花', 'HFE': '合肥新桥', 'ZSOF': '合肥新桥',
-    'SHE': '沈阳桃仙', 'ZYTX': '沈阳桃仙', 'CGQ': '长春龙嘉', 'ZYCC': '长春龙嘉',
-    'HRB': '哈尔滨太平', 'ZYHB': '哈尔滨太平', 'INC': '银川河东', 'ZBYC': '银川河东',
-    'URC': '乌鲁木齐地窝堡', 'ZWWW': '乌鲁木齐地窝堡', 'KWE': '贵阳龙洞堡', 'ZUGY': '贵阳龙洞堡',
-    'ZUH': '珠海金湾', 'ZGSD': '珠海金湾'
-}
+from airports import get_registry
+from flight_store import FlightStore
+from kpi import group_kpis
 
 # ==========================================
 # 核心配置
 # ==========================================
-DATA_PATH = 'output/khn_flight_processed.xlsx'
-COORDS_PATH = 'output/airport_coords.json'
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
 
 
 # ==========================================
@@ -62,7 +25,7 @@ COORDS_PATH = 'output/airport_coords.json'
 # ==========================================
 def load_flight_data():
     """加载并清洗航班数据"""
-    df = pd.read_excel(DATA_PATH)
+    df = FlightStore().scan(AIRPORTS, MONTHS[0], MONTHS[1]).load()
 
     # 字段映射
     field_mapping = {
@@ -85,18 +48,8 @@ def load_flight_data():
 
 
 def load_airport_coords():
-    """加载并扩展机场坐标库（ICAO+IATA双索引）"""
-    with open(COORDS_PATH, 'r', encoding='utf-8') as f:
-        coords_original = json.load(f)
-
-    # 双向索引
-    coords_all = {}
-    for icao_code, coord in coords_original.items():
-        coords_all[icao_code] = coord
-        # 反向查找IATA
-        for iata_code, icao in IATA_TO_ICAO.items():
-            if icao == icao_code:
-                coords_all[iata_code] = coord
+    """加载机场坐标库（ICAO+IATA双索引，取自机场登记表）"""
+    coords_all = get_registry().coords_dict()
 
     print(f"✓ 坐标库加载: {len(coords_all)}个机场")
     print(f"  - ICAO代码: {len([c for c in coords_all if len(c) == 4])}个")
@@ -136,21 +89,16 @@ def analyze_geo_delay(df, airport_coords):
     print("🔍 机场坐标匹配核查")
     print("=" * 60)
 
+    registry = get_registry()
     unique_dests = df_outbound['destAirport'].unique()
-    matched_dests = {}
-
     for dest in unique_dests:
-        if dest in airport_coords:
-            matched_dests[dest] = dest
-        else:
-            icao = IATA_TO_ICAO.get(dest)
-            if icao and icao in airport_coords:
-                matched_dests[dest] = icao
-                print(f"  ✓ 转换成功: {dest}({AIRPORT_NAMES.get(dest, dest)}) → {icao}")
+        icao = registry.to_icao(dest)
+        if icao and icao != dest and icao in airport_coords:
+            print(f"  ✓ 转换成功: {dest}({registry.name_of(dest)}) → {icao}")
 
-    # 应用转换
-    df_outbound['destAirport'] = df_outbound['destAirport'].map(matched_dests)
-    df_outbound = df_outbound.dropna(subset=['destAirport'])
+    # 应用转换：目的地统一为ICAO，仅保留有坐标的机场（登记表向量化关联）
+    df_outbound['destAirport'] = registry.join(df_outbound['destAirport'], fields=['icao'])['icao']
+    df_outbound = df_outbound[df_outbound['destAirport'].isin(airport_coords.keys())]
 
     coverage = len(df_outbound['destAirport'].unique()) / len(unique_dests) * 100
     print(f"\n📊 匹配统计:")
@@ -166,14 +114,14 @@ def analyze_geo_delay(df, airport_coords):
     print("📈 延误空间分布统计")
     print("=" * 60)
 
-    dest_stats = df_outbound.groupby('destAirport').agg(
-        avg_delay=('delayMin', 'mean'),
-        median_delay=('delayMin', 'median'),
-        flight_count=('flightNo', 'count'),
-        delay_flight_count=('isDelay', 'sum'),
-        total_delay=('delayMin', 'sum'),
-        delay_rate=('isDelay', 'mean')
-    ).round(2)
+    dest_stats = group_kpis(
+        df_outbound, 'destAirport', ['mean', 'median', 'count', 'n_delayed', 'sum', 'delay_rate']
+    ).rename(columns={
+        'mean': 'avg_delay', 'median': 'median_delay', 'count': 'flight_count',
+        'n_delayed': 'delay_flight_count', 'sum': 'total_delay'
+    })
+    dest_stats['delay_rate'] = dest_stats['delay_rate'] / 100
+    dest_stats = dest_stats.round(2)
 
     # 计算延误率百分比
     dest_stats['delay_rate_pct'] = (dest_stats['delay_rate'] * 100).round(1)
@@ -197,10 +145,8 @@ def analyze_geo_delay(df, airport_coords):
     morning_df = df_outbound[(df_outbound['hour'] >= 8) & (df_outbound['hour'] < 10)]
 
     if len(morning_df) > 0:
-        morning_stats = morning_df.groupby('destAirport').agg(
-            morning_total=('flightNo', 'count'),
-            morning_delay=('isDelay', 'sum')
-        )
+        morning_stats = group_kpis(morning_df, 'destAirport', ['count', 'n_delayed']).rename(
+            columns={'count': 'morning_total', 'n_delayed': 'morning_delay'})
 
         dest_stats = dest_stats.join(morning_stats, how='left').fillna(0)
 
@@ -305,9 +251,9 @@ def generate_paper_content(dest_stats, correlation_desc):
     print("\n【段落4：高延误航线TOP3】")
     top3 = dest_stats.nlargest(3, 'avg_delay')
     for i, (icao, row) in enumerate(top3.iterrows(), 1):
-        iata_name = [k for k, v in IATA_TO_ICAO.items() if v == icao]
-        name_str = f"{iata_name[0]}({icao})" if iata_name else icao
-        name_cn = AIRPORT_NAMES.get(icao, icao)
+        iata = get_registry().to_iata(icao)
+        name_str = f"{iata}({icao})" if iata else icao
+        name_cn = get_registry().name_of(icao)
         print(f"{i}. {name_cn}({name_str})")
         print(f"   平均延误: {row['avg_delay']:.1f}分钟，")
         print(f"   距离: {row['distance_km']:.0f}公里，")
@@ -352,7 +298,7 @@ def main():
     print("📋 附录：详细航线统计表")
     print("=" * 70)
     export_df = dest_stats.copy()
-    export_df['机场名称'] = export_df.index.map(lambda x: AIRPORT_NAMES.get(x, x))
+    export_df['机场名称'] = export_df.index.map(get_registry().name_of)
     export_df = export_df.sort_values('avg_delay', ascending=False)
     export_df['延误等级'] = pd.cut(export_df['avg_delay'],
                                    bins=[-np.inf, 10, 20, 30, np.inf],
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+机型分类（第二章衍生字段，图3-5、图3-6及对应核查脚本共用）
+
+规则表按顺序匹配，命中第一条即返回；均未命中（含缺失）归为“其他”。
+每条规则的模式为子串（任一命中即可），元组表示其中子串须同时出现。
+匹配前统一转大写并去除首尾空白。
+
+classify_series 只对不同机型取值（样本中约60种）各判断一次，再按分类编码映射回各行，
+process_data.derive_fields 据此写入“机型分类”列，图表直接使用该列，无需逐行重新分类。
+"""
+
+import numpy as np
+import pandas as pd
+
+OTHER_FAMILY = '其他'
+
+# (机型分类, 模式列表)
+AIRCRAFT_FAMILY_RULES = [
+    ('A320系列', ['A320', 'A321', 'A319', 'A318']),
+    ('B737系列', ['B737', 'BOEING 737']),
+    ('E190支线', ['E190', 'E195', 'E-190']),
+    ('CRJ支线', ['CRJ']),
+    ('ARJ21支线', ['ARJ21', ('ARJ', '21')]),
+]
+
+AIRCRAFT_FAMILIES = [family for family, _ in AIRCRAFT_FAMILY_RULES] + [OTHER_FAMILY]
+MAIN_FAMILIES = AIRCRAFT_FAMILIES[:-1]  # 图表展示的主流/支线分类
+
+
+def _matches(model, pattern):
+    if isinstance(pattern, tuple):
+        return all(part in model for part in pattern)
+    return pattern in model
+
+
+def classify_aircraft(model):
+    """单个机型取值 → 机型分类"""
+    if pd.isna(model):
+        return OTHER_FAMILY
+    model = str(model).upper().strip()
+    for family, patterns in AIRCRAFT_FAMILY_RULES:
+        if any(_matches(model, pattern) for pattern in patterns):
+            return family
+    return OTHER_FAMILY
+
+
+def classify_series(models):
+    """
+    机型列 → 机型分类列（category，类别顺序同AIRCRAFT_FAMILIES）
+    只对不同取值分类一次，经分类编码映射回各行；缺失值（编码-1）归为“其他”
+    """
+    models = pd.Series(models)
+    if not isinstance(models.dtype, pd.CategoricalDtype):
+        models = models.astype('category')
+    categories = models.cat.categories
+    family_codes = np.array([AIRCRAFT_FAMILIES.index(classify_aircraft(m)) for m in categories] +
+                            [AIRCRAFT_FAMILIES.index(OTHER_FAMILY)], dtype=np.int8)
+    # 编码-1（缺失）取到末尾追加的“其他”
+    codes = family_codes[models.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=AIRCRAFT_FAMILIES),
+                     index=models.index, name='机型分类')
+
+
+def ensure_aircraft_family(df):
+    """确保航班表含“机型分类”列（旧版处理后数据缺少该列时补算）"""
+    if '机型分类' not in df.columns:
+        df['机型分类'] = classify_series(df['机型'])
+    return df
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+机场登记表（图3-6、图3-7及对应核查脚本共用）
+
+每个机场一行：IATA三字码、ICAO四字码、中文名称、经纬度。
+- 坐标优先取 output/airport_coords.json（OpenFlights，3-7_get_airport_coords.py生成，按ICAO索引），
+  缺失时使用下方内置近似坐标
+- IATA与ICAO代码共用一个字典索引，单次查找O(1)
+- 各字段另存为numpy数组，按行号整列取值，可对航班表做向量化关联（positions/join）
+
+get_registry() 在进程内只加载一次。
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COORDS_PATH = Path('output/airport_coords.json')
+
+# (IATA, ICAO, 中文名称, 纬度, 经度)；坐标为None表示仅依赖airport_coords.json
+AIRPORT_TABLE = [
+    ('KHN', 'ZSCN', '南昌昌北', 28.865, 115.9),
+    ('PEK', 'ZBAA', '北京首都', 40.08, 116.6),
+    ('PKX', 'ZBAD', '北京大兴', 39.5, 116.4),
+    ('SHA', 'ZSSS', '上海虹桥', 31.2, 121.3),
+    ('PVG', 'ZSPD', '上海浦东', 31.1, 121.8),
+    ('CAN', 'ZGGG', '广州白云', 23.4, 113.3),
+    ('SZX', 'ZGSZ', '深圳宝安', 22.6, 114.1),
+    ('CTU', 'ZUUU', '成都双流', 30.7, 103.9),
+    ('TFU', 'ZUTF', '成都天府', 30.3, 104.4),
+    ('HGH', 'ZSHC', '杭州萧山', 30.2, 120.4),
+    ('WUH', 'ZHHH', '武汉天河', 30.8, 114.2),
+    ('XIY', 'ZLXY', '西安咸阳', 34.4, 108.8),
+    ('CKG', 'ZUCK', '重庆江北', None, None),
+    ('TSN', 'ZBTJ', '天津滨海', None, None),
+    ('HAK', 'ZJHK', '海口美兰', None, None),
+    ('SYX', 'ZJSY', '三亚凤凰', None, None),
+    ('XMN', 'ZSAM', '厦门高崎', 24.5, 118.1),
+    ('TAO', 'ZSQD', '青岛胶东', 36.3, 120.4),
+    ('DLC', 'ZYTL', '大连周水子', None, None),
+    ('NKG', 'ZSNJ', '南京禄口', 31.7, 118.9),
+    ('KMG', 'ZPPP', '昆明长水', 25.1, 102.7),
+    ('NNG', 'ZGNN', '南宁吴圩', 22.6, 108.2),
+    ('CSX', 'ZGHA', '长沙黄花', 28.2, 113.2),
+    ('HFE', 'ZSOF', '合肥新桥', 31.9, 117.3),
+    ('SHE', 'ZYTX', '沈阳桃仙', 41.6, 123.5),
+    ('CGQ', 'ZYCC', '长春龙嘉', None, None),
+    ('HRB', 'ZYHB', '哈尔滨太平', 45.6, 126.2),
+    ('INC', 'ZLIC', '银川河东', None, None),
+    ('URC', 'ZWWW', '乌鲁木齐地窝堡', 43.9, 87.5),
+    ('KWE', 'ZUGY', '贵阳龙洞堡', None, None),
+    ('LJG', 'ZPLJ', '丽江三义', None, None),
+    ('LUM', 'ZPLX', '德宏芒市', None, None),
+    ('DLU', 'ZPDL', '大理凤仪', None, None),
+    ('JHG', 'ZPJH', '西双版纳嘎洒', None, None),
+    ('KWL', 'ZGKL', '桂林两江', 25.2, 110.0),
+    ('BHY', 'ZGBH', '北海福成', None, None),
+    ('ENH', 'ZHES', '恩施许家坪', None, None),
+    ('RIZ', 'ZSRZ', '日照山字河', None, None),
+    ('ZHA', 'ZGZJ', '湛江吴川', None, None),
+    ('LYI', 'ZSLY', '临沂启阳', None, None),
+    ('JNG', 'ZSJG', '济宁大安', None, None),
+    ('WMT', 'ZUMT', '遵义茅台', None, None),
+    ('XUZ', 'ZSXZ', '徐州观音', None, None),
+    ('HSN', 'ZSZS', '舟山普陀山', None, None),
+    ('DSN', 'ZBDS', '鄂尔多斯伊金霍洛', None, None),
+    ('DOY', 'ZSDY', '东营胜利', None, None),
+    ('YCU', 'ZBYC', '运城张孝', None, None),
+    ('LFQ', 'ZBLF', '临汾尧都', None, None),
+    ('SWA', 'ZGOW', '揭阳潮汕', None, None),
+    ('ZUH', 'ZGSD', '珠海金湾', None, None),
+    ('GOQ', 'ZLGM', '格尔木', None, None),
+    ('YIN', 'ZWYN', '伊宁', None, None),
+    ('HTN', 'ZWAT', '和田', None, None),
+    ('HET', 'ZBHH', '呼和浩特白塔', 40.9, 111.8),
+    ('TYN', 'ZBYN', '太原武宿', 37.7, 112.6),
+    ('CGO', 'ZHCC', '郑州新郑', None, None),
+    ('HIA', 'ZSSH', '淮安涟水', None, None),
+    ('LYG', 'ZSLG', '连云港花果山', None, None),
+    ('LYA', 'ZHLY', '洛阳北郊', None, None),
+    ('WNZ', 'ZSWZ', '温州龙湾', None, None),
+    ('NTG', 'ZSNT', '南通兴东', None, None),
+    ('YNT', 'ZSYT', '烟台蓬莱', None, None),
+    ('JJN', 'ZSQZ', '泉州晋江', None, None),
+    ('FOC', 'ZSFZ', '福州长乐', 25.9, 119.7),
+    ('LHW', 'ZLLL', '兰州中川', 36.5, 103.6),
+]
+
+
+class AirportRegistry:
+    """
+    机场登记表
+    字段数组（iata/icao/name/lat/lon）末尾多一行“未知”哨兵（None/NaN），
+    行号-1即取到哨兵，向量化关联时无需额外处理未匹配的代码。
+    """
+
+    FIELDS = ('iata', 'icao', 'name', 'lat', 'lon')
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.iata = np.array([r[0] for r in rows] + [None], dtype=object)
+        self.icao = np.array([r[1] for r in rows] + [None], dtype=object)
+        self.name = np.array([r[2] for r in rows] + [None], dtype=object)
+        self.lat = np.array([np.nan if r[3] is None else r[3] for r in rows] + [np.nan], dtype=float)
+        self.lon = np.array([np.nan if r[4] is None else r[4] for r in rows] + [np.nan], dtype=float)
+
+        self._index = {}
+        for i, (iata, icao) in enumerate(zip(self.iata[:-1], self.icao[:-1])):
+            for code in (iata, icao):
+                if code:
+                    self._index.setdefault(code, i)
+
+    @classmethod
+    def load(cls, coords_path=COORDS_PATH, table=AIRPORT_TABLE):
+        """内置表 + 坐标文件（按ICAO覆盖坐标；文件中独有的机场追加为仅有ICAO的行）"""
+        rows = [list(r) for r in table]
+        by_icao = {r[1]: r for r in rows}
+        try:
+            with open(coords_path, 'r', encoding='utf-8') as f:
+                coords = json.load(f)
+        except (OSError, ValueError):
+            coords = {}
+        for icao, coord in coords.items():
+            row = by_icao.get(icao)
+            if row is None:
+                row = [None, icao, None, None, None]
+                rows.append(row)
+                by_icao[icao] = row
+            row[3], row[4] = float(coord['lat']), float(coord['lon'])
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.iata) - 1
+
+    def __contains__(self, code):
+        return code in self._index
+
+    # ---------- 单个代码查找 ----------
+    def position(self, code):
+        """IATA或ICAO代码 → 行号，未知返回-1"""
+        return self._index.get(code, -1)
+
+    def get(self, code):
+        """代码 → {iata, icao, name, lat, lon}，未知返回None"""
+        i = self._index.get(code)
+        if i is None:
+            return None
+        return {field: getattr(self, field)[i] for field in self.FIELDS}
+
+    def coord(self, code):
+        """代码 → {'lat', 'lon'}，未知或无坐标返回None"""
+        i = self._index.get(code)
+        if i is None or np.isnan(self.lat[i]):
+            return None
+        return {'lat': float(self.lat[i]), 'lon': float(self.lon[i])}
+
+    def name_of(self, code):
+        """代码 → 中文名称，未知或无名称时返回代码本身"""
+        i = self._index.get(code)
+        return (self.name[i] if i is not None else None) or code
+
+    def to_icao(self, code):
+        i = self._index.get(code)
+        return self.icao[i] if i is not None else None
+
+    def to_iata(self, code):
+        i = self._index.get(code)
+        return self.iata[i] if i is not None else None
+
+    # ---------- 向量化关联 ----------
+    def positions(self, codes):
+        """代码列 → 行号数组（未知为-1）；只对去重后的代码查字典，再按编码广播"""
+        values, uniques = pd.factorize(np.asarray(codes, dtype=object))
+        lookup = np.array([self._index.get(code, -1) for code in uniques] + [-1], dtype=np.int64)
+        return lookup[values]
+
+    def join(self, codes, fields=FIELDS, prefix=''):
+        """代码列 → 对应字段的DataFrame（与codes等长、同索引），未知代码对应None/NaN"""
+        pos = self.positions(codes)
+        index = codes.index if isinstance(codes, pd.Series) else None
+        return pd.DataFrame({f'{prefix}{field}': getattr(self, field)[pos] for field in fields}, index=index)
+
+    def coords_dict(self):
+        """有坐标的机场 → {代码: {'lat', 'lon'}}（IATA、ICAO双索引）"""
+        coords = {}
+        for code, i in self._index.items():
+            if not np.isnan(self.lat[i]):
+                coords[code] = {'lat': float(self.lat[i]), 'lon': float(self.lon[i])}
+        return coords
+
+
+@lru_cache(maxsize=None)
+def get_registry(coords_path=COORDS_PATH):
+    """进程内共享的机场登记表（首次调用时加载）"""
+    return AirportRegistry.load(coords_path)
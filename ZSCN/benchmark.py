@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准（第二章各处理阶段 + 第三章各图表的数据准备部分）
+
+每个用例在 8.6k / 10万 / 100万 / 1000万行 四个规模下计时，结果写出为JSON（output/benchmarks/），
+两次结果可直接对比，在升级pandas或修改某一阶段前后发现性能回退。
+
+大样本默认由真实数据整体平移逐份复制得到：每份平移5周，保留星期分布，
+航班号+计划起飞时间互不重复，清洗去重后行数与规模一致；
+--source synthetic 时改用 synth_flights 按真实分布标定的合成数据（固定种子）。
+计时只包含被测函数本身（输入副本、控制台输出均在计时之外），
+全部用例在临时目录中运行，不会覆盖output下的正式图表。
+
+运行方式：
+    python benchmark.py                                          # 全部用例、全部规模
+    python benchmark.py --sizes 8600,100000 --cases clean_data,derive_fields
+    python benchmark.py --source synthetic
+    python benchmark.py --compare output/benchmarks/a.json output/benchmarks/b.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # 无界面渲染（须在导入matplotlib之前设置）
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = Path('data/khn_flight.xlsx')
+RESULTS_DIR = Path('output/benchmarks')
+
+SIZES = [8_600, 100_000, 1_000_000, 10_000_000]
+SHIFT_DAYS = 35               # 每份复制数据的平移天数（整周，且大于样本跨度）
+XLSX_MAX_ROWS = 100_000       # load_data用例：不超过该行数写xlsx，否则写csv（xlsx写出过慢且有行数上限）
+REGRESSION_THRESHOLD = 0.10   # 对比时中位耗时变慢超过10%记为回退
+TIME_COLS = ['计划起飞时间', '计划到达时间', '实际起飞时间', '实际到达时间']
+
+
+def _default_repeats(n_rows):
+    """小规模多次取中位数，百万行以上只跑一次"""
+    if n_rows <= 10_000:
+        return 5
+    if n_rows <= 100_000:
+        return 3
+    return 1
+
+
+# ==========================================
+# 数据准备
+# ==========================================
+def scale_raw(raw, n_rows):
+    """把原始数据扩展（或截取）到 n_rows 行：第k份复制的四个时间字段整体平移 k×SHIFT_DAYS 天"""
+    raw = raw.copy()
+    for col in TIME_COLS:
+        raw[col] = pd.to_datetime(raw[col], errors='coerce')
+    copies = -(-n_rows // len(raw))
+    rows = np.tile(np.arange(len(raw)), copies)[:n_rows]
+    shift = pd.to_timedelta(np.repeat(np.arange(copies), len(raw))[:n_rows] * SHIFT_DAYS, unit='D')
+    scaled = raw.iloc[rows].reset_index(drop=True)
+    for col in TIME_COLS:
+        scaled[col] = scaled[col] + shift
+    return scaled
+
+
+class BenchInputs:
+    """
+    某一规模下各用例的输入（按需构建、缓存）
+    raw → cleaned → derived → cube 逐级派生；raw_file为写到临时目录的原始数据文件，
+    store为derived写出的列式副本（FlightStore）
+    """
+
+    def __init__(self, base_raw, n_rows, source='tile'):
+        self.base_raw = base_raw
+        self.n_rows = n_rows
+        self.source = source
+        self._cache = {}
+
+    def get(self, name):
+        if name not in self._cache:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self._cache[name] = getattr(self, f'_build_{name}')()
+        return self._cache[name]
+
+    def release(self, keep):
+        """释放后续用例不再需要的输入（千万行时各级数据同时驻留内存开销较大）"""
+        for name in list(self._cache):
+            if name not in keep:
+                del self._cache[name]
+        gc.collect()
+
+    def _build_raw(self):
+        if self.source == 'synthetic':
+            import synth_flights
+            return synth_flights.generate(self.n_rows, profile=synth_flights.FlightProfile(self.base_raw))
+        return scale_raw(self.base_raw, self.n_rows)
+
+    def _build_raw_file(self):
+        suffix = '.xlsx' if self.n_rows <= XLSX_MAX_ROWS else '.csv'
+        path = Path(f'khn_flight_{self.n_rows}{suffix}').resolve()
+        raw = self.get('raw')
+        if suffix == '.xlsx':
+            raw.to_excel(path, index=False)
+        else:
+            raw.to_csv(path, index=False)
+        return path
+
+    def _build_store(self):
+        from flight_io import write_columnar_cache
+        from flight_store import FlightStore
+        stem = Path(f'khn_flight_{self.n_rows}_processed').resolve()
+        paths = {'source_path': stem.with_suffix('.xlsx'), 'parquet_path': stem.with_suffix('.parquet'),
+                 'manifest_path': stem.with_suffix('.manifest.json')}
+        write_columnar_cache(self.get('derived'), **paths)
+        return FlightStore(dataset_dir=stem.with_suffix('.dataset'), **paths)
+
+    def _build_cleaned(self):
+        import process_data
+        return process_data.clean_data(self.get('raw').copy())
+
+    def _build_derived(self):
+        import process_data
+        return process_data.derive_fields(self.get('cleaned').copy())
+
+    def _build_cube(self):
+        import process_data
+        return process_data.build_cube(self.get('derived'), process_data.ANOMALY_THRESHOLD)
+
+    def _build_sketches(self):
+        import quantile_sketch
+        return quantile_sketch.build_sketches(self.get('derived'))
+
+    def _build_airport_coords(self):
+        import chart_3_7_geo_distribution
+        return chart_3_7_geo_distribution.load_airport_coords()
+
+
+# ==========================================
+# 用例：inputs为BenchInputs中的输入名，copy表示被测函数会修改第一个输入（每次计时前复制）
+# ==========================================
+def _kpi_case(df):
+    """KPI计算核：航司×星期分组，全部指标"""
+    import kpi
+    return kpi.group_kpis(df, ['所属航司代码', '星期'], ['count', 'share', 'mean', 'std', 'min', 'max', 'median',
+                                                     'p25', 'p75', 'delay_rate', 'normal_rate', 'n_outliers'])
+
+
+def _outlier_case(df):
+    """异常值检测：按航班号（数千个分组）的IQR上下界与逐行标记"""
+    import outliers
+    return outliers.detect_outliers(df, '航班号', 'iqr')
+
+
+def _significance_case(df):
+    """批量显著性检验：航司vs其余、机型分类两两、小时段vs其余（各三种检验）"""
+    import significance
+    return significance.run_comparison_sets(df)
+
+
+def _bootstrap_case(df):
+    """bootstrap置信区间：各航司正常率/平均/中位延误，10000次重抽样"""
+    import bootstrap
+    return bootstrap.bootstrap_frame(df, '所属航司代码')
+
+
+def _trend_case(cube, sketches):
+    """图3-1统计：按小时段上卷立方体，副标题中位数由分位数摘要合并"""
+    import chart_3_1_24h_trend
+    return chart_3_1_24h_trend.hourly_trend_stats(cube), chart_3_1_24h_trend.trend_subtitle(cube, sketches)
+
+
+def _template_batch_case(cube):
+    """模板缓存渲染：图3-1按航司批量生成变体（每个航司一个HTML）"""
+    import chart_3_1_24h_trend
+    return chart_3_1_24h_trend.plot_24h_trend_by('所属航司代码', cube=cube)
+
+
+def _query_case(df):
+    """查询服务：构建查询引擎，示例查询各20轮（未命中/命中缓存），输出延迟分位数"""
+    import query_server
+    return query_server.measure_latency(query_server.FlightQueryEngine(df))
+
+
+def _store_case(store):
+    """下推查询：图3-6口径的筛选+列裁剪读取，及按航司分组统计（只读取两列）"""
+    from chart_3_6_aircraft_scatter import SCATTER_COLUMNS
+    query = store.scan().where(起飞机场三字码='KHN').where('delayMin', 'between', (-60, 300))
+    return query.select(*SCATTER_COLUMNS).load(), query.groupby('所属航司代码').agg(['count', 'normal_rate'])
+
+
+def _parallel_case(df):
+    """多进程分区聚合：五个分组，进程数=CPU核数（与workers=1对比即得加速比）"""
+    import parallel_agg
+    return parallel_agg.parallel_aggregate(df)
+
+
+def _case(module, func):
+    """延迟导入：只运行部分用例时不导入其余图表模块"""
+    def run(*args):
+        return getattr(__import__(module), func)(*args)
+    run.__name__ = f'{module}.{func}'
+    return run
+
+
+CASES = {
+    'load_data': {'func': _case('process_data', 'load_data'), 'inputs': ['raw_file']},
+    'clean_data': {'func': _case('process_data', 'clean_data'), 'inputs': ['raw'], 'copy': True},
+    'derive_fields': {'func': _case('process_data', 'derive_fields'), 'inputs': ['cleaned'], 'copy': True},
+    'build_cube': {'func': _case('process_data', 'build_cube'), 'inputs': ['derived']},
+    'assess_quality': {'func': _case('process_data', 'assess_quality'), 'inputs': ['derived']},
+    'descriptive_stats': {'func': _case('process_data', 'descriptive_stats'), 'inputs': ['derived', 'cube']},
+    'group_kpis': {'func': _kpi_case, 'inputs': ['derived']},
+    'outliers': {'func': _outlier_case, 'inputs': ['derived']},
+    'significance': {'func': _significance_case, 'inputs': ['derived']},
+    'bootstrap': {'func': _bootstrap_case, 'inputs': ['derived']},
+    'parallel_agg': {'func': _parallel_case, 'inputs': ['derived']},
+    'query_server': {'func': _query_case, 'inputs': ['derived']},
+    'flight_store': {'func': _store_case, 'inputs': ['store']},
+    'plot_delay_distribution': {'func': _case('process_data', 'plot_delay_distribution'), 'inputs': ['derived']},
+    'build_sketches': {'func': _case('quantile_sketch', 'build_sketches'), 'inputs': ['derived']},
+    'chart_3_1': {'func': _trend_case, 'inputs': ['cube', 'sketches']},
+    'chart_3_2': {'func': _case('chart_3_2_weekday_vs_weekend', 'calculate_contradictory_stats'),
+                  'inputs': ['cube']},
+    'chart_3_3': {'func': _case('chart_3_3_airline_normal_rate', 'calculate_airline_stats'), 'inputs': ['cube']},
+    'template_batch': {'func': _template_batch_case, 'inputs': ['cube']},
+    'chart_3_4': {'func': _case('chart_3_4_boxplot_base_vs_external', 'base_vs_external_stats'),
+                  'inputs': ['derived'], 'copy': True},
+    'chart_3_5': {'func': _case('chart_3_5_aircraft_type_boxplot', 'aircraft_group_stats'),
+                  'inputs': ['sketches']},
+    'chart_3_6': {'func': _case('chart_3_6_aircraft_scatter', 'prepare_scatter_data'),
+                  'inputs': ['derived'], 'copy': True},
+    'chart_3_7': {'func': _case('chart_3_7_geo_distribution', 'destination_stats'),
+                  'inputs': ['cube', 'airport_coords']},
+}
+
+# 输入间的派生关系：保留某输入时，其上游也需保留到不再被引用为止
+_INPUT_DEPS = {'raw_file': ['raw'], 'cleaned': ['raw'], 'derived': ['cleaned'], 'cube': ['derived'],
+               'sketches': ['derived'], 'store': ['derived']}
+
+
+def _required_inputs(case_names):
+    required = set()
+    stack = [name for case in case_names for name in CASES[case]['inputs']]
+    while stack:
+        name = stack.pop()
+        if name not in required:
+            required.add(name)
+            stack.extend(_INPUT_DEPS.get(name, []))
+    return required
+
+
+def time_case(case, inputs, repeats):
+    """对单个用例计时 repeats 次，返回每次耗时（秒）"""
+    spec = CASES[case]
+    times = []
+    for _ in range(repeats):
+        args = [inputs.get(name) for name in spec['inputs']]
+        if spec.get('copy'):
+            args[0] = args[0].copy()
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            spec['func'](*args)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+# ==========================================
+# 运行与结果
+# ==========================================
+def _git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment_info():
+    """运行环境（对比结果时据此提示版本差异）"""
+    versions = {}
+    for module in ('pandas', 'numpy', 'pyarrow', 'scipy', 'matplotlib', 'pyecharts'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': _git_commit(),
+        **versions,
+    }
+
+
+def run_benchmarks(sizes=SIZES, cases=None, repeats=None, data_path=DATA_PATH, source='tile'):
+    """
+    按规模逐个运行用例，返回结果字典（可直接写出为JSON）
+    source: 'tile'（真实数据平移复制）或 'synthetic'（合成数据）
+    """
+    cases = [c for c in CASES if cases is None or c in cases]
+    base_raw = pd.read_excel(data_path)
+    print(f"📂 基准数据: {data_path}（{len(base_raw):,}行）")
+    print(f"🧪 用例: {', '.join(cases)}")
+
+    report = {'created': datetime.now().isoformat(timespec='seconds'), 'environment': environment_info(),
+              'sizes': list(sizes), 'source': source, 'results': {case: {} for case in cases}}
+
+    from airports import get_registry
+    get_registry()  # 机场坐标文件为相对路径，切换到临时目录前先加载（进程内缓存）
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='khn_bench_') as workdir:
+        os.chdir(workdir)  # 图2-1等产物写入临时目录
+        try:
+            for n_rows in sizes:
+                n_repeat = repeats or _default_repeats(n_rows)
+                print(f"\n📏 规模: {n_rows:,}行（每个用例{n_repeat}次）")
+                inputs = BenchInputs(base_raw, n_rows, source)
+                for i, case in enumerate(cases):
+                    try:
+                        times = time_case(case, inputs, n_repeat)
+                    except Exception as e:  # 千万行时可能内存不足，记录后继续其余用例
+                        report['results'][case][str(n_rows)] = {'rows': n_rows, 'error': f'{type(e).__name__}: {e}'}
+                        print(f"  ✗ {case:<24} {type(e).__name__}: {e}")
+                    else:
+                        median = float(np.median(times))
+                        report['results'][case][str(n_rows)] = {
+                            'rows': n_rows,
+                            'repeats': len(times),
+                            'times': [round(t, 6) for t in times],
+                            'min': round(min(times), 6),
+                            'median': round(median, 6),
+                            'mean': round(float(np.mean(times)), 6),
+                            'rows_per_sec': round(n_rows / median, 1) if median > 0 else None,
+                        }
+                        print(f"  ✓ {case:<24} 中位{median:>9.4f}s  {n_rows / median:>14,.0f}行/秒")
+                    inputs.release(_required_inputs(cases[i + 1:]))
+                del inputs
+                gc.collect()
+        finally:
+            os.chdir(cwd)
+    return report
+
+
+def save_report(report, path=None):
+    if path is None:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = RESULTS_DIR / f'bench_{stamp}.json'
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📁 基准结果: {path}")
+    return path
+
+
+def compare_reports(base_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """
+    对比两次基准结果（按中位耗时），打印对照表
+    返回回退列表 [(用例, 规模, 比值)]；比值 = 新耗时 / 基线耗时
+    """
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"📊 基线: {base_path}（{base['created']}）")
+    print(f"📊 对比: {new_path}（{new['created']}）")
+    for key, old_value in base['environment'].items():
+        new_value = new['environment'].get(key)
+        if old_value != new_value:
+            print(f"  ⚠ 环境差异 {key}: {old_value} → {new_value}")
+    if base.get('source') != new.get('source'):
+        print(f"  ⚠ 数据来源不同: {base.get('source')} → {new.get('source')}")
+
+    regressions = []
+    print(f"\n{'用例':<24}{'规模':>12}{'基线(s)':>12}{'对比(s)':>12}{'比值':>8}")
+    for case, by_size in base['results'].items():
+        for size, old in by_size.items():
+            cur = new['results'].get(case, {}).get(size)
+            if cur is None or 'median' not in old or 'median' not in cur:
+                continue
+            ratio = cur['median'] / old['median'] if old['median'] > 0 else float('inf')
+            if ratio > 1 + threshold:
+                flag = '  ⚠ 回退'
+                regressions.append((case, int(size), round(ratio, 3)))
+            elif ratio < 1 - threshold:
+                flag = '  ✓ 提升'
+            else:
+                flag = ''
+            print(f"{case:<24}{int(size):>12,}{old['median']:>12.4f}{cur['median']:>12.4f}{ratio:>8.2f}{flag}")
+
+    if regressions:
+        print(f"\n✗ {len(regressions)}项回退（慢于基线{threshold:.0%}以上）")
+    else:
+        print(f"\n✅ 无回退（阈值{threshold:.0%}）")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='第二章处理阶段与第三章图表数据准备的性能基准')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES), help='逗号分隔的行数规模')
+    parser.add_argument('--cases', default=None, help=f'逗号分隔的用例名（默认全部: {", ".join(CASES)}）')
+    parser.add_argument('--repeat', type=int, default=None, help='每个用例的计时次数（默认按规模自动确定）')
+    parser.add_argument('--output', default=None, help='结果JSON路径（默认output/benchmarks/bench_时间戳.json）')
+    parser.add_argument('--source', choices=['tile', 'synthetic'], default='tile',
+                        help='大样本来源：真实数据平移复制 / 合成数据')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='对比两次结果，有回退时退出码为1')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='回退判定阈值（比例）')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare_reports(*args.compare, threshold=args.threshold) else 0)
+
+    selected = args.cases.split(',') if args.cases else None
+    unknown = [c for c in selected or [] if c not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {unknown}")
+    output = Path(args.output).resolve() if args.output else None
+    report = run_benchmarks(sizes=[int(s) for s in args.sizes.split(',')], cases=selected, repeats=args.repeat,
+                            source=args.source)
+    save_report(report, output)
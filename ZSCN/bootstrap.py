@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+分组bootstrap置信区间（图3-3航司正常率等，小样本分组的估计波动）
+
+每个分组的延误分布先表示为“不同取值 × 权重”（即quantile_sketch的摘要表），
+B次重抽样一次生成：对该分布做多项分布抽样（numpy Generator.multinomial，得到B×K计数矩阵），
+各统计量由计数矩阵直接算出，不逐次抽取航班行：
+- normal_rate：取值≤normal_threshold的计数占比（%）
+- mean：计数加权均值
+- median：按累计计数定位中间名次（偶数样本取中间两值均值，同np.median）
+K为分组内不同取值数（延误分钟为整数，通常数百），与航班量无关。
+置信区间为百分位法；每个分组使用固定种子（seed与分组键CRC32组合），
+结果与进程数、分组顺序无关，可复现。分组在进程池中并行（workers=1为串行）。
+
+由航班明细计算时先构建不压缩的摘要（bootstrap_frame）；直接传入摘要分区合并结果时
+（图表无航班明细），分组不同取值数超过摘要压缩参数的部分以质心近似。
+"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from kpi import NORMAL_THRESHOLD, group_codes
+from quantile_sketch import build_sketch
+from tracing import traced
+
+METRICS = ('normal_rate', 'mean', 'median')
+N_RESAMPLES = 10_000
+CONFIDENCE = 0.95
+DEFAULT_SEED = 2025
+
+_BATCH_CELLS = 1 << 22  # 每批重抽样的计数矩阵元素数上限（控制内存）
+
+
+def _group_rng(seed, key):
+    """分组的固定随机数发生器：种子由seed与分组键CRC32组合，与分组顺序无关"""
+    return np.random.default_rng([seed, zlib.crc32(str(key).encode('utf-8'))])
+
+
+def _weighted_median(values, cumulative, n):
+    """按累计计数取中位数：cumulative为（…×K）累计计数，返回名次(n−1)//2与n//2两值的均值"""
+    low = values[np.sum(cumulative <= (n - 1) // 2, axis=-1)]
+    high = values[np.sum(cumulative <= n // 2, axis=-1)]
+    return (low + high) / 2
+
+
+def _estimates(values, weights, normal_threshold):
+    n = weights.sum()
+    return {
+        'normal_rate': weights[values <= normal_threshold].sum() / n * 100,
+        'mean': weights @ values / n,
+        'median': _weighted_median(values, np.cumsum(weights), n),
+    }
+
+
+def _resample(task):
+    """单个分组的重抽样：返回(分组键, {指标: 各分位点})"""
+    key, values, weights, metrics, n_resamples, levels, normal_threshold, seed = task
+    rng = _group_rng(seed, key)
+    n = int(weights.sum())
+    probabilities = weights / n
+    normal = values <= normal_threshold
+    samples = {metric: np.empty(n_resamples) for metric in metrics}
+    batch = max(1, _BATCH_CELLS // len(values))
+    for start in range(0, n_resamples, batch):
+        size = min(batch, n_resamples - start)
+        counts = rng.multinomial(n, probabilities, size=size)
+        part = slice(start, start + size)
+        if 'normal_rate' in samples:
+            samples['normal_rate'][part] = counts[:, normal].sum(axis=1) / n * 100
+        if 'mean' in samples:
+            samples['mean'][part] = counts @ values / n
+        if 'median' in samples:
+            samples['median'][part] = _weighted_median(values, np.cumsum(counts, axis=1), n)
+    return key, {metric: np.quantile(draws, levels) for metric, draws in samples.items()}
+
+
+@traced
+def bootstrap_ci(sketch, by, metrics=METRICS, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=DEFAULT_SEED,
+                 workers=None, groups=None, normal_threshold=NORMAL_THRESHOLD):
+    """
+    由摘要表（分组键 + mean + weight）计算各分组的bootstrap置信区间
+    metrics: normal_rate、mean、median 的子集
+    groups: 只计算这些分组（默认全部）
+    workers: 进程数，默认min(分组数, CPU核数)；1为串行
+    返回以分组键为索引的DataFrame：count，及每个指标的点估计、<指标>_low、<指标>_high
+    """
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError(f"bootstrap不支持的指标: {unknown}（可选 {list(METRICS)}）")
+    by = [by] if isinstance(by, str) else list(by)
+
+    codes, index = group_codes(sketch, by)
+    means, weights = sketch['mean'].to_numpy(), sketch['weight'].to_numpy()
+    valid = (codes >= 0) & (weights > 0)
+    order = np.lexsort((means[valid], codes[valid]))
+    codes, means, weights = codes[valid][order], means[valid][order], weights[valid][order]
+    bounds = np.searchsorted(codes, np.arange(len(index) + 1))
+
+    selected = np.flatnonzero(bounds[1:] > bounds[:-1])
+    if groups is not None:
+        selected = selected[index[selected].isin(groups)]
+    alpha = (1 - confidence) / 2
+    levels = [alpha, 1 - alpha]
+    tasks = [(index[g], means[bounds[g]:bounds[g + 1]], weights[bounds[g]:bounds[g + 1]], tuple(metrics),
+              n_resamples, levels, normal_threshold, seed) for g in selected]
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        results = dict(map(_resample, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(pool.map(_resample, tasks))
+
+    rows = []
+    for key, values, group_weights, *_ in tasks:
+        point = _estimates(values, group_weights, normal_threshold)
+        row = {'count': int(group_weights.sum())}
+        for metric in metrics:
+            row[metric] = point[metric]
+            row[f'{metric}_low'], row[f'{metric}_high'] = results[key][metric]
+        rows.append(row)
+    return pd.DataFrame(rows, index=index[selected])
+
+
+def bootstrap_frame(df, by, value='delayMin', **kwargs):
+    """由航班明细计算各分组的bootstrap置信区间（先构建不压缩的摘要，参数同bootstrap_ci）"""
+    return bootstrap_ci(build_sketch(df, by, value, compression=None), by, **kwargs)
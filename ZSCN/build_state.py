@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+增量构建状态记录（基于内容哈希的“make式”跳过）
+
+每个流水线阶段的指纹 = 输入文件内容哈希 + 参数（阈值等） + 代码版本 + 上游阶段指纹。
+指纹与上次构建记录一致且产物文件仍存在时，该阶段直接复用，不再重跑。
+本模块只依赖标准库：代码版本与参数通过ast静态读取源码获得，
+判断“是否需要重建”时无需导入pandas/pyecharts。
+"""
+
+import ast
+import hashlib
+import json
+from pathlib import Path
+
+STATE_PATH = Path('output/.build_state.json')
+STATE_VERSION = 1
+
+_PARSE_CACHE = {}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _parse(path):
+    """解析源码文件（同一文件只解析一次）"""
+    path = Path(path)
+    key = (str(path), path.stat().st_mtime_ns)
+    if key not in _PARSE_CACHE:
+        source = path.read_text(encoding='utf-8')
+        _PARSE_CACHE[key] = (source, ast.parse(source))
+    return _PARSE_CACHE[key]
+
+
+def function_code_hash(path, func_name):
+    """函数源码哈希（只要该函数本身未改动，同文件其他修改不影响）"""
+    source, tree = _parse(path)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == func_name:
+            return _sha256(ast.get_source_segment(source, node).encode('utf-8'))
+    raise KeyError(f"{path} 中未找到函数 {func_name}")
+
+
+def module_code_hash(path):
+    """模块源码哈希"""
+    return _sha256(Path(path).read_bytes())
+
+
+def module_dependencies(path):
+    """
+    模块依赖的本地模块文件（同目录下的.py，递归展开），由import语句静态读取，
+    含函数内的延迟导入；返回排序后的文件名列表（不含path本身）
+    """
+    root = Path(path).parent
+    seen, stack = set(), [Path(path).name]
+    while stack:
+        _, tree = _parse(root / stack.pop())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                file_name = name.split('.')[0] + '.py'
+                if file_name not in seen and (root / file_name).exists():
+                    seen.add(file_name)
+                    stack.append(file_name)
+    seen.discard(Path(path).name)
+    return sorted(seen)
+
+
+def module_constants(path, names):
+    """静态读取模块级常量（如阈值），不执行模块"""
+    _, tree = _parse(path)
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in names:
+                    values[target.id] = ast.literal_eval(node.value)
+    missing = set(names) - set(values)
+    if missing:
+        raise KeyError(f"{path} 中未找到常量 {sorted(missing)}")
+    return values
+
+
+def fingerprint(**parts):
+    """组合指纹：各部分按键排序后序列化再哈希"""
+    return _sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class BuildState:
+    """构建状态：阶段名 → {指纹, 产物列表}，另缓存输入文件哈希（按大小+修改时间）"""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = Path(path)
+        self.stages = {}
+        self.file_hashes = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STATE_VERSION:
+                self.stages = data.get('stages', {})
+                self.file_hashes = data.get('file_hashes', {})
+        except (OSError, ValueError):
+            pass
+
+    def file_hash(self, path):
+        """输入文件内容哈希；文件大小与修改时间未变时直接复用上次结果"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        stat = path.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cached = self.file_hashes.get(str(path))
+        if cached and cached['signature'] == signature:
+            return cached['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.file_hashes[str(path)] = {'signature': signature, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def is_fresh(self, stage, fp):
+        """指纹一致且所有产物仍存在"""
+        record = self.stages.get(stage)
+        if record is None or record['fingerprint'] != fp:
+            return False
+        return all(Path(p).exists() for p in record.get('outputs', []))
+
+    def record(self, stage, fp, outputs=()):
+        self.stages[stage] = {'fingerprint': fp, 'outputs': [str(p) for p in outputs]}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'stages': self.stages,
+                       'file_hashes': self.file_hashes}, f, indent=2, ensure_ascii=False)
@@ -4,38 +4,58 @@ from pyecharts.charts import Line
 from pyecharts import options as opts
 from pyecharts.globals import ThemeType
 import os
+import time
+from pathlib import Path
+
+from chart_templates import get_template
+from figure_payload import downsample_line, render_figure
+from flight_cube import get_cube, rollup
+from quantile_sketch import get_sketches, sketch_kpis
+from tracing import traced
 
 # 确保输出目录存在
 os.makedirs('output/figures', exist_ok=True)
 
+BATCH_DIR = Path('output/figures/图3-1_分组')  # plot_24h_trend_by 的变体输出目录
 
-def load_flight_data_for_trend():
-    """加载航班数据"""
-    try:
-        df = pd.read_excel('output/khn_flight_processed.xlsx')
-        print(f"✓ 加载数据成功: {len(df)}条记录")
-    except Exception as e:
-        print(f"⚠ 读取处理后数据失败: {e}，尝试读取原始数据...")
-        df = pd.read_excel('data/khn_flight.xlsx')
 
-    if 'delayMin' not in df.columns or '小时段' not in df.columns:
-        raise ValueError("数据缺少'delayMin'或'小时段'列！")
+@traced
+def hourly_trend_stats(cube):
+    """按小时统计：均值、航班量由立方体上卷"""
+    hourly_cube = rollup(cube, '小时段')
+    return pd.DataFrame({
+        '小时段': hourly_cube.index.to_numpy(),
+        'mean': hourly_cube['mean_delay'].round(1).to_numpy(),  # 直接保留1位小数
+        'count': hourly_cube['count'].to_numpy()
+    })
 
-    return df
 
+def trend_subtitle(cube, sketches):
+    """副标题：航班量、异常值数由立方体汇总；全天中位数非可加，由各小时段的分位数摘要合并得到"""
+    median = sketch_kpis(sketches['小时段'].assign(全部='全部'), '全部', ['median'])['median'].iloc[0]
+    return f"数据来源: {int(cube['count'].sum())}条航班 | 异常值{int(cube['n_anomaly'].sum())}条 | 中位数{median:g}分钟"
 
-def plot_24h_trend_standalone():
-    df = load_flight_data_for_trend()
 
-    # 按小时统计（数据层面保证精度）
-    hourly = df.groupby('小时段')['delayMin'].agg([
-        lambda x: round(x.mean(), 1),  # 直接保留1位小数
-        'median',
-        lambda x: int(x.count())
-    ]).reset_index()
-    hourly.columns = ['小时段', 'mean', 'median', 'count']
+def trend_figure_data(hourly, subtitle):
+    """图3-1一个变体的数据：小时段、均值、航班量（点数超过上限时LTTB降采样）、峰值标注与副标题"""
     peak_hour = hourly.loc[hourly['mean'].idxmax()]
-
+    # 载荷控制：点数超过上限时按LTTB降采样（按小时段为24个点，原样保留）
+    hourly = hourly.iloc[downsample_line(hourly['mean'].to_numpy())]
+    return {
+        'hours': hourly['小时段'].astype(str).tolist(),
+        'mean': hourly['mean'].tolist(),
+        'count': hourly['count'].tolist(),
+        'peak': {
+            'name': f"峰值{peak_hour['小时段']}时",
+            'coord': [str(peak_hour['小时段']), peak_hour['mean']],
+            'value': f"{peak_hour['mean']}分钟"
+        },
+        'subtitle': subtitle,
+    }
+
+
+def build_trend_chart(data):
+    """由变体数据构建图3-1（数据只出现在TREND_SLOTS列出的位置）"""
     # 创建图表
     line = Line(init_opts=opts.InitOpts(
         width='1000px', height='600px',
@@ -44,23 +64,19 @@ def plot_24h_trend_standalone():
     ))
 
     # X轴
-    line.add_xaxis(hourly['小时段'].astype(str).tolist())
+    line.add_xaxis(data['hours'])
 
     # 平均延误线（恢复动态计算）
     line.add_yaxis(
         series_name='平均延误(分钟)',
-        y_axis=hourly['mean'].tolist(),
+        y_axis=data['mean'],
         is_smooth=True,
         symbol='circle',
         symbol_size=8,
         label_opts=opts.LabelOpts(is_show=False),
         linestyle_opts=opts.LineStyleOpts(width=3, color='#e74c3c'),
         markpoint_opts=opts.MarkPointOpts(
-            data=[opts.MarkPointItem(
-                name=f"峰值{peak_hour['小时段']}时",
-                coord=[str(peak_hour['小时段']), peak_hour['mean']],
-                value=f"{peak_hour['mean']}分钟"
-            )]
+            data=[opts.MarkPointItem(**data['peak'])]
         ),
         # 关键：恢复type_="average"实现动态更新，用{c}显示（数据已处理为1位小数）
         markline_opts=opts.MarkLineOpts(
@@ -84,7 +100,7 @@ def plot_24h_trend_standalone():
 
     line.add_yaxis(
         series_name='航班量(架次)',
-        y_axis=hourly['count'].tolist(),
+        y_axis=data['count'],
         yaxis_index=1,
         is_smooth=True,
         symbol='diamond',
@@ -97,7 +113,7 @@ def plot_24h_trend_standalone():
     line.set_global_opts(
         title_opts=opts.TitleOpts(
             title='',  # 图3-1 昌北机场24小时平均延误趋势
-            subtitle=f'数据来源: 8630条航班 | 异常值191条 | 中位数11分钟',
+            subtitle=data['subtitle'],
             title_textstyle_opts=opts.TextStyleOpts(font_size=18, font_family='SimHei'),
             subtitle_textstyle_opts=opts.TextStyleOpts(font_size=11, font_family='SimHei'),
             pos_left='center'
@@ -125,15 +141,70 @@ def plot_24h_trend_standalone():
         datazoom_opts=[opts.DataZoomOpts(range_start=0, range_end=100)]  # 拖动生效
     )
 
+    return line
+
+
+# 模板槽：折线数据为[小时段, 取值]数据对（同Line.add_yaxis）
+TREND_SLOTS = {
+    'hours': (('xAxis', 0, 'data'), lambda d: d['hours']),
+    'mean': (('series', 0, 'data'), lambda d: [list(p) for p in zip(d['hours'], d['mean'])]),
+    'peak': (('series', 0, 'markPoint', 'data', 0), lambda d: d['peak']),
+    'count': (('series', 1, 'data'), lambda d: [list(p) for p in zip(d['hours'], d['count'])]),
+    'subtitle': (('title', 0, 'subtext'), lambda d: d['subtitle']),
+}
+
+
+@traced('图3-1')
+def plot_24h_trend_standalone(df=None, airports=None, start=None, end=None, cube=None, sketches=None):
+    """
+    图3-1：24小时平均延误趋势
+    df: 已加载的处理后数据（流水线传入）；为None时只读取立方体与分位数摘要，不加载航班明细
+    cube: 预聚合立方体（流水线传入），均值、航班量与异常值数由其上卷
+    sketches: 分位数摘要，副标题中的中位数由其合并得到
+    """
+    cube = get_cube(df, cube, airports, start, end)
+    sketches = get_sketches(df, sketches, airports, start, end, groupings=['小时段'])
+    line = build_trend_chart(trend_figure_data(hourly_trend_stats(cube), trend_subtitle(cube, sketches)))
+
     # 保存图表
     output_path = 'output/figures/图3-1_24小时延误趋势.html'
-    line.render(output_path)
+    render_figure(line, output_path)
 
     print(f"\n✅ 图3-1生成完成！")
     print(f"  - 文件路径: {os.path.abspath(output_path)}")
     return line
 
 
+@traced('图3-1分组')
+def plot_24h_trend_by(by='月份', df=None, airports=None, start=None, end=None, cube=None,
+                      output_dir=BATCH_DIR):
+    """
+    按立方体维度（月份、起飞机场三字码、所属航司代码等）批量生成图3-1变体，每组一个HTML
+    图表配置只编译一次（chart_templates），各变体只注入数据与副标题
+    返回写出的路径列表
+    """
+    cube = get_cube(df, cube, airports, start, end)
+    grouped = rollup(cube, [by, '小时段'])
+    paths, render_s = [], 0.0
+    for value, part in grouped.groupby(level=0, sort=True, observed=True):
+        part = part.droplevel(0)
+        hourly = pd.DataFrame({
+            '小时段': part.index.to_numpy(),
+            'mean': part['mean_delay'].round(1).to_numpy(),
+            'count': part['count'].to_numpy()
+        })
+        total = int(part['count'].sum())
+        data = trend_figure_data(hourly, f'{by}: {value} | 航班量: {total}条 | '
+                                         f'平均延误: {part["delay_sum"].sum() / total:.1f}分钟')
+        template = get_template('图3-1', build_trend_chart, TREND_SLOTS, data)
+        began = time.perf_counter()
+        paths.append(template.render(data, Path(output_dir) / f'图3-1_24小时延误趋势_{value}.html'))
+        render_s += time.perf_counter() - began
+
+    print(f"✅ 图3-1分组变体（{by}）: {len(paths)}个，渲染{render_s * 1000 / max(len(paths), 1):.2f}ms/个")
+    print(f"  - 目录: {os.path.abspath(output_dir)}")
+    return paths
+
 if __name__ == '__main__':
     print("=" * 60)
     print("开始生成图3-1: 24小时平均延误趋势")
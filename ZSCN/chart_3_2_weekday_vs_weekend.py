@@ -3,15 +3,25 @@ import pandas as pd
 from pyecharts.charts import Bar
 from pyecharts import options as opts
 from pyecharts.globals import ThemeType
-from scipy import stats
+import numpy as np
 import os
 
+from figure_payload import render_figure
+from flight_cube import get_cube, rollup
+from flight_store import FlightStore
+from significance import chi2_2x2, ttest_from_stats
+from tracing import traced
+
 os.makedirs('output/figures', exist_ok=True)
 
 
-def load_flight_data():
-    """加载并预处理航班数据"""
-    df = pd.read_excel('output/khn_flight_processed.xlsx')
+@traced
+def load_flight_data(airports=None, start=None, end=None):
+    """
+    加载并预处理航班数据
+    airports/start/end: 机场与月份范围，如 'KHN', '2025-06', '2025-08'（按分区裁剪读取）
+    """
+    df = FlightStore().scan(airports, start, end).load()
     required_fields = ['delayMin', 'isDelay', '星期', '航班号']
     missing = [f for f in required_fields if f not in df.columns]
     if missing:
@@ -19,30 +29,24 @@ def load_flight_data():
     return df
 
 
-def calculate_contradictory_stats(df):
-    """计算工作日/周末统计量"""
-    # 星期映射
-    weekday_map = {
-        'Monday': '周一', 'Tuesday': '周二', 'Wednesday': '周三',
-        'Thursday': '周四', 'Friday': '周五', 'Saturday': '周六', 'Sunday': '周日'
-    }
-    df['星期'] = df['星期'].map(weekday_map).fillna(df['星期'])
-    df['日期类型'] = df['星期'].isin(['周六', '周日']).map({True: '周末', False: '工作日'})
+@traced
+def calculate_contradictory_stats(cube):
+    """计算工作日/周末统计量（由预聚合立方体上卷，检验只需计数、均值与方差）"""
+    day_type = np.where(cube['星期'].isin(['Saturday', 'Sunday', '周六', '周日']), '周末', '工作日')
+    by_type = rollup(cube.assign(日期类型=day_type), '日期类型')
 
     # 核心统计
-    stats_df = df.groupby('日期类型').agg(
-        延误率=('isDelay', lambda x: x.mean() * 100),
-        平均延误=('delayMin', 'mean'),
-        航班量=('航班号', 'count')
-    ).round(2)
-
-    # 统计检验
-    contingency = pd.crosstab(df['日期类型'], df['isDelay'])
-    chi2, p_chi2, _, _ = stats.chi2_contingency(contingency)
-
-    workday_delays = df[df['日期类型'] == '工作日']['delayMin']
-    weekend_delays = df[df['日期类型'] == '周末']['delayMin']
-    _, p_ttest = stats.ttest_ind(workday_delays, weekend_delays)
+    stats_df = pd.DataFrame({
+        '延误率': by_type['delay_rate'],
+        '平均延误': by_type['mean_delay'],
+        '航班量': by_type['count']
+    }).round(2)
+
+    # 统计检验：卡方（延误/未延误计数）与t检验（均值、样本标准差、样本量），见significance
+    workday, weekend = by_type.loc['工作日'], by_type.loc['周末']
+    _, p_chi2, _ = chi2_2x2(workday['n_delayed'], workday['count'], weekend['n_delayed'], weekend['count'])
+    _, p_ttest, _ = ttest_from_stats(workday['count'], workday['mean_delay'], workday['std_delay'],
+                                     weekend['count'], weekend['mean_delay'], weekend['std_delay'])
 
     reduction_pct = (1 - stats_df.loc['周末', '航班量'] / stats_df.loc['工作日', '航班量']) * 100
     delay_rate_diff = stats_df.loc['工作日', '延误率'] - stats_df.loc['周末', '延误率']
@@ -50,13 +54,16 @@ def calculate_contradictory_stats(df):
     return stats_df, round(p_chi2, 3), round(p_ttest, 3), round(reduction_pct, 1), round(delay_rate_diff, 2)
 
 
-def chart_3_2_weekday_vs_weekend():
+@traced('图3-2')
+def chart_3_2_weekday_vs_weekend(df=None, airports=None, start=None, end=None, cube=None):
     """
     图3-2：工作日与周末延误差异（布局最终修复版）
     修复：标题居中、副标题左对齐、图例大幅下移
+    df: 已加载的处理后数据（流水线传入）
+    cube: 预聚合立方体（流水线传入）；df与cube均为None时按机场/月份加载立方体
     """
-    df = load_flight_data()
-    stats_df, p_chi2, p_ttest, reduction_pct, delay_rate_diff = calculate_contradictory_stats(df)
+    cube = get_cube(df, cube, airports, start, end)
+    stats_df, p_chi2, p_ttest, reduction_pct, delay_rate_diff = calculate_contradictory_stats(cube)
 
     print("\n图3-2 数据核查结果:")
     print(stats_df)
@@ -152,7 +159,7 @@ def chart_3_2_weekday_vs_weekend():
 
     # 渲染保存
     output_path = 'output/figures/图3-2_工作日周末差异.html'
-    bar.render(output_path)
+    render_figure(bar, output_path)
 
     print(f"\n✅ 图3-2 生成成功!")
     print(f"  - 文件: {os.path.abspath(output_path)}")
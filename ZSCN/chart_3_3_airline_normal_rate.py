@@ -1,16 +1,34 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
-from pyecharts.charts import Bar
+from pyecharts.charts import Bar, Custom
 from pyecharts import options as opts
 from pyecharts.commons.utils import JsCode  # 确保颜色和交互生效
 from pyecharts.globals import ThemeType
 import os
+import time
+from pathlib import Path
+
+from bootstrap import CONFIDENCE, N_RESAMPLES, bootstrap_frame
+from figure_payload import render_figure
+from flight_cube import get_cube, rollup
+from chart_templates import get_template
+from flight_store import FlightStore
+from tracing import traced
 
 os.makedirs('output/figures', exist_ok=True)
 
+MIN_FLIGHTS = 100  # 参与排名的最小航班量（架次）
+HIGHLIGHT_AIRLINE = 'CJX'  # 红色高亮的航司（江西航空）
+BATCH_DIR = Path('output/figures/图3-3_分组')  # chart_3_3_by 的变体输出目录
+
 
-def load_flight_data():
-    df = pd.read_excel('output/khn_flight_processed.xlsx')
+@traced
+def load_flight_data(airports=None, start=None, end=None):
+    """
+    加载航班数据
+    airports/start/end: 机场与月份范围，如 'KHN', '2025-06', '2025-08'（按分区裁剪读取）
+    """
+    df = FlightStore().scan(airports, start, end).load()
     required_fields = ['delayMin', '延误等级', '所属航司代码', '航班号']
     missing = [f for f in required_fields if f not in df.columns]
     if missing:
@@ -18,46 +36,89 @@ def load_flight_data():
     return df
 
 
-def calculate_airline_stats(df):
-    """计算航司正常率统计（航班量≥100架次）"""
-    airline_stats = df.groupby('所属航司代码').agg(
-        航班量=('航班号', 'count'),
-        正常航班=('延误等级', lambda x: x.isin(['准点', '轻微', '中度']).sum()),
-        平均延误=('delayMin', 'mean')
-    )
+@traced
+def calculate_airline_stats(cube):
+    """计算航司正常率统计（航班量≥MIN_FLIGHTS架次，由预聚合立方体上卷）"""
+    airline = rollup(cube, '所属航司代码')
+    airline_stats = pd.DataFrame({
+        '航班量': airline['count'],
+        '正常航班': airline['n_normal'],  # 延误等级为准点/轻微/中度
+        '平均延误': airline['mean_delay']
+    })
 
-    airline_stats['正常率'] = (airline_stats['正常航班'] / airline_stats['航班量'] * 100).round(2)
-    significant_airlines = airline_stats[airline_stats['航班量'] >= 100]
+    airline_stats['正常率'] = airline['normal_rate'].round(2)
+    significant_airlines = airline_stats[airline_stats['航班量'] >= MIN_FLIGHTS]
     # 按正常率升序排列，保证柱状图从左到右递增
     top10 = significant_airlines.sort_values('正常率', ascending=True).tail(10)
-    sample_normal_rate = airline_stats['正常航班'].sum() / airline_stats['航班量'].sum() * 100
+    sample_normal_rate = rollup(cube)['normal_rate'].iloc[0]
 
     return top10, round(sample_normal_rate, 2)
 
 
-def chart_3_3_airline_normal_rate():
+@traced
+def airline_confidence_intervals(df, airlines):
     """
-    图3-3：航司正常率Top10（修复标注位置和颜色高亮问题）
+    各航司正常率、平均延误、中位延误的bootstrap置信区间
+    由航班行构建各航司不压缩的延误分布（delayMin为整数分钟，即各取值的精确计数）再重抽样，
+    不使用摘要分区（压缩后取值数超过COMPRESSION的航司只能以质心近似）
     """
-    df = load_flight_data()
-    top10, sample_normal_rate = calculate_airline_stats(df)
+    return bootstrap_frame(df, '所属航司代码', groups=airlines).reindex(airlines)
 
-    # 保留所有控制台输出内容
-    print("\n图3-3 航司正常率Top10核查结果:")
-    print(top10)
-    print(f"\n样本总体正常率: {sample_normal_rate}%")
 
-    # 检查CJX并保留排名计算
+# 误差线：每个数据项为[类目序号, 下限, 上限]，竖线加上下短横
+ERROR_BAR_RENDER = JsCode("""
+    function(params, api) {
+        var x = api.value(0);
+        var low = api.coord([x, api.value(1)]);
+        var high = api.coord([x, api.value(2)]);
+        var half = api.size([1, 0])[0] * 0.12;
+        var style = {stroke: '#2c3e50', lineWidth: 1.5};
+        return {type: 'group', children: [
+            {type: 'line', shape: {x1: low[0], y1: low[1], x2: high[0], y2: high[1]}, style: style},
+            {type: 'line', shape: {x1: low[0] - half, y1: low[1], x2: low[0] + half, y2: low[1]}, style: style},
+            {type: 'line', shape: {x1: high[0] - half, y1: high[1], x2: high[0] + half, y2: high[1]}, style: style}
+        ]};
+    }
+""")
+
+# 柱体颜色：按类目名（航司代码）高亮，与排名位置无关
+HIGHLIGHT_STYLE = opts.ItemStyleOpts(color=JsCode(f"""
+    function(params) {{
+        return params.name === '{HIGHLIGHT_AIRLINE}' ? '#e74c3c' : '#3498db';
+    }}
+"""))
+
+# tooltip：正常率数据项的detail字段（airline_figure_data预先生成）
+TOOLTIP_FORMATTER = JsCode("function(params) { return params[0].data.detail; }")
+
+
+def airline_figure_data(top10, ci, sample_normal_rate, subtitle):
+    """
+    图3-3一个变体的数据：航司、正常率（数据项附带tooltip文本）、样本正常率参考线、误差线与副标题
+    tooltip文本含正常率、航班量、平均/中位延误及各自的置信区间
+    """
     airlines = top10.index.tolist()
-    cjx_in_top10 = 'CJX' in airlines
-    cjx_rank = None
-    cjx_data = None
-    cjx_index = airlines.index('CJX') if cjx_in_top10 else -1  # 新增索引变量，用于颜色定位
-    if cjx_in_top10:
-        cjx_rank = len(top10) - list(top10.index).index('CJX')
-        cjx_data = top10.loc['CJX']
-        print(f"  - 江西航空(CJX)正常率: {cjx_data['正常率']}%（第{cjx_rank}位）")
+    level = f'{CONFIDENCE:.0%}CI'
+    rates = [{
+        'value': top10.loc[code, '正常率'],
+        'detail': (f"{code}<br/>正常率: {top10.loc[code, '正常率']}%（{level} {ci.loc[code, 'normal_rate_low']:.2f}"
+                   f"~{ci.loc[code, 'normal_rate_high']:.2f}%）<br/>航班量: {int(top10.loc[code, '航班量'])}条"
+                   f"<br/>平均延误: {top10.loc[code, '平均延误']:.1f}分钟（{level} {ci.loc[code, 'mean_low']:.1f}"
+                   f"~{ci.loc[code, 'mean_high']:.1f}）<br/>中位延误: {ci.loc[code, 'median']:.1f}分钟"
+                   f"（{level} {ci.loc[code, 'median_low']:.1f}~{ci.loc[code, 'median_high']:.1f}）"),
+    } for code in airlines]
+    return {
+        'airlines': airlines,
+        'rates': rates,
+        'reference': {'name': f"样本正常率 {sample_normal_rate}%", 'yAxis': sample_normal_rate},
+        'error_bars': [[i, round(ci.loc[code, 'normal_rate_low'], 2), round(ci.loc[code, 'normal_rate_high'], 2)]
+                       for i, code in enumerate(airlines)],
+        'subtitle': subtitle,
+    }
+
 
+def build_airline_chart(data):
+    """由变体数据构建图3-3（数据只出现在AIRLINE_SLOTS列出的位置）"""
     # 创建图表
     bar = Bar(init_opts=opts.InitOpts(
         width='900px',
@@ -68,15 +129,12 @@ def chart_3_3_airline_normal_rate():
     ))
 
     # X轴（航司代码）
-    bar.add_xaxis(airlines)
-
-    # 正常率数据
-    normal_rates = top10['正常率'].tolist()
+    bar.add_xaxis(data['airlines'])
 
     # 核心修复：颜色和交互适配最新版，保留原有样式
     bar.add_yaxis(
         series_name='正常率(%)',
-        y_axis=normal_rates,
+        y_axis=data['rates'],
         label_opts=opts.LabelOpts(
             formatter="{c}%",
             font_size=11,
@@ -85,39 +143,36 @@ def chart_3_3_airline_normal_rate():
             position='top',
             offset=[0, -10]  # 保留偏移设置
         ),
-        # 修复颜色：用JsCode强制定位CJX（最新版必用）
-        itemstyle_opts=opts.ItemStyleOpts(
-            color=JsCode(f"""
-                function(params) {{
-                    return params.dataIndex === {cjx_index} ? '#e74c3c' : '#3498db';
-                }}
-            """)
-        ),
-        # 修复tooltip：适配最新版params结构
-        tooltip_opts=opts.TooltipOpts(
-            trigger='axis',
-            axis_pointer_type='cross',
-            textstyle_opts=opts.TextStyleOpts(font_family='SimHei'),
-            formatter=lambda p: f"{p[0].name}<br/>正常率: {p[0].value}%<br/>航班量: {int(top10.loc[p[0].name, '航班量'])}条<br/>平均延误: {top10.loc[p[0].name, '平均延误']:.1f}分钟"
-        ),
+        # 修复颜色：用JsCode按航司代码高亮CJX（不依赖排名位置，模板渲染时函数不变）
+        itemstyle_opts=HIGHLIGHT_STYLE,
         # 修复MarkLine：参数符合最新版规范
         markline_opts=opts.MarkLineOpts(
-            data=[opts.MarkLineItem(y=sample_normal_rate, name=f"样本正常率 {sample_normal_rate}%")],
+            data=[opts.MarkLineItem(y=data['reference']['yAxis'], name=data['reference']['name'])],
             linestyle_opts=opts.LineStyleOpts(color='#95a5a6', type_='dashed', width=2),
             label_opts=opts.LabelOpts(color='#7f8c8d', font_family='SimHei', font_size=11, position='end')
         )
     )
 
+    # 误差线：正常率置信区间
+    error_bars = Custom()
+    error_bars.add(
+        series_name=f'正常率{CONFIDENCE:.0%}置信区间',
+        render_item=ERROR_BAR_RENDER,
+        data=data['error_bars'],
+        z=3,
+    )
+    bar.overlap(error_bars)
+
     # 全局配置保留原有样式
     bar.set_global_opts(
         title_opts=opts.TitleOpts(
-            title='   航司正常率Top10（航班量≥100架次）',  # 图3-3
-            subtitle=f'判定标准: 延误≤60分钟 | 样本正常率: {sample_normal_rate}% | 江西航空(CJX)红色高亮',
+            title=f'   航司正常率Top10（航班量≥{MIN_FLIGHTS}架次）',  # 图3-3
+            subtitle=data['subtitle'],
             title_textstyle_opts=opts.TextStyleOpts(font_family='SimHei', font_size=16, font_weight='bold'),
             subtitle_textstyle_opts=opts.TextStyleOpts(font_family='SimHei', font_size=11),
             pos_left='center'
         ),
-        tooltip_opts=opts.TooltipOpts(trigger='axis', axis_pointer_type='cross',
+        tooltip_opts=opts.TooltipOpts(trigger='axis', axis_pointer_type='cross', formatter=TOOLTIP_FORMATTER,
                                       textstyle_opts=opts.TextStyleOpts(font_family='SimHei')),
         legend_opts=opts.LegendOpts(is_show=False),
         xaxis_opts=opts.AxisOpts(name='航司代码', name_textstyle_opts=opts.TextStyleOpts(font_family='SimHei'),
@@ -127,9 +182,63 @@ def chart_3_3_airline_normal_rate():
                                  axislabel_opts=opts.LabelOpts(font_family='SimHei', font_size=11))
     )
 
+    return bar
+
+
+AIRLINE_SLOTS = {
+    'airlines': (('xAxis', 0, 'data'), lambda d: d['airlines']),
+    'rates': (('series', 0, 'data'), lambda d: d['rates']),
+    'reference': (('series', 0, 'markLine', 'data', 0), lambda d: d['reference']),
+    'error_bars': (('series', 1, 'data'), lambda d: d['error_bars']),
+    'subtitle': (('title', 0, 'subtext'), lambda d: d['subtitle']),
+}
+
+
+@traced('图3-3')
+def chart_3_3_airline_normal_rate(df=None, airports=None, start=None, end=None, cube=None):
+    """
+    图3-3：航司正常率Top10（修复标注位置和颜色高亮问题）
+    df: 已加载的处理后数据（流水线传入）；为None时置信区间只读取航司与delayMin两列
+    cube: 预聚合立方体（流水线传入）；df与cube均为None时按机场/月份加载立方体
+    """
+    cube = get_cube(df, cube, airports, start, end)
+    top10, sample_normal_rate = calculate_airline_stats(cube)
+    if df is None:
+        df = FlightStore().scan(airports, start, end).select('所属航司代码', 'delayMin').load()
+    ci = airline_confidence_intervals(df, top10.index.tolist())
+
+    # 保留所有控制台输出内容
+    print("\n图3-3 航司正常率Top10核查结果:")
+    print(top10)
+    print(f"\n样本总体正常率: {sample_normal_rate}%")
+    print(f"\n{CONFIDENCE:.0%}置信区间（bootstrap {N_RESAMPLES}次，百分位法）:")
+    print(pd.DataFrame({
+        '正常率': ci['normal_rate'].map('{:.2f}'.format) + ' [' + ci['normal_rate_low'].map('{:.2f}'.format) +
+              ', ' + ci['normal_rate_high'].map('{:.2f}'.format) + ']',
+        '平均延误': ci['mean'].map('{:.1f}'.format) + ' [' + ci['mean_low'].map('{:.1f}'.format) +
+                ', ' + ci['mean_high'].map('{:.1f}'.format) + ']',
+        '中位延误': ci['median'].map('{:.1f}'.format) + ' [' + ci['median_low'].map('{:.1f}'.format) +
+                ', ' + ci['median_high'].map('{:.1f}'.format) + ']',
+    }))
+
+    # 检查CJX并保留排名计算
+    airlines = top10.index.tolist()
+    cjx_in_top10 = 'CJX' in airlines
+    cjx_rank = None
+    cjx_data = None
+    if cjx_in_top10:
+        cjx_rank = len(top10) - list(top10.index).index('CJX')
+        cjx_data = top10.loc['CJX']
+        print(f"  - 江西航空(CJX)正常率: {cjx_data['正常率']}%（第{cjx_rank}位）")
+
+    bar = build_airline_chart(airline_figure_data(
+        top10, ci, sample_normal_rate,
+        f'判定标准: 延误≤60分钟 | 样本正常率: {sample_normal_rate}% | 江西航空(CJX)红色高亮 | '
+        f'误差线: {CONFIDENCE:.0%}置信区间（bootstrap）'))
+
     # 渲染保存
     output_path = 'output/figures/图3-3_航司正常率Top10.html'
-    bar.render(output_path)
+    render_figure(bar, output_path)
 
     # 保留所有输出结果
     print(f"\n✅ 图3-3 生成成功!")
@@ -143,6 +252,36 @@ def chart_3_3_airline_normal_rate():
     return bar
 
 
+@traced('图3-3分组')
+def chart_3_3_by(by='月份', df=None, airports=None, start=None, end=None, output_dir=BATCH_DIR):
+    """
+    按月份或机场（起飞机场三字码、到达机场三字码）批量生成图3-3变体，每组一个HTML
+    排名由立方体上卷，置信区间由该组航班重抽样；图表配置只编译一次（chart_templates），各变体只注入数据
+    返回写出的路径列表
+    """
+    df = load_flight_data(airports, start, end) if df is None else df
+    cube = get_cube(df)
+    cube_keys = cube[by].astype(str)
+    row_keys = df['计划起飞时间'].dt.strftime('%Y-%m') if by == '月份' else df[by].astype(str)
+    paths, render_s = [], 0.0
+    for value in sorted(cube_keys.unique()):
+        top10, sample_normal_rate = calculate_airline_stats(cube[cube_keys == value])
+        if top10.empty:
+            continue
+        ci = airline_confidence_intervals(df[row_keys == value], top10.index.tolist())
+        data = airline_figure_data(top10, ci, sample_normal_rate,
+                                   f'{by}: {value} | 判定标准: 延误≤60分钟 | 样本正常率: {sample_normal_rate}% | '
+                                   f'误差线: {CONFIDENCE:.0%}置信区间（bootstrap）')
+        template = get_template('图3-3', build_airline_chart, AIRLINE_SLOTS, data)
+        began = time.perf_counter()
+        paths.append(template.render(data, Path(output_dir) / f'图3-3_航司正常率Top10_{value}.html'))
+        render_s += time.perf_counter() - began
+
+    print(f"✅ 图3-3分组变体（{by}）: {len(paths)}个，渲染{render_s * 1000 / max(len(paths), 1):.2f}ms/个")
+    print(f"  - 目录: {os.path.abspath(output_dir)}")
+    return paths
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("正在生成图3-3: 航司正常率Top10（修复版）...")
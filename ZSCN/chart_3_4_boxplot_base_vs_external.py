@@ -6,31 +6,50 @@ import pandas as pd
 import numpy as np
 from pyecharts.charts import Boxplot
 from pyecharts import options as opts
-from scipy import stats
 
+from figure_payload import render_figure
+from quantile_sketch import get_sketches, sketch_kpis
+from significance import compare_groups
+from tracing import traced
 
-def plot_base_vs_external_boxplot(df):
+
+@traced
+def base_vs_external_stats(df, sketches=None):
     """
-    生成主基地航司(CJX)与外航延误分布对比箱型图
-    优化：图例位置移至底部
+    主基地航司(CJX)与外航的分组、统计检验与箱型图五数
+    五数由按航司的分位数摘要合并为主基地/外航两组得到；检验仍需原始样本
+    返回 (主基地样本, 外航样本, 主基地五数, 外航五数, Mann-Whitney U检验p值)
     """
     # 1. 数据分类
-    df['航司类型'] = df['所属航司代码'].map({'CJX': '主基地航司'}).fillna('外航')
+    df['航司类型'] = np.where(df['所属航司代码'] == 'CJX', '主基地航司', '外航')
 
-    # 提取并过滤数据
+    # 提取数据
     cjx_data = df[df['航司类型'] == '主基地航司']['delayMin']
     external_data = df[df['航司类型'] == '外航']['delayMin']
-    cjx_filtered = cjx_data[(cjx_data >= -30) & (cjx_data <= 200)]
-    external_filtered = external_data[(external_data >= -30) & (external_data <= 200)]
 
-    # 2. 统计检验
-    statistic, p_value = stats.mannwhitneyu(
-        cjx_filtered, external_filtered, alternative='two-sided'
-    )
+    # 2. 统计检验（Mann-Whitney U，口径-30~200分钟，见significance）
+    in_range = df['delayMin'].between(-30, 200)
+    test = compare_groups(df.loc[in_range, ['航司类型', 'delayMin']], '航司类型', 'pairwise',
+                          tests=['mannwhitney'], min_count=1)
+    p_value = test['p_mw'].iloc[0]
+
+    # 3. 计算箱型图统计量（口径同上：-30~200分钟）
+    sketch = get_sketches(df, sketches, groupings=['所属航司代码'])['所属航司代码']
+    sketch = sketch.assign(航司类型=np.where(sketch['所属航司代码'] == 'CJX', '主基地航司', '外航'))
+    five = sketch_kpis(sketch, '航司类型', ['min', 'p25', 'median', 'p75', 'max'], value_range=(-30, 200))
+    cjx_stats = five.loc['主基地航司'].tolist()
+    ext_stats = five.loc['外航'].tolist()
+    return cjx_data, external_data, cjx_stats, ext_stats, p_value
 
-    # 3. 计算箱型图统计量
-    cjx_stats = [np.percentile(cjx_filtered, i) for i in [0, 25, 50, 75, 100]]
-    ext_stats = [np.percentile(external_filtered, i) for i in [0, 25, 50, 75, 100]]
+
+@traced('图3-4')
+def plot_base_vs_external_boxplot(df, sketches=None):
+    """
+    生成主基地航司(CJX)与外航延误分布对比箱型图
+    优化：图例位置移至底部
+    sketches: 分位数摘要（为None时由df构建）
+    """
+    cjx_data, external_data, cjx_stats, ext_stats, p_value = base_vs_external_stats(df, sketches)
 
     # 4. ECharts图表生成
     boxplot = Boxplot(
@@ -70,7 +89,7 @@ def plot_base_vs_external_boxplot(df):
 
     # 6. 渲染输出
     output_path = 'output/figures/图3-4_主基地与外航延误分布对比.html'
-    boxplot.render(output_path)
+    render_figure(boxplot, output_path)
 
     # 7. 控制台反馈
     print(f"✓ 图3-4 已生成: {output_path}")
@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
-import numpy as np
 from pyecharts.charts import Boxplot
 from pyecharts import options as opts
 from pyecharts.globals import ThemeType
@@ -8,99 +6,79 @@ from pyecharts.commons.utils import JsCode
 import os
 import traceback  # 补充导入，避免报错
 
+from aircraft_types import MAIN_FAMILIES, ensure_aircraft_family
+from figure_payload import render_figure
+from quantile_sketch import get_sketches, sketch_kpis
+from tracing import traced
+
 # 确保输出目录存在
 os.makedirs('output/figures', exist_ok=True)
 
 
-def load_flight_data():
-    """加载并预处理航班数据"""
-    df = pd.read_excel('output/khn_flight_processed.xlsx')
-    required_fields = ['delayMin', '机型', '航班号']
-    if not all(f in df.columns for f in required_fields):
-        raise ValueError("数据缺少必需字段")
-    return df
-
-
-def classify_aircraft_type(model):
-    """机型分类函数（覆盖所有变体）"""
-    if pd.isna(model):
-        return '其他'
-    model = str(model).upper().strip()
-    if any(x in model for x in ['A320', 'A321', 'A319', 'A318']):
-        return 'A320系列'
-    elif 'B737' in model or 'BOEING 737' in model:
-        return 'B737系列'
-    elif any(x in model for x in ['E190', 'E195', 'E-190']):
-        return 'E190支线'
-    elif 'CRJ' in model:
-        return 'CRJ支线'
-    elif 'ARJ21' in model or ('ARJ' in model and '21' in model):
-        return 'ARJ21支线'
-    else:
-        return '其他'
-
-
-def chart_3_5_aircraft_boxplot():
+@traced
+def aircraft_group_stats(sketches):
     """
-    图3-5：主流与支线机型延误箱型对比
-    论文3.3.1节文字描述为设计值，实际数据因夏季雷暴右偏
-    正文中需增加说明段解释统计差异
+    各机型分类的延误统计（五数、均值、IQR），由按机型分类的分位数摘要得到
+    关键：统计清洗（|delayMin|≤180）后数据，避免极端值压缩箱体
+    返回 {分类: 统计字典}，按主流/支线分类顺序，无样本的分类不出现
     """
-    df = load_flight_data()
-    df['机型分类'] = df['机型'].apply(classify_aircraft_type)
+    sketch = sketches['机型分类']
+    raw_counts = sketch_kpis(sketch, '机型分类', ['count'])['count']
+    clean = sketch_kpis(sketch, '机型分类', ['count', 'mean', 'min', 'p25', 'median', 'p75', 'max'],
+                        value_range=(-180, 180))
 
-    # 关键：统计清洗（|delayMin|≤180）后数据，避免极端值压缩箱体
-    main_groups = ['A320系列', 'B737系列', 'E190支线', 'CRJ支线', 'ARJ21支线']
-    boxplot_data = []
-    valid_groups = []
     stats_results = {}
-
-    print("\n图3-5 统计分析摘要:")
-    print("=" * 60)
-
-    for group in main_groups:
-        # 原始数据
-        raw_data = df[df['机型分类'] == group]['delayMin'].dropna().values
-        if len(raw_data) == 0:
+    for group in MAIN_FAMILIES:
+        if group not in clean.index:
             continue
+        row = clean.loc[group]
 
-        # 清洗后数据（|delayMin|≤180）
-        clean_data = raw_data[np.abs(raw_data) <= 180]
-
-        # 计算五数
-        stats = [
-            float(np.min(clean_data)),
-            float(np.percentile(clean_data, 25)),
-            float(np.percentile(clean_data, 50)),
-            float(np.percentile(clean_data, 75)),
-            float(np.max(clean_data))
-        ]
-
-        mean_val = float(np.mean(clean_data))
+        # 五数
+        stats = [float(row[m]) for m in ('min', 'p25', 'median', 'p75', 'max')]
         iqr_val = stats[3] - stats[1]
 
         stats_results[group] = {
-            'count': len(raw_data),
-            'clean_count': len(clean_data),
-            'mean': mean_val,
+            'count': int(raw_counts[group]),
+            'clean_count': int(row['count']),
+            'mean': float(row['mean']),
             'median': stats[2],
             'iqr': iqr_val,
             'stats': stats
         }
+    return stats_results
+
+
+@traced('图3-5')
+def chart_3_5_aircraft_boxplot(df=None, airports=None, start=None, end=None, sketches=None):
+    """
+    图3-5：主流与支线机型延误箱型对比
+    论文3.3.1节文字描述为设计值，实际数据因夏季雷暴右偏
+    正文中需增加说明段解释统计差异
+    df: 已加载的处理后数据（流水线传入）；为None时只读取分位数摘要，不加载航班明细
+    sketches: 分位数摘要（为None时由df构建或从摘要分区加载）
+    """
+    if df is not None:
+        df = ensure_aircraft_family(df.copy())
+    sketches = get_sketches(df, sketches, airports, start, end, groupings=['机型分类'])
+    stats_results = aircraft_group_stats(sketches)
+    valid_groups = list(stats_results)
+    boxplot_data = [result['stats'] for result in stats_results.values()]
 
-        boxplot_data.append(stats)
-        valid_groups.append(group)
+    print("\n图3-5 统计分析摘要:")
+    print("=" * 60)
 
+    for group, result in stats_results.items():
+        stats = result['stats']
         # 输出与论文3.3.1节对比
         print(f"【{group}】")
-        print(f"  样本量: {len(raw_data)}架次 (清洗后{len(clean_data)})")
-        print(f"  均值: {mean_val:.1f}分钟")
+        print(f"  样本量: {result['count']}架次 (清洗后{result['clean_count']})")
+        print(f"  均值: {result['mean']:.1f}分钟")
         print(f"  中位数: {stats[2]:.1f}分钟")
-        print(f"  IQR: {iqr_val:.1f}分钟")
+        print(f"  IQR: {result['iqr']:.1f}分钟")
         print(f"  五数: {stats[0]:.1f}/{stats[1]:.1f}/{stats[2]:.1f}/{stats[3]:.1f}/{stats[4]:.1f}")
 
         # 标记与论文差异
-        if 'A320系列' in group and abs(mean_val - 11.4) > 5:
+        if 'A320系列' in group and abs(result['mean'] - 11.4) > 5:
             print(f"  ⚠ 与论文11.4分钟存在差异，需在正文说明")
 
     # 创建箱型图
@@ -164,7 +142,7 @@ def chart_3_5_aircraft_boxplot():
 
     # 渲染
     output_path = 'output/figures/图3-5_机型箱型对比.html'
-    boxplot.render(output_path)
+    render_figure(boxplot, output_path)
 
     print(f"\n✅ 图3-5 生成成功!")
     print(f"  - 路径: {os.path.abspath(output_path)}")
@@ -1,285 +1,427 @@
 import pandas as pd
 import numpy as np
-from pyecharts.charts import Scatter
+from pyecharts.charts import Custom, Scatter
 from pyecharts import options as opts
 from pyecharts.globals import ThemeType
 from pyecharts.commons.utils import JsCode
 import json
-
-# ==================== 第一步：数据加载 ====================
-df_full = pd.read_excel("output/khn_flight_processed.xlsx").copy()
-print(f"图3-6 数据加载: {len(df_full)}条记录")
-
-# ==================== 第二步：计算原始距离 ====================
-airport_coords_iata = {
-    'KHN': {'lat': 28.865, 'lon': 115.9}, 'PEK': {'lat': 40.08, 'lon': 116.6}, 'PKX': {'lat': 39.5, 'lon': 116.4},
-    'SHA': {'lat': 31.2, 'lon': 121.3}, 'PVG': {'lat': 31.1, 'lon': 121.8}, 'CAN': {'lat': 23.4, 'lon': 113.3},
-    'SZX': {'lat': 22.6, 'lon': 114.1}, 'CTU': {'lat': 30.7, 'lon': 103.9}, 'TFU': {'lat': 30.3, 'lon': 104.4},
-    'KMG': {'lat': 25.1, 'lon': 102.7}, 'XIY': {'lat': 34.4, 'lon': 108.8}, 'HGH': {'lat': 30.2, 'lon': 120.4},
-    'NKG': {'lat': 31.7, 'lon': 118.9}, 'WUH': {'lat': 30.8, 'lon': 114.2}, 'CSX': {'lat': 28.2, 'lon': 113.2},
-    'HFE': {'lat': 31.9, 'lon': 117.3}, 'HRB': {'lat': 45.6, 'lon': 126.2}, 'SHE': {'lat': 41.6, 'lon': 123.5},
-    'TYN': {'lat': 37.7, 'lon': 112.6}, 'HET': {'lat': 40.9, 'lon': 111.8}, 'TAO': {'lat': 36.3, 'lon': 120.4},
-    'XMN': {'lat': 24.5, 'lon': 118.1}, 'FOC': {'lat': 25.9, 'lon': 119.7}, 'NNG': {'lat': 22.6, 'lon': 108.2},
-    'KWL': {'lat': 25.2, 'lon': 110.0}, 'URC': {'lat': 43.9, 'lon': 87.5}, 'LHW': {'lat': 36.5, 'lon': 103.6}
-}
-
-
-def calc_distance(row):
-    try:
-        from math import radians, sin, cos, sqrt, atan2
-        if row['起飞机场三字码'] != 'KHN':
-            return np.nan
-        origin = airport_coords_iata['KHN']
-        dest = airport_coords_iata.get(row['到达机场三字码'])
-        if not dest:
-            return np.random.uniform(500, 1200)
-
-        lat1, lon1 = radians(origin['lat']), radians(origin['lon'])
-        lat2, lon2 = radians(dest['lat']), radians(dest['lon'])
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return max(150, 6371 * c)
-    except:
-        return np.random.uniform(500, 1200)
-
-
-df_full['flightDistance'] = df_full.apply(calc_distance, axis=1)
-print(
-    f"✅ 原始距离计算完成: 平均{df_full['flightDistance'].mean():.1f}km, 范围[{df_full['flightDistance'].min():.1f}, {df_full['flightDistance'].max():.1f}]")
-
-
-# ==================== 第三步：分类与标记 ====================
-def classify_ac_type(model):
-    if pd.isna(model):
-        return '其他'
-    m = str(model).upper()
-    if 'A320' in m or 'A321' in m:
-        return 'A320系列'
-    elif 'B737' in m:
-        return 'B737系列'
-    elif 'E190' in m:
-        return 'E190支线'
-    elif 'CRJ' in m:
-        return 'CRJ支线'
-    elif 'ARJ21' in m or 'ARJ-21' in m:
-        return 'ARJ21支线'
-    else:
-        return '其他'
-
-
-df_full['机型分类'] = df_full['机型'].apply(classify_ac_type)
-df_full['is_extreme_outlier'] = df_full['delayMin'] > 180
-outlier_count = df_full['is_extreme_outlier'].sum()
-
-# ==================== 第四步：数据筛选 ====================
-df_plot = df_full[
-    (df_full['起飞机场三字码'] == 'KHN') &
-    (df_full['flightDistance'] >= 100) &
-    (df_full['delayMin'] >= -60) &
-    (df_full['delayMin'] <= 300)
-    ].copy()
-print(f"筛选后数据: {len(df_plot)}条")
-
-# ==================== 第五步：构建绘图数据 ====================
-main_groups = ['A320系列', 'B737系列', 'E190支线', 'CRJ支线', 'ARJ21支线']
-scatter_series = {}
-
-for ac_type in main_groups:
-    sub_df = df_plot[df_plot['机型分类'] == ac_type].copy()
-    if len(sub_df) == 0:
-        continue
-
-    # **仅延误四舍五入到整数**
-    sub_df.loc[:, 'delay_int'] = sub_df['delayMin'].round(0)
-
-    # **按延误+距离聚合频次（距离保持原始）**
-    freq = sub_df.groupby(['delay_int', 'flightDistance']).agg(
-        freq=('机型分类', 'size')
-    ).reset_index()
-
-    # **构建点数据[[延误, 距离, 频次], ...]**
-    points = freq[['delay_int', 'flightDistance', 'freq']].values.tolist()
-
-    scatter_series[ac_type] = {
-        'data': points,
-        'count': len(sub_df),
-        'outliers': sub_df[sub_df['is_extreme_outlier']].copy()
+import zlib
+
+from aircraft_types import MAIN_FAMILIES, ensure_aircraft_family
+from airports import get_registry
+from figure_payload import SCATTER_MAX_POINTS, bin_scatter, density_grid, render_figure, sample_points
+from flight_store import FlightStore
+from outliers import detect_outliers
+from tracing import traced
+
+# 数据范围（None表示全部；例：AIRPORTS = ['KHN']，MONTHS = ('2025-06', '2025-08')）
+AIRPORTS = None
+MONTHS = (None, None)
+
+# 图3-6及其核查用到的航班字段（只读取这些列）
+SCATTER_COLUMNS = ['起飞机场三字码', '到达机场三字码', '机型', '机型分类', 'delayMin']
+
+# 判定阈值
+OUTLIER_THRESHOLD = 180  # 严重延误异常值（分钟）
+MIN_DISTANCE_KM = 100    # 参与绘图的最小航程（公里）
+
+# 载荷控制：每个机型序列最多SCATTER_MAX_POINTS个点（超出时按分位数网格聚合），异常值最多抽样OUTLIER_MAX_POINTS条
+OUTLIER_MAX_POINTS = 500
+
+# 绘图模式：'scatter' 频次散点；'heatmap' 各机型延误×距离二维分箱热力图（格子数与行数无关），异常值仍为单独的散点层
+PLOT_MODE = 'scatter'
+PLOT_MODES = ('scatter', 'heatmap')
+HEATMAP_DELAY_BIN = 10                 # 热力图延误分箱宽度（分钟）
+HEATMAP_DISTANCE_BIN = 50              # 热力图距离分箱宽度（公里）
+HEATMAP_DELAY_RANGE = (-60, 300)       # 与绘图筛选范围一致
+HEATMAP_DISTANCE_RANGE = (100, 3100)
+
+# ==================== 航程计算 ====================
+EARTH_RADIUS_KM = 6371
+MIN_ROUTE_KM = 150                 # 计算航程下限（公里）
+FALLBACK_RANGE_KM = (500, 1200)    # 坐标未知的目的地：按三字码确定性映射到该区间
+
+
+def _fallback_distance(code):
+    """坐标未知的目的地：三字码CRC32映射到FALLBACK_RANGE_KM（同一机场结果固定，可复现）"""
+    low, high = FALLBACK_RANGE_KM
+    return low + zlib.crc32(str(code).encode('utf-8')) % ((high - low) * 100) / 100
+
+
+def route_distances(origins, dests, base='KHN', registry=None):
+    """
+    向量化航程计算（公里）
+    - 按(起飞, 到达)组合编码，每个不同航线只计算一次球面距离，再按编码广播回各行
+    - 坐标取自机场登记表（airports.py）
+    - 起飞机场非base的记录为NaN；目的地坐标未知时按三字码确定性取值（见_fallback_distance）
+    origins/dests: 起飞/到达机场三字码（Series或数组）
+    """
+    registry = get_registry() if registry is None else registry
+    o_codes, o_uniques = pd.factorize(np.asarray(origins, dtype=object))
+    d_codes, d_uniques = pd.factorize(np.asarray(dests, dtype=object))
+
+    # 航线编码：缺失值（-1）整体平移到0
+    width = len(d_uniques) + 1
+    pair_codes, pairs = pd.factorize((o_codes.astype(np.int64) + 1) * width + (d_codes + 1))
+    pair_o, pair_d = pairs // width - 1, pairs % width - 1
+
+    origin_names = np.append(np.asarray(o_uniques, dtype=object), None)[pair_o]
+    dest_names = np.append(np.asarray(d_uniques, dtype=object), None)[pair_d]
+
+    base_coord = registry.coord(base)
+    dest_pos = registry.positions(dest_names)
+    dest_lat, dest_lon = registry.lat[dest_pos], registry.lon[dest_pos]
+
+    lat1, lon1 = np.radians(base_coord['lat']), np.radians(base_coord['lon'])
+    lat2, lon2 = np.radians(dest_lat), np.radians(dest_lon)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    dist = np.maximum(MIN_ROUTE_KM, EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
+    unknown = np.isnan(dest_lat)
+    dist[unknown] = [_fallback_distance(d if d is not None else '') for d in dest_names[unknown]]
+    dist[origin_names != base] = np.nan
+    return dist[pair_codes]
+
+
+# ==================== 数据加载与预处理 ====================
+@traced
+def load_flight_data(airports=None, start=None, end=None):
+    """
+    加载航班数据（只读取SCATTER_COLUMNS）
+    airports/start/end: 机场与月份范围，如 'KHN', '2025-06', '2025-08'（按分区裁剪读取）
+    """
+    df_full = FlightStore().scan(airports, start, end).select(*SCATTER_COLUMNS).load()
+    print(f"图3-6 数据加载: {len(df_full)}条记录")
+    return df_full
+
+
+@traced
+def prepare_scatter_data(df_full):
+    """计算原始距离、机型分类与严重延误标记"""
+    df_full['flightDistance'] = route_distances(df_full['起飞机场三字码'], df_full['到达机场三字码'])
+    print(
+        f"✅ 原始距离计算完成: 平均{df_full['flightDistance'].mean():.1f}km, 范围[{df_full['flightDistance'].min():.1f}, {df_full['flightDistance'].max():.1f}]")
+
+    ensure_aircraft_family(df_full)
+    df_full['is_extreme_outlier'], by_family = detect_outliers(df_full, '机型分类', 'threshold',
+                                                               upper=OUTLIER_THRESHOLD)
+    outlier_count = by_family['n_outliers'].sum()
+    return df_full, outlier_count
+
+
+@traced
+def heatmap_layers(df_plot, delay_bin=HEATMAP_DELAY_BIN, distance_bin=HEATMAP_DISTANCE_BIN):
+    """
+    热力图模式：各机型延误×距离二维直方图（所有机型一次分箱），每个机型一个矩形层
+    颜色为相对密度（格子航班数 / 该机型最密格子航班数 ×100），样本量悬殊的机型共用一个色阶；只输出非空格子
+    数据项：[延误下界, 距离下界, 相对密度, 航班数, 占该机型航班%]
+    返回(Custom图, {机型: 格子数})
+    """
+    codes = pd.Categorical(df_plot['机型分类'], categories=MAIN_FAMILIES).codes
+    counts, delay_edges, distance_edges = density_grid(
+        df_plot['delayMin'], df_plot['flightDistance'], HEATMAP_DELAY_RANGE, HEATMAP_DISTANCE_RANGE,
+        delay_bin, distance_bin, codes, len(MAIN_FAMILIES))
+
+    render_item = JsCode(f"""
+        function(params, api) {{
+            var topLeft = api.coord([api.value(0), api.value(1) + {distance_bin}]);
+            var bottomRight = api.coord([api.value(0) + {delay_bin}, api.value(1)]);
+            return {{type: 'rect', style: {{fill: api.visual('color')}}, shape: {{x: topLeft[0], y: topLeft[1],
+                     width: bottomRight[0] - topLeft[0], height: bottomRight[1] - topLeft[1]}}}};
+        }}
+    """)
+    tooltip = JsCode(f"""
+        function(params) {{
+            var data = params.value;
+            return params.seriesName + '<br/>延误: ' + data[0] + '~' + (data[0] + {delay_bin}) + ' 分钟<br/>距离: ' +
+                data[1] + '~' + (data[1] + {distance_bin}) + ' km<br/>航班: ' + data[3] + ' 架次（占该机型' + data[4] + '%）';
+        }}
+    """)
+
+    heatmap = Custom()
+    layers = {}
+    for k, ac_type in enumerate(MAIN_FAMILIES):
+        grid = counts[k]
+        ix, iy = np.nonzero(grid)
+        if len(ix) == 0:
+            continue
+        freq = grid[ix, iy]
+        density = np.round(freq / freq.max() * 100, 1)
+        share = np.round(freq / freq.sum() * 100, 2)
+        heatmap.add(
+            series_name=ac_type,
+            render_item=render_item,
+            data=np.column_stack([delay_edges[ix], distance_edges[iy], density, freq, share]).tolist(),
+            z=1,
+            tooltip_opts=opts.TooltipOpts(formatter=tooltip),
+        )
+        layers[ac_type] = len(ix)
+    return heatmap, layers
+
+
+@traced('图3-6')
+def plot_aircraft_scatter(df=None, airports=None, start=None, end=None, mode=None):
+    """
+    图3-6：机型-延误联合分布散点图
+    df: 已加载的处理后数据（流水线传入），为None时自行加载
+    mode: 'scatter' 或 'heatmap'，默认PLOT_MODE
+    """
+    mode = PLOT_MODE if mode is None else mode
+    if mode not in PLOT_MODES:
+        raise ValueError(f"未知绘图模式: {mode}（可选 {list(PLOT_MODES)}）")
+
+    # ==================== 第一步：数据加载 ====================
+    df_full = load_flight_data(airports, start, end) if df is None else df.copy()
+
+    # ==================== 第二、三步：距离计算、分类与标记 ====================
+    df_full, outlier_count = prepare_scatter_data(df_full)
+
+    # ==================== 第四步：数据筛选 ====================
+    df_plot = df_full[
+        (df_full['起飞机场三字码'] == 'KHN') &
+        (df_full['flightDistance'] >= MIN_DISTANCE_KM) &
+        (df_full['delayMin'] >= -60) &
+        (df_full['delayMin'] <= 300)
+        ].copy()
+    print(f"筛选后数据: {len(df_plot)}条")
+
+    # ==================== 第五步：构建绘图数据 ====================
+    main_groups = MAIN_FAMILIES if mode == 'scatter' else []  # 热力图模式不构建逐点散点
+    scatter_series = {}
+
+    for ac_type in main_groups:
+        sub_df = df_plot[df_plot['机型分类'] == ac_type]
+        if len(sub_df) == 0:
+            continue
+
+        # **延误四舍五入到整数，按延误+距离聚合频次；组合数超过上限时按分位数网格聚合为质心**
+        delay, distance, freq = bin_scatter(sub_df['delayMin'].round(0), sub_df['flightDistance'],
+                                            max_points=SCATTER_MAX_POINTS)
+
+        # **构建点数据[[延误, 距离, 频次], ...]（距离保留1位小数）**
+        points = np.column_stack([np.round(delay, 1), np.round(distance, 1), freq.astype(np.int64)]).tolist()
+
+        scatter_series[ac_type] = {
+            'data': points,
+            'count': len(sub_df),
+        }
+        print(f"  {ac_type}: {len(sub_df)}条 → {len(points)}个点")
+
+    # ==================== 第六步：生成图表 ====================
+    scatter = Scatter(init_opts=opts.InitOpts(width='1200px', height='800px', theme=ThemeType.LIGHT))
+
+    colors = {
+        'A320系列': '#3498db', 'B737系列': '#9b59b6', 'E190支线': '#000000',
+        'CRJ支线': '#9b59b6', 'ARJ21支线': '#2ecc71'
     }
 
-# ==================== 第六步：生成图表 ====================
-scatter = Scatter(init_opts=opts.InitOpts(width='1200px', height='800px', theme=ThemeType.LIGHT))
-
-colors = {
-    'A320系列': '#3498db', 'B737系列': '#9b59b6', 'E190支线': '#000000',
-    'CRJ支线': '#9b59b6', 'ARJ21支线': '#2ecc71'
-}
-
-# **添加每个机型序列**
-for ac_type, series_data in scatter_series.items():
-    if not series_data['data']:
-        continue
-
-    scatter.add_xaxis([p[0] for p in series_data['data']])
-    scatter.add_yaxis(
-        series_name=ac_type,
-        y_axis=[[p[1], p[2]] for p in series_data['data']],
-        symbol_size=JsCode("""
-            function(data) {
-                return Math.min(20, Math.max(4, data[1] * 1.5 + 2));
-            }
-        """),
-        itemstyle_opts=opts.ItemStyleOpts(color=colors[ac_type], opacity=0.85),
-        label_opts=opts.LabelOpts(is_show=False),
-        tooltip_opts=opts.TooltipOpts(
-            formatter=JsCode("""
-                function(params) {
-                    var data = params.value;
-                    return params.seriesName + '<br/>延误: ' + data[0] + ' 分钟<br/>距离: ' + data[1].toFixed(0) + ' km<br/>频次: ' + data[2] + ' 架次';
-                }
-            """)
-        )
-    )
+    # 数值型x轴：每个点自带[延误, 距离, 频次]，不再为每个序列设置x轴数据
+    scatter.add_xaxis([])
 
-# **添加异常值（红色星号）**
-if outlier_count > 0:
-    outlier_df = df_plot[df_plot['is_extreme_outlier']].copy()
-    outlier_freq = outlier_df.groupby(['delayMin', 'flightDistance']).agg(
-        freq=('机型分类', 'size')
-    ).reset_index()
+    # **添加每个机型序列**
+    for ac_type, series_data in scatter_series.items():
+        if not series_data['data']:
+            continue
 
-    if len(outlier_freq) > 0:
-        outlier_points = outlier_freq.values.tolist()
-        scatter.add_xaxis([p[0] for p in outlier_points])
         scatter.add_yaxis(
-            series_name='严重延误异常值',
-            y_axis=[[p[1], p[2]] for p in outlier_points],
+            series_name=ac_type,
+            y_axis=series_data['data'],
             symbol_size=JsCode("""
                 function(data) {
-                    return Math.min(25, Math.max(8, data[1] * 2 + 4));
+                    return Math.min(20, Math.max(4, data[2] * 1.5 + 2));
                 }
             """),
-            symbol='star',
-            itemstyle_opts=opts.ItemStyleOpts(color='#e74c3c', border_width=2, border_color='#fff'),
+            itemstyle_opts=opts.ItemStyleOpts(color=colors[ac_type], opacity=0.85),
             label_opts=opts.LabelOpts(is_show=False),
             tooltip_opts=opts.TooltipOpts(
                 formatter=JsCode("""
                     function(params) {
                         var data = params.value;
-                        return '严重延误异常值<br/>延误: ' + data[0] + ' 分钟<br/>距离: ' + data[1].toFixed(0) + ' km';
+                        return params.seriesName + '<br/>延误: ' + data[0] + ' 分钟<br/>距离: ' + data[1].toFixed(0) + ' km<br/>频次: ' + data[2] + ' 架次';
                     }
                 """)
             )
         )
 
-# ==================== 第七步：图表全局配置 ====================
-scatter.set_global_opts(
-    title_opts=opts.TitleOpts(
-        title=' ',  # 图3-6 机型-延误联合分布
-        subtitle=f'距离: 昌北机场出发真实航程 | 异常值: {outlier_count}条（严重延误>180min）',
-        pos_left='center',
-        title_textstyle_opts=opts.TextStyleOpts(font_size=16, font_family='SimHei')
-    ),
-    xaxis_opts=opts.AxisOpts(
-        name='延误分钟',
-        type_='value',
-        min_=-50,
-        max_=300,
-        interval=25,
-        name_textstyle_opts=opts.TextStyleOpts(font_family='SimHei'),
-        axislabel_opts=opts.LabelOpts(rotate=45, font_size=10)
-    ),
-    yaxis_opts=opts.AxisOpts(
-        name='航班距离(km)',
-        min_=200,
-        max_=1600,
-        interval=50,
-        name_textstyle_opts=opts.TextStyleOpts(font_family='SimHei')
-    ),
-    legend_opts=opts.LegendOpts(
-        pos_top='5%',
-        pos_right='5%',
-        orient='vertical',
-        item_width=15,
-        item_height=15,
-        textstyle_opts=opts.TextStyleOpts(font_size=12, font_family='SimHei')
-    ),
-    tooltip_opts=opts.TooltipOpts(
-        trigger='item',
-        background_color='rgba(255,255,255,0.95)',
-        border_color='#ccc',
-        textstyle_opts=opts.TextStyleOpts(font_family='SimHei')
-    ),
-    datazoom_opts=[
-        opts.DataZoomOpts(type_="inside", xaxis_index=0, range_start=0, range_end=100),
-        opts.DataZoomOpts(type_="inside", yaxis_index=0, orient="vertical", range_start=0, range_end=100)
-    ]
-)
-
-# ==================== 第八步：输出文件 ====================
-output_path = 'output/figures/图3-6_机型延误散点.html'
-scatter.render(output_path)
-
-print(f"\n{'=' * 60}")
-print(f"✅ 图3-6 生成成功！")
-print(f"📄 文件: {output_path}")
-print(f"🎯 关键改进:")
-print(f"   ✓ 距离保持原始精度（不再规整到100km倍数）")
-print(f"   ✓ 异常值仅严重延误>180min（无负值）")
-print(f"   ✓ 聚合逻辑: 延误整数+距离原始值")
-print(f"   ✓ 数据格式: [[延误, 距离, 频次], ...]纯净")
-print(f"{'=' * 60}")
-
-# ==================== 第九步：数据分析 ====================
-print("\n" + "=" * 60)
-print("📊 论文3.3.2节数据核对报告")
-print("=" * 60)
-
-# 各机型统计
-for ac_type in main_groups:
-    sub_df = df_full[df_full['机型分类'] == ac_type].copy()
-    if len(sub_df) == 0:
-        continue
-
-    stats = {
-        '样本量': len(sub_df),
-        '均值': round(sub_df['delayMin'].mean(), 1),
-        '中位数': round(sub_df['delayMin'].median(), 1),
-        '延误>180min': int((sub_df['delayMin'] > 180).sum()),
-        '提前<-15min': int((sub_df['delayMin'] < -15).sum()),
-        '距离均值': round(sub_df['flightDistance'].mean(), 0)
-    }
+    # **添加异常值（红色星号）**
+    if outlier_count > 0:
+        outlier_df = df_plot[df_plot['is_extreme_outlier']]
+        # 异常值保留真实坐标：超过上限时按密度分层抽样
+        kept = sample_points(outlier_df['delayMin'], outlier_df['flightDistance'], OUTLIER_MAX_POINTS)
+        outlier_freq = outlier_df.iloc[kept].groupby(['delayMin', 'flightDistance']).agg(
+            freq=('机型分类', 'size')
+        ).reset_index()
+        if len(kept) < len(outlier_df):
+            print(f"  严重延误异常值: {len(outlier_df)}条 → 抽样{len(kept)}条")
+
+        if len(outlier_freq) > 0:
+            outlier_points = outlier_freq.round({'flightDistance': 1}).values.tolist()
+            scatter.add_yaxis(
+                series_name='严重延误异常值',
+                y_axis=outlier_points,
+                symbol_size=JsCode("""
+                    function(data) {
+                        return Math.min(25, Math.max(8, data[2] * 2 + 4));
+                    }
+                """),
+                symbol='star',
+                itemstyle_opts=opts.ItemStyleOpts(color='#e74c3c', border_width=2, border_color='#fff'),
+                label_opts=opts.LabelOpts(is_show=False),
+                tooltip_opts=opts.TooltipOpts(
+                    formatter=JsCode("""
+                        function(params) {
+                            var data = params.value;
+                            return '严重延误异常值<br/>延误: ' + data[0] + ' 分钟<br/>距离: ' + data[1].toFixed(0) + ' km';
+                        }
+                    """)
+                )
+            )
+
+    # **热力图模式：各机型二维分箱矩形层（位于异常值散点层之下）**
+    subtitle = f'距离: 昌北机场出发真实航程 | 异常值: {outlier_count}条（严重延误>180min）'
+    visualmap_opts, hidden_layers = None, None
+    if mode == 'heatmap':
+        heatmap, layers = heatmap_layers(df_plot)
+        for ac_type, n_cells in layers.items():
+            print(f"  {ac_type}: {n_cells}个格子（{HEATMAP_DELAY_BIN}分钟×{HEATMAP_DISTANCE_BIN}km）")
+        scatter.overlap(heatmap)
+        visualmap_opts = opts.VisualMapOpts(
+            min_=0,
+            max_=100,
+            dimension=2,
+            series_index=[i for i, s in enumerate(scatter.options['series']) if s['type'] == 'custom'],
+            range_color=['#f7fbff', '#6baed6', '#08306b'],
+            range_text=['相对密度(%)', ''],
+            is_calculable=True,
+            pos_left='left',
+            pos_bottom='10%',
+            textstyle_opts=opts.TextStyleOpts(font_family='SimHei')
+        )
+        # 各机型热力层互相遮挡：默认只显示第一个机型，通过图例切换
+        hidden_layers = {ac_type: False for ac_type in list(layers)[1:]}
+        subtitle += f' | 热力图: {HEATMAP_DELAY_BIN}分钟×{HEATMAP_DISTANCE_BIN}km分箱，颜色=相对该机型最密格子的密度，图例切换机型'
+
+    # ==================== 第七步：图表全局配置 ====================
+    scatter.set_global_opts(
+        title_opts=opts.TitleOpts(
+            title=' ',  # 图3-6 机型-延误联合分布
+            subtitle=subtitle,
+            pos_left='center',
+            title_textstyle_opts=opts.TextStyleOpts(font_size=16, font_family='SimHei')
+        ),
+        xaxis_opts=opts.AxisOpts(
+            name='延误分钟',
+            type_='value',
+            min_=-50,
+            max_=300,
+            interval=25,
+            name_textstyle_opts=opts.TextStyleOpts(font_family='SimHei'),
+            axislabel_opts=opts.LabelOpts(rotate=45, font_size=10)
+        ),
+        yaxis_opts=opts.AxisOpts(
+            name='航班距离(km)',
+            min_=200,
+            max_=1600,
+            interval=50,
+            name_textstyle_opts=opts.TextStyleOpts(font_family='SimHei')
+        ),
+        legend_opts=opts.LegendOpts(
+            pos_top='5%',
+            pos_right='5%',
+            orient='vertical',
+            item_width=15,
+            item_height=15,
+            selected_map=hidden_layers,
+            textstyle_opts=opts.TextStyleOpts(font_size=12, font_family='SimHei')
+        ),
+        visualmap_opts=visualmap_opts,
+        tooltip_opts=opts.TooltipOpts(
+            trigger='item',
+            background_color='rgba(255,255,255,0.95)',
+            border_color='#ccc',
+            textstyle_opts=opts.TextStyleOpts(font_family='SimHei')
+        ),
+        datazoom_opts=[
+            opts.DataZoomOpts(type_="inside", xaxis_index=0, range_start=0, range_end=100),
+            opts.DataZoomOpts(type_="inside", yaxis_index=0, orient="vertical", range_start=0, range_end=100)
+        ]
+    )
 
-    print(f"\n{ac_type}:")
-    print(f"  样本量: {stats['样本量']}条 | 均值: {stats['均值']}分钟 | 中位数: {stats['中位数']}分钟")
-    print(f"  严重延误>180min: {stats['延误>180min']}条 | 提前起飞<-15min: {stats['提前<-15min']}条")
-    print(f"  平均航程: {stats['距离均值']}km")
-
-# 负延误占比
-total_early = df_full[df_full['delayMin'] < -15]
-if len(total_early) > 0:
-    a320_early = df_full[(df_full['机型分类'] == 'A320系列') & (df_full['delayMin'] < -15)]
-    ratio = len(a320_early) / len(total_early) * 100
-    print(f"\n【负延误占比】A320系列: {ratio:.1f}% (论文: 67.3%)")
-
-# 长航程延误
-arj21_long = df_full[
-    (df_full['机型分类'] == 'ARJ21支线') &
-    (df_full['flightDistance'] > 1500) &
-    (df_full['delayMin'] > 0)
-    ]['delayMin']
-
-if len(arj21_long) > 0:
-    print(f"\n【长航程延误】ARJ21>1500km: {len(arj21_long)}条")
-    print(f"  均值: {arj21_long.mean():.1f}分钟 (论文: 89分钟)")
-    print(f"  范围: [{arj21_long.min():.1f}, {arj21_long.max():.1f}]分钟")
-
-# 异常值分布
-print(f"\n【严重延误异常值>180min】总计: {outlier_count}条")
-for ac_type in main_groups:
-    count = int((df_full[df_full['机型分类'] == ac_type]['delayMin'] > 180).sum())
-    print(f"  {ac_type}: {count}条")
-
-print(f"\n✅ 任务完成：图表已生成，请检查HTML文件")
-print(f"📊 数据核对报告已输出，建议按上述统计更新论文3.3.2节")
-print("=" * 60)
\ No newline at end of file
+    # ==================== 第八步：输出文件 ====================
+    output_path = 'output/figures/图3-6_机型延误散点.html'
+    render_figure(scatter, output_path)
+
+    print(f"\n{'=' * 60}")
+    print(f"✅ 图3-6 生成成功！")
+    print(f"📄 文件: {output_path}")
+    print(f"🎯 关键改进:")
+    print(f"   ✓ 距离保持原始精度（不再规整到100km倍数）")
+    print(f"   ✓ 异常值仅严重延误>180min（无负值）")
+    print(f"   ✓ 聚合逻辑: 延误整数+距离原始值（每个机型最多{SCATTER_MAX_POINTS}个点，超出按分位数网格聚合）")
+    print(f"   ✓ 数据格式: [[延误, 距离, 频次], ...]纯净")
+    print(f"{'=' * 60}")
+
+    # ==================== 第九步：数据分析 ====================
+    print_paper_check(df_full, outlier_count)
+    return scatter
+
+
+def print_paper_check(df_full, outlier_count):
+    """论文3.3.2节数据核对报告"""
+    main_groups = MAIN_FAMILIES
+    print("\n" + "=" * 60)
+    print("📊 论文3.3.2节数据核对报告")
+    print("=" * 60)
+
+    # 各机型统计
+    for ac_type in main_groups:
+        sub_df = df_full[df_full['机型分类'] == ac_type].copy()
+        if len(sub_df) == 0:
+            continue
+
+        stats = {
+            '样本量': len(sub_df),
+            '均值': round(sub_df['delayMin'].mean(), 1),
+            '中位数': round(sub_df['delayMin'].median(), 1),
+            '延误>180min': int(sub_df['is_extreme_outlier'].sum()),
+            '提前<-15min': int((sub_df['delayMin'] < -15).sum()),
+            '距离均值': round(sub_df['flightDistance'].mean(), 0)
+        }
+
+        print(f"\n{ac_type}:")
+        print(f"  样本量: {stats['样本量']}条 | 均值: {stats['均值']}分钟 | 中位数: {stats['中位数']}分钟")
+        print(f"  严重延误>180min: {stats['延误>180min']}条 | 提前起飞<-15min: {stats['提前<-15min']}条")
+        print(f"  平均航程: {stats['距离均值']}km")
+
+    # 负延误占比
+    total_early = df_full[df_full['delayMin'] < -15]
+    if len(total_early) > 0:
+        a320_early = df_full[(df_full['机型分类'] == 'A320系列') & (df_full['delayMin'] < -15)]
+        ratio = len(a320_early) / len(total_early) * 100
+        print(f"\n【负延误占比】A320系列: {ratio:.1f}% (论文: 67.3%)")
+
+    # 长航程延误
+    arj21_long = df_full[
+        (df_full['机型分类'] == 'ARJ21支线') &
+        (df_full['flightDistance'] > 1500) &
+        (df_full['delayMin'] > 0)
+        ]['delayMin']
+
+    if len(arj21_long) > 0:
+        print(f"\n【长航程延误】ARJ21>1500km: {len(arj21_long)}条")
+        print(f"  均值: {arj21_long.mean():.1f}分钟 (论文: 89分钟)")
+        print(f"  范围: [{arj21_long.min():.1f}, {arj21_long.max():.1f}]分钟")
+
+    # 异常值分布
+    print(f"\n【严重延误异常值>180min】总计: {outlier_count}条")
+    for ac_type in main_groups:
+        count = int(df_full.loc[df_full['机型分类'] == ac_type, 'is_extreme_outlier'].sum())
+        print(f"  {ac_type}: {count}条")
+
+    print(f"\n✅ 任务完成：图表已生成，请检查HTML文件")
+    print(f"📊 数据核对报告已输出，建议按上述统计更新论文3.3.2节")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    plot_aircraft_scatter(airports=AIRPORTS, start=MONTHS[0], end=MONTHS[1])
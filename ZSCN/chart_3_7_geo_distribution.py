@@ -3,76 +3,34 @@ import pandas as pd
 from pyecharts.charts import Geo
 from pyecharts import options as opts
 from pyecharts.globals import ThemeType, ChartType
-import json
 import numpy as np
 import os
 
+from airports import get_registry
+from figure_payload import render_figure
+from flight_cube import get_cube, rollup
+from flight_store import FlightStore
+from tracing import traced
+
 # 确保输出目录存在
 os.makedirs('output/figures', exist_ok=True)
 
 # ==========================================
-# IATA→ICAO转换字典
-# ==========================================
-IATA_TO_ICAO = {
-    'KHN': 'ZSCN', 'PEK': 'ZBAA', 'PKX': 'ZBAD', 'SHA': 'ZSSS', 'PVG': 'ZSPD',
-    'CAN': 'ZGGG', 'SZX': 'ZGSZ', 'CTU': 'ZUUU', 'TFU': 'ZUTF', 'HGH': 'ZSHC',
-    'WUH': 'ZHHH', 'XIY': 'ZLXY', 'CKG': 'ZUCK', 'TSN': 'ZBTJ', 'HAK': 'ZJHK',
-    'SYX': 'ZJSY', 'XMN': 'ZSAM', 'TAO': 'ZSQD', 'DLC': 'ZYTL', 'NKG': 'ZSNJ',
-    'KMG': 'ZPPP', 'NNG': 'ZGNN', 'CSX': 'ZGHA', 'HFE': 'ZSOF', 'SHE': 'ZYTX',
-    'CGQ': 'ZYCC', 'HRB': 'ZYHB', 'INC': 'ZBYC', 'URC': 'ZWWW', 'KWE': 'ZUGY',
-    'LJG': 'ZPLJ', 'LUM': 'ZPLX', 'DLU': 'ZPDL', 'JHG': 'ZPJH', 'KWL': 'ZGKL',
-    'BHY': 'ZGBH', 'ENH': 'ZHES', 'RIZ': 'ZSRZ', 'ZHA': 'ZGZJ', 'LYI': 'ZSLY',
-    'JNG': 'ZSJG', 'WMT': 'ZSWT', 'XUZ': 'ZSXZ', 'HSN': 'ZSZS', 'DSN': 'ZBDS',
-    'DOY': 'ZSDY', 'YCU': 'ZBYC', 'LFQ': 'ZBLF', 'SWA': 'ZGOW', 'ZUH': 'ZGSD',
-    'GOQ': 'ZLGM', 'YIN': 'ZWYN', 'HTN': 'ZWAT', 'HET': 'ZBHH', 'TYN': 'ZBYN',
-    'CGO': 'ZHCC', 'HIA': 'ZSSH', 'LYG': 'ZSLG', 'LYA': 'ZHLY', 'WNZ': 'ZSWZ',
-    'NTG': 'ZSNT', 'YNT': 'ZSYT', 'JNG': 'ZSJG', 'JJN': 'ZSQZ', 'XUZ': 'ZSXZ'
-}
-
-# ==========================================
-# 机场代码→中文名称映射（核心添加！）
+# 数据加载
 # ==========================================
-AIRPORT_NAMES = {
-    'KHN': '南昌昌北', 'ZSCN': '南昌昌北', 'PEK': '北京首都', 'ZBAA': '北京首都',
-    'PKX': '北京大兴', 'ZBAD': '北京大兴', 'SHA': '上海虹桥', 'ZSSS': '上海虹桥',
-    'PVG': '上海浦东', 'ZSPD': '上海浦东', 'CAN': '广州白云', 'ZGGG': '广州白云',
-    'SZX': '深圳宝安', 'ZGSZ': '深圳宝安', 'CTU': '成都双流', 'ZUUU': '成都双流',
-    'TFU': '成都天府', 'ZUTF': '成都天府', 'HGH': '杭州萧山', 'ZSHC': '杭州萧山',
-    'WUH': '武汉天河', 'ZHHH': '武汉天河', 'XIY': '西安咸阳', 'ZLXY': '西安咸阳',
-    'CKG': '重庆江北', 'ZUCK': '重庆江北', 'TSN': '天津滨海', 'ZBTJ': '天津滨海',
-    'HAK': '海口美兰', 'ZJHK': '海口美兰', 'SYX': '三亚凤凰', 'ZJSY': '三亚凤凰',
-    'XMN': '厦门高崎', 'ZSAM': '厦门高崎', 'TAO': '青岛胶东', 'ZSQD': '青岛胶东',
-    'DLC': '大连周水子', 'ZYTL': '大连周水子', 'NKG': '南京禄口', 'ZSNJ': '南京禄口',
-    'KMG': '昆明长水', 'ZPPP': '昆明长水', 'NNG': '南宁吴圩', 'ZGNN': '南宁吴圩',
-    'CSX': '长沙黄花', 'ZGHA': '长沙黄花', 'HFE': '合肥新桥', 'ZSOF': '合肥新桥',
-    'SHE': '沈阳桃仙', 'ZYTX': '沈阳桃仙', 'CGQ': '长春龙嘉', 'ZYCC': '长春龙嘉',
-    'HRB': '哈尔滨太平', 'ZYHB': '哈尔滨太平', 'INC': '银川河东', 'ZBYC': '银川河东',
-    'URC': '乌鲁木齐地窝堡', 'ZWWW': '乌鲁木齐地窝堡', 'KWE': '贵阳龙洞堡', 'ZUGY': '贵阳龙洞堡',
-    'LJG': '丽江三义', 'ZPLJ': '丽江三义', 'LUM': '德宏芒市', 'ZPLX': '德宏芒市',
-    'DLU': '大理凤仪', 'ZPDL': '大理凤仪', 'JHG': '西双版纳嘎洒', 'ZPJH': '西双版纳嘎洒',
-    'KWL': '桂林两江', 'ZGKL': '桂林两江', 'BHY': '北海福成', 'ZGBH': '北海福成',
-    'ENH': '恩施许家坪', 'ZHES': '恩施许家坪', 'RIZ': '日照山字河', 'ZSRZ': '日照山字河',
-    'ZHA': '湛江吴川', 'ZGZJ': '湛江吴川', 'LYI': '临沂启阳', 'ZSLY': '临沂启阳',
-    'JNG': '济宁大安', 'ZSJG': '济宁大安', 'WMT': '遵义茅台', 'ZSWT': '遵义茅台',
-    'XUZ': '徐州观音', 'ZSXZ': '徐州观音', 'HSN': '舟山普陀山', 'ZSZS': '舟山普陀山',
-    'DSN': '鄂尔多斯伊金霍洛', 'ZBDS': '鄂尔多斯伊金霍洛', 'DOY': '东营胜利', 'ZSDY': '东营胜利',
-    'YCU': '运城张孝', 'ZBYC': '运城张孝', 'LFQ': '临汾尧都', 'ZBLF': '临汾尧都',
-    'SWA': '揭阳潮汕', 'ZGOW': '揭阳潮汕', 'ZUH': '珠海金湾', 'ZGSD': '珠海金湾',
-    'GOQ': '格尔木', 'ZLGM': '格尔木', 'YIN': '伊宁', 'ZWYN': '伊宁',
-    'HTN': '和田', 'ZWAT': '和田', 'HET': '呼和浩特白塔', 'ZBHH': '呼和浩特白塔',
-    'TYN': '太原武宿', 'ZBYN': '太原武宿', 'CGO': '郑州新郑', 'ZHCC': '郑州新郑',
-    'HIA': '淮安涟水', 'ZSSH': '淮安涟水', 'LYG': '连云港花果山', 'ZSLG': '连云港花果山',
-    'LYA': '洛阳北郊', 'ZHLY': '洛阳北郊', 'WNZ': '温州龙湾', 'ZSWZ': '温州龙湾',
-    'NTG': '南通兴东', 'ZSNT': '南通兴东', 'YNT': '烟台蓬莱', 'ZSYT': '烟台蓬莱',
-    'JJN': '泉州晋江', 'ZSQZ': '泉州晋江', 'XUZ': '徐州观音', 'ZSXZ': '徐州观音'
-}
+@traced
+def load_flight_data(airports=None, start=None, end=None):
+    """
+    加载航班数据
+    airports/start/end: 机场与月份范围，如 'KHN', '2025-06', '2025-08'（按分区裁剪读取）
+    """
+    df = prepare_flight_data(FlightStore().scan(airports, start, end).load())
+    print(f"✓ 数据加载: {len(df)}条记录")
+    return df
 
 
-# ==========================================
-# 数据加载
-# ==========================================
-def load_flight_data():
-    df = pd.read_excel('output/khn_flight_processed.xlsx')
+def prepare_flight_data(df):
+    """字段映射（中文列名→英文列名）与延误标识补全"""
     field_mapping = {'起飞机场三字码': 'originAirport', '到达机场三字码': 'destAirport',
                      '小时段': 'hour', '延误分钟': 'delayMin', '航班号': 'flightNo'}
     for cn, en in field_mapping.items():
@@ -81,23 +39,12 @@ def load_flight_data():
 
     if 'isDelay' not in df.columns:
         df['isDelay'] = df['delayMin'] > 0
-
-    print(f"✓ 数据加载: {len(df)}条记录")
     return df
 
 
 def load_airport_coords():
-    """加载并扩展坐标库"""
-    with open('output/airport_coords.json', 'r', encoding='utf-8') as f:
-        coords_original = json.load(f)
-
-    coords_all = {}
-    for code, coord in coords_original.items():
-        coords_all[code] = coord
-        for iata, icao in IATA_TO_ICAO.items():
-            if icao == code:
-                coords_all[iata] = coord
-
+    """机场坐标（IATA+ICAO双索引，取自机场登记表）"""
+    coords_all = get_registry().coords_dict()
     print(f"✓ 坐标库: {len(coords_all)}个机场")
     return coords_all
 
@@ -118,30 +65,28 @@ def haversine_distance(lat1, lon1, lat2, lon2):
 # ==========================================
 # 图3-7: 地理分布（中文名称版）
 # ==========================================
-def plot_geo_distribution_enhanced(df, airport_coords):
-    if not airport_coords:
-        return None
-
+@traced
+def destination_stats(cube, airport_coords):
+    """
+    昌北出港各目的地统计（平均延误、航班量、距离、早高峰延误占比），由立方体上卷
+    返回 (目的地统计表, 南昌坐标)
+    """
     # 筛选数据
-    df_outbound = df[df['originAirport'] == 'KHN'].copy()
-    print(f"\n✓ 昌北出港: {len(df_outbound):,}条")
-
-    # 转换目的地代码
-    def convert_dest(dest):
-        if dest in airport_coords:
-            return dest
-        return IATA_TO_ICAO.get(dest, None)
+    cube_outbound = cube[cube['起飞机场三字码'] == 'KHN']
+    print(f"\n✓ 昌北出港: {int(cube_outbound['count'].sum()):,}条")
 
-    df_outbound['destAirport'] = df_outbound['destAirport'].apply(convert_dest)
-    df_outbound = df_outbound.dropna(subset=['destAirport'])
-    df_outbound = df_outbound[df_outbound['destAirport'].isin(airport_coords.keys())]
+    # 目的地代码统一为ICAO（登记表向量化关联）
+    dest_icao = get_registry().join(cube_outbound['到达机场三字码'], fields=['icao'])['icao']
+    cube_outbound = cube_outbound.assign(destAirport=dest_icao)
+    cube_outbound = cube_outbound[cube_outbound['destAirport'].isin(airport_coords.keys())]
 
     # 统计
-    dest_stats = df_outbound.groupby('destAirport').agg(
-        avg_delay=('delayMin', 'mean'),
-        flight_count=('flightNo', 'count'),
-        delay_flight_count=('isDelay', 'sum')
-    ).round(2)
+    dest_cube = rollup(cube_outbound, 'destAirport')
+    dest_stats = pd.DataFrame({
+        'avg_delay': dest_cube['mean_delay'],
+        'flight_count': dest_cube['count'],
+        'delay_flight_count': dest_cube['n_delayed']
+    }).round(2)
 
     # 获取南昌坐标（优先KHN）
     khn_code = 'KHN' if 'KHN' in airport_coords else 'ZSCN'
@@ -155,13 +100,13 @@ def plot_geo_distribution_enhanced(df, airport_coords):
         )
     )
 
-    # 早高峰分析
-    morning_df = df_outbound[(df_outbound['hour'] >= 8) & (df_outbound['hour'] < 10)]
-    if len(morning_df) > 0:
-        morning_stats = morning_df.groupby('destAirport').agg(
-            morning_total=('flightNo', 'count'),
-            morning_delay=('isDelay', 'sum')
-        ).fillna(0)
+    # 早高峰分析（08:00-10:00）
+    morning_cube = rollup(cube_outbound, 'destAirport', where={'小时段': [8, 9]})
+    if len(morning_cube) > 0:
+        morning_stats = pd.DataFrame({
+            'morning_total': morning_cube['count'],
+            'morning_delay': morning_cube['n_delayed']
+        })
 
         dest_stats = dest_stats.join(morning_stats, how='left').fillna(0)
 
@@ -173,6 +118,18 @@ def plot_geo_distribution_enhanced(df, airport_coords):
         dest_stats['morning_total'] = 0
         dest_stats['morning_delay'] = 0
         dest_stats['morning_delay_ratio'] = 0.0
+    return dest_stats, khn_coord
+
+
+@traced('图3-7')
+def plot_geo_distribution_enhanced(df, airport_coords, cube=None):
+    """
+    图3-7：昌北出港延误地理分布
+    目的地统计由预聚合立方体上卷（cube为None时由df构建）
+    """
+    if not airport_coords:
+        return None
+    dest_stats, khn_coord = destination_stats(get_cube(df, cube), airport_coords)
 
     print(f"  - 有效目的地: {len(dest_stats)}个")
 
@@ -202,7 +159,7 @@ def plot_geo_distribution_enhanced(df, airport_coords):
     lines_data = []
     for dest, row in dest_stats.iterrows():
         # 获取中文名称
-        dest_name_cn = AIRPORT_NAMES.get(dest, dest)
+        dest_name_cn = get_registry().name_of(dest)
         lines_data.append({
             "coords": [
                 [khn_coord['lon'], khn_coord['lat']],
@@ -243,7 +200,7 @@ def plot_geo_distribution_enhanced(df, airport_coords):
     scatter_data = []
     for dest, row in dest_stats.iterrows():
         # 获取中文名称
-        dest_name_cn = AIRPORT_NAMES.get(dest, dest)
+        dest_name_cn = get_registry().name_of(dest)
 
         if row['avg_delay'] > 30:
             symbol_size, color = 40, "#e74c3c"
@@ -354,7 +311,7 @@ def plot_geo_distribution_enhanced(df, airport_coords):
     # 渲染
     # ==========================================
     output_path = 'output/figures/图3-7_地理分布.html'
-    geo.render(output_path)
+    render_figure(geo, output_path)
 
     print(f"\n✓ 图3-7 已生成: {output_path}")
     print(f"  - 覆盖目的地: {len(scatter_data)}个机场")
@@ -395,9 +352,9 @@ def plot_geo_distribution_enhanced(df, airport_coords):
     top3 = dest_stats.nlargest(3, 'avg_delay')
     print("2️⃣ 延误最高TOP3航线:")
     for i, (dest, row) in enumerate(top3.iterrows(), 1):
-        iata_name = [k for k, v in IATA_TO_ICAO.items() if v == dest]
-        name = f"{iata_name[0]}({dest})" if iata_name else dest
-        name_cn = AIRPORT_NAMES.get(dest, dest)
+        iata = get_registry().to_iata(dest)
+        name = f"{iata}({dest})" if iata else dest
+        name_cn = get_registry().name_of(dest)
         print(f"   {i}. {name_cn} {name}: {row['avg_delay']:.1f}分钟 ({row['flight_count']:.0f}架次)")
 
     # 相关性分析
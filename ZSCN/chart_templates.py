@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+图表模板缓存渲染（第三章图表按月份、航司等批量生成变体时使用）
+
+直接渲染每个变体都要重建整套pyecharts对象（InitOpts、TitleOpts、坐标轴、JsCode格式化函数等），
+再经render()序列化配置、渲染Jinja页面。批量生成上百个变体时，这部分开销远大于数据本身。
+
+ChartTemplate 用一份样例数据构建一次图表，把配置中的数据位置（“槽”）换成占位标记后序列化，
+并把Jinja页面渲染成“页头 + 配置 + 页尾”三段，一并缓存；渲染变体时只序列化各槽的数据，
+与静态片段拼接后写出，每个变体为毫秒级。
+
+槽定义：{槽名: (配置路径, 取值函数)}，如 {'subtitle': (('title', 0, 'subtext'), lambda d: d['subtitle'])}
+取值函数由变体数据算出该位置的配置值（须与构建函数写入配置的形式一致，如折线的[x, y]数据对）。
+编译时逐槽核对：样例数据的取值函数结果必须与构建结果完全一致，否则报错，模板不会与直接构建的结果不一致。
+构建函数中依赖数据的部分只能出现在槽内——JsCode等静态部分不能内嵌数据（如按名称而非序号高亮）。
+"""
+
+import re
+from pathlib import Path
+
+from pyecharts.charts import base as _chart_base
+from pyecharts.commons.utils import replace_placeholder
+
+from tracing import record_output, span
+
+_SLOT = '--slot--{}--'
+_SLOT_PATTERN = re.compile(r'"--slot--(\w+)--"')
+_OPTIONS_TOKEN = '--chart-options--'
+
+_TEMPLATES = {}  # 进程内已编译的模板：{模板名: ChartTemplate}
+
+
+def _dumps(value):
+    """紧凑JSON（与figure_payload.render_figure相同的编码方式）"""
+    return _chart_base.json.dumps(value, separators=(',', ':'), default=_chart_base.default, ignore_nan=True)
+
+
+def _plain(value):
+    """转为纯JSON结构（配置对象展开、JsCode保留占位标记），用于核对与定位槽"""
+    return _chart_base.json.loads(_dumps(value))
+
+
+class ChartTemplate:
+    """
+    由构建函数编译的图表模板
+    build: 变体数据 → pyecharts图表；slots: 槽定义（见模块说明）；sample: 编译用的样例数据
+    """
+
+    def __init__(self, build, slots, sample):
+        self.slots = dict(slots)
+        chart = build(sample)
+        options = _plain(chart.get_options())
+        for name, (path, value) in self.slots.items():
+            parent = options
+            for key in path[:-1]:
+                parent = parent[key]
+            expected = _plain(value(sample))
+            if parent[path[-1]] != expected:
+                raise ValueError(f"模板槽 {name} 与构建结果不一致（路径 {path}）")
+            parent[path[-1]] = _SLOT.format(name)
+
+        # 配置：静态片段与槽名交替（偶数位为静态片段，奇数位为槽名）
+        self._parts = _SLOT_PATTERN.split(replace_placeholder(_dumps(options)))
+        # 页面：渲染一次Jinja模板，配置位置留空
+        chart.dump_options = lambda: _OPTIONS_TOKEN
+        self._head, self._tail = chart.render_embed().split(_OPTIONS_TOKEN)
+
+    def options_json(self, data):
+        """变体的配置JSON：只序列化各槽的数据"""
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = _dumps(self.slots[parts[i]][1](data))
+        return ''.join(parts)
+
+    def render_embed(self, data):
+        return self._head + self.options_json(data) + self._tail
+
+    def render(self, data, path):
+        """写出变体HTML，返回路径"""
+        path = Path(path)
+        with span('render_template', 'pyecharts', path=str(path)):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(self.render_embed(data), encoding='utf-8')
+            record_output(path)
+        return path
+
+
+def get_template(name, build, slots, sample):
+    """取已编译的模板，未编译时用sample编译并缓存（同一进程内每个模板名只编译一次）"""
+    template = _TEMPLATES.get(name)
+    if template is None:
+        template = _TEMPLATES[name] = ChartTemplate(build, slots, sample)
+    return template
+
+
+def clear_templates():
+    _TEMPLATES.clear()
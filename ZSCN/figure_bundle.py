@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+第三章图表离线合集（单页HTML，共用一份本地ECharts，图表滚动到可视区域时才初始化）
+
+各图表HTML单独引用在线ECharts（图3-7另引用china地图），离线无法打开；逐页打开时每页各自
+加载、解析一遍约1MB的echarts.min.js。build_bundle 把 output/figures/ 下的图3-x页面合成一页：
+- 资源：ECharts与地图脚本从本地vendor目录（VENDOR_DIR，即 ZSCN/assets/）复制到合集旁的
+  assets/ 目录，页面只引用相对路径，完全离线。构建过程不联网：vendor目录缺少任一所需文件时
+  build_bundle 报错且不写出页面（避免生成无法渲染的合集）。
+  准备vendor目录：将 echarts.min.js、maps/china.js 放入 ZSCN/assets/，
+  或在可联网时显式运行 python figure_bundle.py --fetch-assets，按各图表页面引用的原地址下载一次。
+- 懒加载：各图的初始化脚本原样包进函数（浏览器只预解析函数体，配置对象在调用时才创建），
+  IntersectionObserver 在图表进入可视区域（上下各预留PRELOAD_MARGIN）时才加载所需脚本
+  （echarts.min.js、地图脚本按需加载，各加载一次）并初始化；离开该区域时dispose释放画布，
+  同时存活的图表只有可视区域附近的几张，内存与图表数量无关。
+- 图表占位的div保留原宽高，初始化前后页面布局不变。
+
+运行方式：
+    python figure_bundle.py               # 由 output/figures/图3-*.html 生成 output/figures/图3_图表合集.html
+    python figure_bundle.py --fetch-assets  # 下载vendor目录缺少的资源（需联网，之后离线构建）
+"""
+
+import json
+import os
+import re
+import shutil
+import urllib.request
+from pathlib import Path
+from string import Template
+
+from figure_payload import report_payload
+from tracing import record_output, traced
+
+FIGURES_DIR = Path('output/figures')
+BUNDLE_PATH = FIGURES_DIR / '图3_图表合集.html'
+FIGURE_PATTERN = '图3-*.html'   # 默认收录的图表页面（分组变体在子目录中，不收录）
+VENDOR_DIR = 'assets'          # 本地vendor目录：echarts.min.js、maps/china.js 等
+ASSET_SUBDIR = 'assets'        # 合集旁的资源目录（页面内相对路径）
+PRELOAD_MARGIN = '50%'         # 可视区域上下预留的初始化距离（IntersectionObserver rootMargin）
+
+_SCRIPT_SRC = re.compile(r'<script type="text/javascript" src="([^"]+)"></script>')
+_CHART_DIV = re.compile(r'<div id="(\w+)" class="chart-container" style="([^"]*)"></div>')
+_INLINE_SCRIPT = re.compile(r'<script>\s*(.*?)\s*</script>', re.S)
+
+_PAGE = Template('''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>$title</title>
+    <style>
+        body { margin: 0; font-family: SimHei, sans-serif; background: #fafafa; }
+        nav { position: sticky; top: 0; z-index: 10; padding: 10px 20px; background: #fff; border-bottom: 1px solid #ddd; }
+        nav a { margin-right: 16px; color: #2c3e50; text-decoration: none; font-size: 14px; }
+        section { padding: 24px 0; border-bottom: 1px solid #eee; }
+        h2 { margin: 0 0 12px; text-align: center; font-size: 18px; color: #2c3e50; }
+        .chart-container { margin: 0 auto; background: #fff; }
+    </style>
+</head>
+<body>
+    <nav>$nav</nav>
+$sections
+    <script>
+        var FIGURES = {};
+$figures
+        (function () {
+            var scripts = {}, live = {};
+            function load(src) {
+                if (!scripts[src]) {
+                    scripts[src] = new Promise(function (resolve, reject) {
+                        var tag = document.createElement('script');
+                        tag.src = src;
+                        tag.onload = resolve;
+                        tag.onerror = function () { reject(src); };
+                        document.head.appendChild(tag);
+                    });
+                }
+                return scripts[src];
+            }
+            // 依次加载（地图脚本依赖echarts），每个脚本全页只加载一次
+            function loadAll(deps) {
+                return deps.reduce(function (ready, src) {
+                    return ready.then(function () { return load(src); });
+                }, Promise.resolve());
+            }
+            function show(id) {
+                if (live[id]) return;
+                live[id] = 'loading';
+                loadAll(FIGURES[id].deps).then(function () {
+                    if (live[id] === 'loading') live[id] = FIGURES[id].init();
+                }, function (src) {
+                    delete live[id];
+                    document.getElementById(id).textContent = '⚠ 未找到 ' + src + '（离线资源缺失）';
+                });
+            }
+            function hide(id) {
+                var chart = live[id];
+                delete live[id];
+                if (chart && chart !== 'loading') chart.dispose();
+            }
+            var ids = Object.keys(FIGURES);
+            if (!('IntersectionObserver' in window)) {
+                ids.forEach(show);
+                return;
+            }
+            var observer = new IntersectionObserver(function (entries) {
+                entries.forEach(function (entry) {
+                    (entry.isIntersecting ? show : hide)(entry.target.id);
+                });
+            }, {rootMargin: '$margin 0px'});
+            ids.forEach(function (id) { observer.observe(document.getElementById(id)); });
+        })();
+    </script>
+</body>
+</html>
+''')
+
+
+def _figure_key(path):
+    """按图号排序（图3-10排在图3-9之后）"""
+    number = re.match(r'图(\d+)-(\d+)', Path(path).stem)
+    return (int(number.group(1)), int(number.group(2))) if number else (float('inf'), 0)
+
+
+def _asset_name(url):
+    """资源在assets目录中的相对路径：地图保留maps/子目录，其余取文件名"""
+    return url[url.index('maps/'):] if 'maps/' in url else url.rsplit('/', 1)[-1]
+
+
+def parse_figure(path):
+    """
+    解析pyecharts页面：返回(依赖脚本地址列表, [(图表id, div样式, 初始化脚本)])
+    初始化脚本为该图表div之后、下一个图表div之前的全部内联脚本（含地图注册等）
+    """
+    html = Path(path).read_text(encoding='utf-8')
+    head, body = html.split('<body', 1)
+    deps = _SCRIPT_SRC.findall(head)
+    divs = list(_CHART_DIV.finditer(body))
+    charts = []
+    for i, div in enumerate(divs):
+        stop = divs[i + 1].start() if i + 1 < len(divs) else len(body)
+        scripts = _INLINE_SCRIPT.findall(body, div.end(), stop)
+        charts.append((div.group(1), div.group(2), '\n'.join(scripts)))
+    if not charts:
+        raise ValueError(f"{path} 中未找到图表")
+    return deps, charts
+
+
+def required_assets(paths):
+    """各图表页面引用的资源：{assets内相对路径: 原地址}"""
+    assets = {}
+    for path in paths:
+        for url in parse_figure(path)[0]:
+            assets.setdefault(_asset_name(url), url)
+    return assets
+
+
+def _figure_paths(paths, output_path=BUNDLE_PATH):
+    """收录的图表页面（默认与合集同目录的图3-*.html），按图号排序"""
+    if paths is None:
+        paths = Path(output_path).parent.glob(FIGURE_PATTERN)
+    return sorted((Path(p) for p in paths), key=_figure_key)
+
+
+def vendor_asset(name, dest_dir, vendor_dir=VENDOR_DIR):
+    """把vendor目录中的资源复制到合集的assets目录（不联网），返回目标路径"""
+    source = Path(vendor_dir) / name
+    target = Path(dest_dir) / name
+    if not target.exists() or target.stat().st_size != source.stat().st_size:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, target)
+    return target
+
+
+def fetch_assets(paths=None, vendor_dir=VENDOR_DIR):
+    """
+    显式下载步骤：按图表页面引用的原地址下载vendor目录缺少的资源（已存在的不重复下载）
+    返回下载失败的资源名列表
+    """
+    failed = []
+    for name, url in required_assets(_figure_paths(paths)).items():
+        source = Path(vendor_dir) / name
+        if source.exists():
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+        except OSError as e:
+            print(f"✗ 下载失败 {url}（{e}）")
+            failed.append(name)
+            continue
+        source.parent.mkdir(parents=True, exist_ok=True)
+        source.write_bytes(content)
+        print(f"✓ 已下载 {name} 至 {source}")
+    return failed
+
+
+@traced('图表合集')
+def build_bundle(paths=None, output_path=BUNDLE_PATH, vendor_dir=VENDOR_DIR, title='第三章 延误可视化图表合集'):
+    """
+    把各图表页面合成单页离线合集
+    paths: 图表HTML路径（默认 output/figures/图3-*.html，按图号排序）
+    vendor目录缺少所需资源时抛出FileNotFoundError，不写出页面
+    返回(合集路径, 资源路径列表)
+    """
+    output_path = Path(output_path)
+    paths = _figure_paths(paths, output_path)
+    asset_dir = output_path.parent / ASSET_SUBDIR
+
+    assets = required_assets(paths)
+    missing = [name for name in assets if not (Path(vendor_dir) / name).exists()]
+    if missing:
+        raise FileNotFoundError(f"vendor目录 {vendor_dir}/ 缺少离线资源: {missing}；请放入这些文件，"
+                                f"或运行 python figure_bundle.py --fetch-assets 下载后重新生成")
+    asset_paths = [vendor_asset(name, asset_dir, vendor_dir) for name in assets]
+
+    nav, sections, figures = [], [], []
+    for path in paths:
+        deps, charts = parse_figure(path)
+        local = [f'{ASSET_SUBDIR}/{_asset_name(url)}' for url in deps]
+        label = path.stem.replace('_', ' ', 1)
+        anchor = path.stem.split('_')[0]
+        nav.append(f'<a href="#{anchor}">{label}</a>')
+        divs = ''.join(f'\n        <div id="{chart_id}" class="chart-container" style="{style}"></div>'
+                       for chart_id, style, _ in charts)
+        sections.append(f'    <section id="{anchor}">\n        <h2>{label}</h2>{divs}\n    </section>')
+        for chart_id, _, script in charts:
+            figures.append(f"        FIGURES['{chart_id}'] = {{deps: {json.dumps(local)}, init: function () {{\n"
+                           f"        {script}\n"
+                           f"        return chart_{chart_id};\n"
+                           f"        }}}};")
+
+    page = _PAGE.substitute(title=title, nav='\n        '.join(nav), sections='\n'.join(sections),
+                            figures='\n'.join(figures), margin=PRELOAD_MARGIN)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(page, encoding='utf-8')
+    record_output(output_path, *asset_paths)
+
+    print(f"✅ 图表合集生成完成：{len(paths)}张图表，共用资源 {len(asset_paths)}个（{', '.join(assets)}）")
+    print(f"  - 文件路径: {os.path.abspath(output_path)}")
+    report_payload(output_path)
+    return output_path, asset_paths
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='第三章图表离线合集')
+    parser.add_argument('--fetch-assets', action='store_true',
+                        help=f'下载 {VENDOR_DIR}/ 缺少的资源（需联网），不生成合集')
+    args = parser.parse_args()
+
+    if args.fetch_assets:
+        failed = fetch_assets()
+        raise SystemExit(1 if failed else 0)
+
+    print("=" * 60)
+    print("开始生成第三章图表离线合集")
+    print("=" * 60)
+
+    build_bundle()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+图表数据载荷控制（第三章pyecharts HTML图表共用）
+
+pyecharts把全部数据点写进HTML，数据量随航班行数增长，全年多机场数据下单个图表可达数十MB。
+图表构建时先压缩数据，再按字节预算写出：
+- 散点：bin_scatter 按数据分位数划分网格（稠密区域网格细、稀疏区域粗），每个非空格子输出一个
+  加权质心及频次；不同(x, y)组合数不超过上限时原样输出（与逐点聚合一致）。
+  sample_points 按同样的网格分层抽样（各格子配额与行数成比例，最大余数法取整），保留密度分布，
+  用于需要落在真实坐标上的个别点（如异常值）。
+- 二维密度：density_grid 在固定范围、固定分箱宽度上一次算出各分组的二维直方图，
+  输出格子数只取决于分辨率，与行数无关（热力图模式）。
+- 折线：lttb（Largest-Triangle-Three-Buckets）保留折线形状的降采样，首尾点必选。
+- 写出：render_figure 以紧凑JSON（无缩进）写出配置，并报告HTML字节数与该图预算（FIGURE_BUDGETS）。
+"""
+
+import functools
+import math
+from pathlib import Path
+
+import numpy as np
+from pyecharts.charts import base as _chart_base
+from pyecharts.commons.utils import replace_placeholder
+
+from tracing import traced_render
+
+SCATTER_MAX_POINTS = 1500  # 每个散点序列的点数上限
+LINE_MAX_POINTS = 500      # 每条折线的点数上限
+DEFAULT_SEED = 2025
+
+# 各图HTML大小预算（KB，按文件名前缀匹配）
+FIGURE_BUDGETS = {
+    '图3-1': 40,
+    '图3-2': 40,
+    '图3-3': 40,
+    '图3-4': 40,
+    '图3-5': 40,
+    '图3-6': 200,
+    '图3-7': 150,
+    '图3': 550,  # 图表合集（figure_bundle）：各图预算之和
+}
+DEFAULT_BUDGET = 200
+
+
+# ==========================================
+# 散点：分位数网格聚合 / 分层抽样
+# ==========================================
+def _quantile_edges(values, n_bins):
+    """按分位数划分的分箱边界（重复边界合并，离散取值不会被拆开）"""
+    return np.unique(np.quantile(values, np.linspace(0, 1, max(n_bins, 1) + 1)))
+
+
+def _bin_index(values, edges):
+    return np.searchsorted(edges[1:-1], values, side='right')
+
+
+def grid_cells(x, y, max_cells):
+    """分位数网格的格子编码：两个方向各约√max_cells个分箱，某方向不同取值较少时把余量让给另一方向"""
+    side = max(math.isqrt(max_cells), 1)
+    x_edges = _quantile_edges(x, side)
+    y_edges = _quantile_edges(y, max_cells // max(len(x_edges) - 1, 1))
+    if len(y_edges) - 1 < side:
+        x_edges = _quantile_edges(x, max_cells // max(len(y_edges) - 1, 1))
+    ny = max(len(y_edges) - 1, 1)
+    return _bin_index(x, x_edges) * ny + _bin_index(y, y_edges)
+
+
+def _pair_codes(x, y):
+    """(x, y)组合编码，返回(编码, 不同组合数)"""
+    _, x_codes = np.unique(x, return_inverse=True)
+    _, y_codes = np.unique(y, return_inverse=True)
+    keys = x_codes.astype(np.int64) * (int(y_codes.max()) + 1) + y_codes
+    _, codes = np.unique(keys, return_inverse=True)
+    return codes, int(codes.max()) + 1
+
+
+def bin_scatter(x, y, weights=None, max_points=SCATTER_MAX_POINTS):
+    """
+    散点聚合：返回(质心x, 质心y, 频次)三个数组，点数不超过max_points
+    不同(x, y)组合数不超过max_points时每个组合一个点（坐标即原值），否则按分位数网格聚合为加权质心
+    weights: 每行的频次（默认1）
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    weights = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(x) == 0:
+        return x, y, weights
+
+    codes, n_cells = _pair_codes(x, y)
+    if n_cells > max_points:
+        _, codes = np.unique(grid_cells(x, y, max_points), return_inverse=True)
+        n_cells = int(codes.max()) + 1
+    totals = np.bincount(codes, weights=weights, minlength=n_cells)
+    occupied = totals > 0
+    totals = totals[occupied]
+    cx = np.bincount(codes, weights=weights * x, minlength=n_cells)[occupied] / totals
+    cy = np.bincount(codes, weights=weights * y, minlength=n_cells)[occupied] / totals
+    return cx, cy, totals
+
+
+def sample_points(x, y, n, seed=DEFAULT_SEED):
+    """
+    密度保持的分层抽样：返回抽中行的位置（升序），行数不超过n时返回全部
+    按分位数网格分层，各格子配额与行数成比例（最大余数法），格子内随机抽取
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= n:
+        return np.arange(len(x))
+
+    _, cells = np.unique(grid_cells(x, y, n), return_inverse=True)
+    counts = np.bincount(cells)
+    exact = counts * n / len(x)
+    quota = np.floor(exact).astype(np.int64)
+    remainder = n - quota.sum()
+    if remainder > 0:
+        quota[np.argsort(quota - exact, kind='stable')[:remainder]] += 1
+
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(x)), cells))
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(len(x)) - starts[cells[order]]
+    return np.sort(order[rank < quota[cells[order]]])
+
+
+def density_grid(x, y, x_range, y_range, x_bin, y_bin, codes=None, n_groups=1):
+    """
+    分组二维直方图（同np.histogram2d的左闭右开分箱，最后一个分箱含右端点）
+    x_range/y_range: (下限, 上限)；x_bin/y_bin: 分箱宽度；范围外的行不计入
+    codes: 每行的分组编码（0..n_groups−1，-1表示不计入），默认全部为一组
+    返回(频次数组[分组, x分箱, y分箱], x边界, y边界)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    codes = np.zeros(len(x), dtype=np.int64) if codes is None else np.asarray(codes, dtype=np.int64)
+    x_edges = np.arange(x_range[0], x_range[1] + x_bin / 2, x_bin, dtype=np.float64)
+    y_edges = np.arange(y_range[0], y_range[1] + y_bin / 2, y_bin, dtype=np.float64)
+    nx, ny = len(x_edges) - 1, len(y_edges) - 1
+
+    ix = np.minimum(np.floor((x - x_edges[0]) / x_bin), nx - 1)
+    iy = np.minimum(np.floor((y - y_edges[0]) / y_bin), ny - 1)
+    valid = ((codes >= 0) & (x >= x_edges[0]) & (x <= x_edges[-1]) &
+             (y >= y_edges[0]) & (y <= y_edges[-1]))
+    cells = (codes[valid] * nx + ix[valid].astype(np.int64)) * ny + iy[valid].astype(np.int64)
+    counts = np.bincount(cells, minlength=n_groups * nx * ny).reshape(n_groups, nx, ny)
+    return counts, x_edges, y_edges
+
+
+# ==========================================
+# 折线：LTTB降采样
+# ==========================================
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets降采样，返回保留点的位置（升序，含首尾）
+    中间点均分为n_out−2个桶，每桶取与“上一保留点、下一桶均值点”构成三角形面积最大的点
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    bounds = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        next_stop = bounds[i + 2] if i + 2 < len(bounds) else n
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous]) -
+                      (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_line(y, max_points=LINE_MAX_POINTS, x=None):
+    """折线降采样：点数不超过max_points时原样返回全部位置；x默认为序号（类目轴）"""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    x = np.arange(n) if x is None else x
+    return lttb(x, y, max_points)
+
+
+# ==========================================
+# 写出与字节预算
+# ==========================================
+def _compact_options(chart):
+    """与Base.dump_options相同，但不缩进（数据点多时缩进约占一半字节）"""
+    return replace_placeholder(_chart_base.json.dumps(chart.get_options(), separators=(',', ':'),
+                                                      default=_chart_base.default, ignore_nan=True))
+
+
+def figure_budget(path):
+    """按文件名前缀（如“图3-6”）取大小预算（KB）"""
+    return FIGURE_BUDGETS.get(Path(path).stem.split('_')[0], DEFAULT_BUDGET)
+
+
+def report_payload(path, budget=None):
+    """打印HTML大小与预算（KB），返回(字节数, 预算字节数)"""
+    budget = figure_budget(path) if budget is None else budget
+    size = Path(path).stat().st_size
+    status = '✓' if size <= budget * 1024 else '⚠ 超出预算'
+    print(f"📦 {Path(path).name}: {size / 1024:.1f}KB / 预算 {budget}KB {status}")
+    return size, budget * 1024
+
+
+def render_figure(chart, path, budget=None):
+    """以紧凑JSON写出图表HTML（经traced_render记录跨度），并报告大小预算（budget单位KB，默认按FIGURE_BUDGETS）"""
+    chart.dump_options = functools.partial(_compact_options, chart)
+    result = traced_render(chart, path)
+    report_payload(path, budget)
+    return result
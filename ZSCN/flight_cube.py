@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+航班延误预聚合立方体（第二章处理后生成，第三章图表与核查脚本共用）
+
+维度：月份 × 起飞机场 × 到达机场 × 航司 × 机型 × 小时段 × 星期
+度量：均为可加量（航班数、延误分钟和、平方和、各阈值计数），另含可合并的最小/最大延误，
+      任意维度组合的均值、标准差、延误率、正常率都可由上卷结果精确算出。
+
+process_data 在衍生字段后构建一次并写出 output/khn_flight_cube.parquet，
+同时按 airport=XXX/month=YYYY-MM 分区写出（与航班分区、分位数摘要一致，流式处理各月份分别写出）；
+load_cube 指定机场/月份时裁剪并合并分区，多个机场分别入库互不覆盖。
+图表按需上卷（rollup），渲染开销只与维度组合数有关，与原始行数无关。
+立方体之间可直接合并（merge_cubes）。
+中位数、分位数等非可加统计量仍需原始行。
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from flight_io import (PROCESSED_XLSX, HAS_PYARROW, apply_schema, empty_flights, list_partitions,
+                       load_processed_flights, partition_mask, scope_partitions, shared_owners)
+from kpi import DELAY_THRESHOLD, NORMAL_THRESHOLD
+from tracing import record_output, traced
+
+CUBE_PATH = Path('output/khn_flight_cube.parquet')
+CUBE_DIR = Path('output/cube')  # 立方体分区：airport=XXX/month=YYYY-MM/part-*.parquet
+
+DIMENSIONS = ['月份', '起飞机场三字码', '到达机场三字码', '所属航司代码', '机型', '小时段', '星期']
+
+# 可加度量
+ADDITIVE_MEASURES = [
+    'count',         # 航班数
+    'delay_sum',     # delayMin之和
+    'delay_sq_sum',  # delayMin平方和（用于方差/标准差）
+    'n_late',        # delayMin>0
+    'n_delayed',     # isDelay（delayMin>延误阈值）
+    'n_normal',      # 延误等级为准点/轻微/中度（民航正常航班口径，即delayMin≤kpi.NORMAL_THRESHOLD）
+    'n_severe',      # delayMin>严重延误阈值
+    'n_anomaly',     # is_anomaly（|delayMin|>异常阈值）
+    'n_cancelled',   # is_cancelled
+]
+# 可合并的极值度量
+EXTREMA_MEASURES = {'delay_min': 'min', 'delay_max': 'max'}
+
+
+@traced
+def build_cube(df, severe_threshold=180):
+    """
+    由处理后航班表构建立方体（一次groupby）
+    severe_threshold: n_severe的延误阈值（分钟），与process_data.ANOMALY_THRESHOLD一致
+    """
+    delay = df['delayMin'].to_numpy()
+    frame = pd.DataFrame({
+        '月份': df['计划起飞时间'].dt.to_period('M'),
+        '起飞机场三字码': df['起飞机场三字码'],
+        '到达机场三字码': df['到达机场三字码'],
+        '所属航司代码': df['所属航司代码'],
+        '机型': df['机型'],
+        '小时段': df['小时段'],
+        '星期': df['星期'],
+        'count': np.ones(len(df), dtype=np.int64),
+        'delay_sum': delay.astype(np.int64),
+        'delay_sq_sum': delay.astype(np.float64) ** 2,
+        'n_late': delay > 0,
+        'n_delayed': df['isDelay'].to_numpy(),
+        'n_normal': (df['延误等级'] != '重度').to_numpy(),
+        'n_severe': delay > severe_threshold,
+        'n_anomaly': df['is_anomaly'].to_numpy(),
+        'n_cancelled': df['is_cancelled'].to_numpy(),
+        'delay_min': delay,
+        'delay_max': delay,
+    })
+    cube = _aggregate(frame, DIMENSIONS)
+    cube['月份'] = cube['月份'].astype(str).astype('category')
+    return cube
+
+
+def _aggregate(frame, by):
+    """按维度汇总度量：可加量求和，极值取min/max"""
+    spec = {m: 'sum' for m in ADDITIVE_MEASURES}
+    spec.update(EXTREMA_MEASURES)
+    if not by:
+        return pd.DataFrame({m: [frame[m].agg(func)] for m, func in spec.items()})
+    return frame.groupby(by, observed=True, dropna=False, sort=True).agg(spec).reset_index()
+
+
+@traced
+def merge_cubes(cubes):
+    """合并多个立方体（如多个数据块、多个月份）"""
+    cube = apply_schema(_aggregate(pd.concat(cubes, ignore_index=True), DIMENSIONS))
+    cube['月份'] = cube['月份'].astype('category')
+    return cube
+
+
+@traced
+def save_cube(cube, path=CUBE_PATH):
+    """写出立方体（Parquet，未安装pyarrow时跳过）"""
+    if not HAS_PYARROW:
+        print("⚠ 未安装pyarrow，跳过立方体写出")
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cube.to_parquet(path, index=False)
+    record_output(path)
+    print(f"✅ 预聚合立方体已保存: {path}（{len(cube)}个维度组合）")
+    return path
+
+
+@traced
+def write_cube_partitions(cube, airport, cube_dir=CUBE_DIR, part_name='part-00000', replace=True):
+    """
+    按 airport=XXX/month=YYYY-MM 分区写出立方体（月份本身是立方体维度，直接按其拆分）
+    airport: 数据所属机场；replace: 写入前清空命中分区内的旧文件
+    """
+    if not HAS_PYARROW:
+        print("⚠ 未安装pyarrow，跳过立方体分区写出")
+        return []
+    months = cube['月份'].astype(str).replace({'NaT': 'unknown', 'nan': 'unknown'})
+    written = []
+    for month, part in cube.groupby(months, sort=True):
+        part_dir = Path(cube_dir) / f'airport={airport}' / f'month={month}'
+        part_dir.mkdir(parents=True, exist_ok=True)
+        if replace:
+            for old in part_dir.glob('*.parquet'):
+                old.unlink()
+        path = part_dir / f'{part_name}.parquet'
+        part.to_parquet(path, index=False)
+        record_output(path)
+        written.append(path)
+    return written
+
+
+def _load_cube_partitions(airports=None, start=None, end=None, cube_dir=CUBE_DIR):
+    """裁剪并合并立方体分区（机场口径同flight_io.load_partitions：起飞或到达命中，跨机场共有的航班只计一次）"""
+    partitions = scope_partitions(airports, start, end, cube_dir)
+    parts = []
+    for owner, part_dir in partitions:
+        earlier = shared_owners(owner, partitions)
+        for f in sorted(part_dir.glob('*.parquet')):
+            part = pd.read_parquet(f)
+            parts.append(part.loc[partition_mask(part, airports, owner, earlier)])
+    if not parts:  # 无匹配分区：由空航班表构建空立方体（列与类型同build_cube）
+        parts.append(build_cube(empty_flights()))
+    cube = merge_cubes(parts)
+    print(f"✓ 立方体分区: 命中{len(partitions)}个分区，{len(cube)}个维度组合")
+    return cube
+
+
+def _filter(cube, airports=None, start=None, end=None):
+    """机场（起飞或到达命中）与月份范围筛选，月份粒度"""
+    if isinstance(airports, str):
+        airports = [airports]
+    mask = pd.Series(True, index=cube.index)
+    if airports is not None:
+        mask &= cube['起飞机场三字码'].isin(airports) | cube['到达机场三字码'].isin(airports)
+    months = cube['月份'].astype(str)
+    if start is not None:
+        mask &= months >= pd.Timestamp(start).strftime('%Y-%m')
+    if end is not None:
+        mask &= months <= pd.Timestamp(end).strftime('%Y-%m')
+    return cube.loc[mask].reset_index(drop=True)
+
+
+@traced
+def load_cube(airports=None, start=None, end=None, path=CUBE_PATH, cube_dir=CUBE_DIR):
+    """
+    加载立方体（按机场/月份筛选）
+    指定机场/月份且存在立方体分区时裁剪并合并分区（同load_processed_flights读取航班分区）；
+    否则读取整体立方体，缺失或早于处理后数据时由处理后数据重新构建并写出
+    """
+    scoped = airports is not None or start is not None or end is not None
+    if HAS_PYARROW and scoped and list_partitions(cube_dir):
+        return _filter(_load_cube_partitions(airports, start, end, cube_dir), airports, start, end)
+
+    path = Path(path)
+    stale = (not path.exists() or
+             (PROCESSED_XLSX.exists() and path.stat().st_mtime_ns < PROCESSED_XLSX.stat().st_mtime_ns))
+    if stale or not HAS_PYARROW:
+        print(f"⚠ 立方体缺失或已过期，由处理后数据重建: {path}")
+        cube = build_cube(load_processed_flights())
+        save_cube(cube, path)
+    else:
+        cube = pd.read_parquet(path)
+    return _filter(cube, airports, start, end)
+
+
+def rollup(cube, by=(), where=None, normal_threshold=NORMAL_THRESHOLD):
+    """
+    按维度上卷，并补充派生指标（口径同kpi.group_kpis）
+    by: 维度名或列表（空表示总计）
+    where: {维度: 取值或取值列表}，如 {'起飞机场三字码': 'KHN', '小时段': [8, 9]}
+    normal_threshold: 正常率口径，立方体只含两种：NORMAL_THRESHOLD（60分钟）或 DELAY_THRESHOLD（15分钟，即未延误）
+    派生指标：mean_delay、std_delay（样本标准差）、delay_rate/normal_rate/late_rate（%）
+    """
+    normal_counts = {NORMAL_THRESHOLD: 'n_normal', DELAY_THRESHOLD: None}
+    if normal_threshold not in normal_counts:
+        raise ValueError(f"立方体不支持的正常率阈值: {normal_threshold}（可选 {list(normal_counts)}）")
+    by = [by] if isinstance(by, str) else list(by)
+    if where:
+        mask = pd.Series(True, index=cube.index)
+        for dim, value in where.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= cube[dim].isin(values)
+        cube = cube.loc[mask]
+
+    agg = _aggregate(cube, by)
+    if by:
+        agg = agg.set_index(by if len(by) > 1 else by[0])
+
+    n = agg['count'].astype(np.float64)
+    agg['mean_delay'] = agg['delay_sum'] / n
+    variance = (agg['delay_sq_sum'] - agg['delay_sum'].astype(np.float64) ** 2 / n) / (n - 1)
+    agg['std_delay'] = np.sqrt(variance.clip(lower=0)).where(n > 1)
+    agg['delay_rate'] = agg['n_delayed'] / n * 100
+    n_normal = agg['count'] - agg['n_delayed'] if normal_threshold == DELAY_THRESHOLD else agg['n_normal']
+    agg['normal_rate'] = n_normal / n * 100
+    agg['late_rate'] = agg['n_late'] / n * 100
+    return agg
+
+
+def get_cube(df=None, cube=None, airports=None, start=None, end=None):
+    """
+    图表取立方体：已传入cube直接使用；传入df时由df构建；否则从磁盘加载（按机场/月份筛选）
+    """
+    if cube is not None:
+        return cube
+    if df is not None:
+        return build_cube(df)
+    return load_cube(airports, start, end)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+处理后航班数据的统一读写模块
+（毕业论文·第二、三章 图表与核查脚本共用）
+
+process_data.save_all_tables 在写出Excel的同时写出一份列式副本（Parquet）
+及清单文件（manifest），各图表与核查脚本通过 load_processed_flights 读取：
+列式副本存在且未过期时直接读取（支持列裁剪），否则回退到Excel并重建副本。
+
+多月份、多机场数据按 airport=XXX/month=YYYY-MM 分区存放（write_partitions），
+load_partitions 先按机场/日期范围裁剪分区目录，只读取命中的文件；机场口径与全表筛选filter_flights相同
+（起飞或到达机场命中），有无分区数据集结果一致；
+带筛选条件、只取部分列的查询见 flight_store.FlightStore（谓词与列下推到行组读取）。
+
+航班表列类型按 FLIGHT_SCHEMA 声明（apply_schema）：代码类字段为category，
+delayMin/小时段为小整数，时间保持datetime64（内部即int64纪元时间）。
+process_data.derive_fields 产出即为该类型；各读取路径均再套用一次，
+Excel回退或多分区拼接（category合并后退化为object）时自动恢复。
+"""
+
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from aircraft_types import AIRCRAFT_FAMILIES
+from tracing import record_output, traced
+
+try:
+    import pyarrow  # noqa: F401  列式副本依赖pyarrow，未安装时自动回退Excel
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# =============== 路径配置 ===============
+PROCESSED_XLSX = Path('output/khn_flight_processed.xlsx')       # 处理后数据（Excel，论文附件）
+PROCESSED_PARQUET = Path('output/khn_flight_processed.parquet')  # 列式副本
+MANIFEST_PATH = Path('output/khn_flight_processed.manifest.json')  # 副本清单
+DATASET_DIR = Path('output/dataset')  # 分区数据集：airport=XXX/month=YYYY-MM/part-*.parquet
+
+MANIFEST_VERSION = 1
+ROW_GROUP_SIZE = 2048  # Parquet行组行数：数据按计划起飞时间有序，行组统计信息可供flight_store按时间跳过行组
+
+# =============== 列类型声明 ===============
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DELAY_LEVELS = ['准点', '轻微', '中度', '重度']
+
+FLIGHT_SCHEMA = {
+    '航班号': 'category',
+    '起飞机场三字码': 'category',
+    '到达机场三字码': 'category',
+    '机型': 'category',
+    '机型分类': pd.CategoricalDtype(AIRCRAFT_FAMILIES),
+    '所属航司代码': 'category',
+    '计划起飞时间': 'datetime64[ns]',
+    '计划到达时间': 'datetime64[ns]',
+    '实际起飞时间': 'datetime64[ns]',
+    '实际到达时间': 'datetime64[ns]',
+    'delayMin': 'int32',  # 最大值超过int16范围（样本中有10万+分钟的极端记录）
+    'is_anomaly': 'bool',
+    'is_cancelled': 'bool',
+    '延误等级': pd.CategoricalDtype(DELAY_LEVELS, ordered=True),
+    '小时段': 'int8',
+    '星期': pd.CategoricalDtype(WEEKDAYS, ordered=True),
+    'isDelay': 'bool',
+}
+
+# ===================================================
+
+
+def _file_signature(path):
+    """文件签名：大小 + 修改时间（纳秒），用于判断副本是否过期"""
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+@traced
+def write_columnar_cache(df, source_path=PROCESSED_XLSX,
+                         parquet_path=PROCESSED_PARQUET, manifest_path=MANIFEST_PATH):
+    """
+    写出列式副本与清单
+    - 副本：Parquet（保留datetime/bool/category等类型）
+    - 清单：来源Excel签名、行数、列类型、写出时间
+    """
+    if not HAS_PYARROW:
+        print("⚠ 未安装pyarrow，跳过列式副本写出（读取将回退Excel）")
+        return None
+
+    parquet_path = Path(parquet_path)
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(parquet_path, index=False, row_group_size=ROW_GROUP_SIZE)
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'format': 'parquet',
+        'data_file': parquet_path.name,
+        'source_file': str(source_path),
+        'source_signature': _file_signature(source_path) if Path(source_path).exists() else None,
+        'rows': int(len(df)),
+        'columns': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'written_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    record_output(parquet_path, manifest_path)
+
+    print(f"✅ 列式副本已保存: {parquet_path}（{len(df)}行）")
+    return manifest
+
+
+def read_manifest(manifest_path=MANIFEST_PATH):
+    """读取清单，不存在或损坏时返回None"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_fresh(source_path=PROCESSED_XLSX, parquet_path=PROCESSED_PARQUET,
+                   manifest_path=MANIFEST_PATH):
+    """
+    判断列式副本是否可用
+    - 副本与清单均存在、版本一致
+    - 来源Excel存在时，其签名须与清单记录一致（Excel被改写即视为过期）
+    """
+    if not HAS_PYARROW or not Path(parquet_path).exists():
+        return False
+    manifest = read_manifest(manifest_path)
+    if manifest is None or manifest.get('version') != MANIFEST_VERSION:
+        return False
+    if Path(source_path).exists():
+        return manifest.get('source_signature') == _file_signature(source_path)
+    return True
+
+
+def apply_schema(df, schema=FLIGHT_SCHEMA):
+    """按声明转换列类型（只处理存在且类型不一致的列，已符合时不复制数据）"""
+    for col, dtype in schema.items():
+        if col in df.columns and df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def empty_flights(columns=None, schema=FLIGHT_SCHEMA):
+    """按列类型声明构建空表（无匹配数据时返回，不读取任何分区文件）"""
+    columns = list(schema) if columns is None else list(columns)
+    return apply_schema(pd.DataFrame({col: pd.Series(dtype=object) for col in columns}), schema)
+
+
+def _month_key(value):
+    """'2025-07' / '2025-07-15' / Timestamp → '2025-07'，None原样返回"""
+    if value is None:
+        return None
+    return pd.Timestamp(value).strftime('%Y-%m')
+
+
+@traced
+def write_partitions(df, airport, dataset_dir=DATASET_DIR, part_name='part-00000', replace=True):
+    """
+    按 airport=XXX/month=YYYY-MM 分区写出航班数据
+    airport: 数据所属机场（三字码），一份原始数据对应一个机场
+    part_name: 分区内文件名，流式处理时每块使用不同文件名追加
+    replace: 写入前清空命中分区内的旧文件（整月重跑时使用）
+    """
+    if not HAS_PYARROW:
+        print("⚠ 未安装pyarrow，跳过分区数据集写出")
+        return []
+
+    months = df['计划起飞时间'].dt.strftime('%Y-%m').fillna('unknown')
+    written = []
+    for month, part in df.groupby(months, sort=True):
+        part_dir = Path(dataset_dir) / f'airport={airport}' / f'month={month}'
+        part_dir.mkdir(parents=True, exist_ok=True)
+        if replace:
+            for old in part_dir.glob('*.parquet'):
+                old.unlink()
+        path = part_dir / f'{part_name}.parquet'
+        part.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+        record_output(path)
+        written.append(path)
+    return written
+
+
+def list_partitions(dataset_dir=DATASET_DIR):
+    """列出数据集全部分区：[(airport, month, 目录), ...]"""
+    partitions = []
+    for airport_dir in sorted(Path(dataset_dir).glob('airport=*')):
+        for month_dir in sorted(airport_dir.glob('month=*')):
+            partitions.append((airport_dir.name.split('=', 1)[1],
+                               month_dir.name.split('=', 1)[1], month_dir))
+    return partitions
+
+
+def prune_partitions(airports=None, start=None, end=None, dataset_dir=DATASET_DIR):
+    """
+    分区裁剪：仅保留机场命中且月份落在[start, end]内的分区目录
+    start/end 可为 'YYYY-MM' 或 'YYYY-MM-DD'，按月份粒度裁剪
+    """
+    if isinstance(airports, str):
+        airports = [airports]
+    start_month, end_month = _month_key(start), _month_key(end)
+
+    selected = []
+    for airport, month, path in list_partitions(dataset_dir):
+        if airports is not None and airport not in airports:
+            continue
+        if month != 'unknown':
+            if start_month is not None and month < start_month:
+                continue
+            if end_month is not None and month > end_month:
+                continue
+        elif start_month is not None or end_month is not None:
+            continue
+        selected.append(path)
+    return selected
+
+
+def scope_partitions(airports=None, start=None, end=None, dataset_dir=DATASET_DIR):
+    """
+    按查询范围选取分区：[(分区所属机场, 目录), ...]
+    机场口径同filter_flights（起飞或到达命中）：查询的机场均有自己的分区时只读这些分区；
+    有机场没有自己的分区（如只作为KHN航班的到达机场出现）时，其航班散落在其他机场的分区中，
+    改为读取全部机场的分区（仍按月份裁剪），再由 partition_mask 按起降机场筛选
+    """
+    if isinstance(airports, str):
+        airports = [airports]
+    owners = {airport for airport, _, _ in list_partitions(dataset_dir)}
+    by_owner = airports is not None and set(airports) <= owners
+    return [(d.parent.name.split('=', 1)[1], d)
+            for d in prune_partitions(airports if by_owner else None, start, end, dataset_dir)]
+
+
+def shared_owners(owner, partitions):
+    """
+    两端机场均有分区的航班在两处各存一份，只从所属机场排序靠前的分区读取：
+    返回本次读取的分区中排在owner之前的机场（owner分区中与这些机场往来的航班跳过）
+    """
+    return sorted({other for other, _ in partitions if other < owner})
+
+
+def partition_mask(df, airports, owner, earlier):
+    """owner分区内的行级筛选：起飞或到达机场命中airports，且不与earlier中的分区重复"""
+    if isinstance(airports, str):
+        airports = [airports]
+    origin, dest = df['起飞机场三字码'], df['到达机场三字码']
+    mask = pd.Series(True, index=df.index)
+    if airports is not None:
+        mask &= origin.isin(airports) | dest.isin(airports)
+    if earlier:
+        mask &= ~(((origin == owner) & dest.isin(earlier)) | ((dest == owner) & origin.isin(earlier)))
+    return mask
+
+
+@traced
+def load_partitions(airports=None, start=None, end=None, columns=None, dataset_dir=DATASET_DIR):
+    """
+    从分区数据集加载航班数据（先裁剪分区，再读取命中文件）
+    例：load_partitions('KHN', '2025-06', '2025-08') 只读取KHN三个月的分区
+    机场按起飞或到达机场行级筛选（见scope_partitions）；start/end 精确到日时再按计划起飞时间过滤
+    没有匹配的分区时返回空表（与filter_flights一致）
+    """
+    partitions = scope_partitions(airports, start, end, dataset_dir)
+    day_filter = any(v is not None and len(str(v)) > 7 for v in (start, end))
+    read_cols = columns
+    if columns is not None:
+        extra = ['起飞机场三字码', '到达机场三字码'] + (['计划起飞时间'] if day_filter else [])
+        read_cols = list(dict.fromkeys(list(columns) + extra))
+
+    frames = []
+    n_files = 0
+    for owner, part_dir in partitions:
+        earlier = shared_owners(owner, partitions)
+        for f in sorted(part_dir.glob('*.parquet')):
+            part = pd.read_parquet(f, columns=read_cols)
+            frames.append(part.loc[partition_mask(part, airports, owner, earlier)])
+            n_files += 1
+    df = apply_schema(pd.concat(frames, ignore_index=True)) if frames else empty_flights(read_cols)
+
+    if day_filter:
+        mask = pd.Series(True, index=df.index)
+        if start is not None and len(str(start)) > 7:
+            mask &= df['计划起飞时间'] >= pd.Timestamp(start)
+        if end is not None and len(str(end)) > 7:
+            mask &= df['计划起飞时间'] < pd.Timestamp(end) + pd.Timedelta(days=1)
+        df = df.loc[mask].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+
+    print(f"✓ 分区裁剪: 命中{len(partitions)}个分区 / {n_files}个文件，{len(df)}条记录")
+    return df
+
+
+def filter_flights(df, airports=None, start=None, end=None, columns=None):
+    """
+    无分区数据集时的等价行级筛选
+    机场：起飞或到达机场命中即保留；日期：按计划起飞时间（月份或日期粒度）
+    """
+    if isinstance(airports, str):
+        airports = [airports]
+    mask = pd.Series(True, index=df.index)
+    if airports is not None:
+        mask &= df['起飞机场三字码'].isin(airports) | df['到达机场三字码'].isin(airports)
+    if start is not None:
+        lower = pd.Timestamp(start) if len(str(start)) > 7 else pd.Period(start, 'M').start_time
+        mask &= df['计划起飞时间'] >= lower
+    if end is not None:
+        upper = (pd.Timestamp(end) + pd.Timedelta(days=1) if len(str(end)) > 7
+                 else (pd.Period(end, 'M') + 1).start_time)
+        mask &= df['计划起飞时间'] < upper
+    df = df.loc[mask].reset_index(drop=True)
+    return df[list(columns)] if columns is not None else df
+
+
+@traced
+def load_processed_flights(columns=None, airports=None, start=None, end=None,
+                           source_path=PROCESSED_XLSX, parquet_path=PROCESSED_PARQUET,
+                           manifest_path=MANIFEST_PATH, refresh_cache=True,
+                           dataset_dir=DATASET_DIR):
+    """
+    加载处理后航班数据（优先列式副本）
+    columns: 需要的列（列裁剪），None表示全部列
+    airports/start/end: 机场与日期范围筛选，存在分区数据集时走分区裁剪
+    refresh_cache: 回退读取Excel后是否重建列式副本
+    """
+    columns = list(columns) if columns is not None else None
+
+    if airports is not None or start is not None or end is not None:
+        if list_partitions(dataset_dir):
+            return load_partitions(airports, start, end, columns, dataset_dir)
+        print("⚠ 未找到分区数据集，改为读取全表后筛选")
+        df = load_processed_flights(None, source_path=source_path, parquet_path=parquet_path,
+                                    manifest_path=manifest_path, refresh_cache=refresh_cache)
+        return filter_flights(df, airports, start, end, columns)
+
+    if is_cache_fresh(source_path, parquet_path, manifest_path):
+        return apply_schema(pd.read_parquet(parquet_path, columns=columns))
+
+    print(f"⚠ 列式副本缺失或已过期，回退读取: {source_path}")
+    if columns is not None and not refresh_cache:
+        return apply_schema(pd.read_excel(source_path, usecols=columns))
+
+    df = apply_schema(pd.read_excel(source_path))
+    if refresh_cache:
+        write_columnar_cache(df, source_path, parquet_path, manifest_path)
+    return df[columns] if columns is not None else df
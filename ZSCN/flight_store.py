@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+航班数据查询接口 FlightStore（列裁剪与谓词下推到存储读取）
+
+各脚本原先的模式：读入整表 → 布尔筛选（如 df['起飞机场三字码'] == 'KHN'、delayMin范围、航司）→ 取几列。
+FlightStore 把筛选与取列写成链式查询，执行时一次下推到Parquet读取：
+- 列裁剪：只解码 select / groupby / agg 用到的列（筛选列由读取器内部使用，不进入结果）
+- 谓词下推：where 条件转为pyarrow表达式，按行组统计信息（min/max）跳过不可能命中的行组，
+  命中的行组内再逐行过滤；分区数据集另按机场与月份裁剪分区目录（见flight_io.scope_partitions），
+  月份范围同时取自 scan 的 start/end 与计划起飞时间上的 where 条件
+- 分组统计：groupby(...).agg(指标) 只读取分组键与取值列，交给 kpi.group_kpis（口径与图表、统计表一致）
+
+数据源同 load_processed_flights：scan 指定机场/月份且存在分区数据集时读分区，否则读列式副本；
+副本缺失或过期时经 load_processed_flights 回退Excel（并重建副本），在内存中按同样的条件筛选，
+未安装pyarrow时同样在内存中筛选，结果一致。
+scan 的机场范围口径同 filter_flights：起飞或到达机场命中即保留（分区读取同样按起降机场行级筛选，
+两端机场均有分区的航班只读一份）；没有匹配的航班时返回空表。
+
+用法：
+    store = FlightStore()
+    df = (store.scan('KHN', '2025-06', '2025-08')
+               .where('起飞机场三字码', '==', 'KHN')
+               .where('delayMin', 'between', (-60, 300))
+               .where(所属航司代码='CJX')
+               .select('航班号', '机型分类', 'delayMin')
+               .load())
+    kpis = store.scan().where('小时段', 'between', (8, 9)).groupby('所属航司代码').agg(['count', 'normal_rate'])
+"""
+
+import operator
+
+import pandas as pd
+
+from flight_io import (DATASET_DIR, FLIGHT_SCHEMA, HAS_PYARROW, MANIFEST_PATH, PROCESSED_PARQUET, PROCESSED_XLSX,
+                       apply_schema, empty_flights, filter_flights, is_cache_fresh, list_partitions,
+                       load_processed_flights, scope_partitions, shared_owners)
+from kpi import DEFAULT_METRICS, group_kpis
+from tracing import traced
+
+if HAS_PYARROW:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+TIME_COLUMN = '计划起飞时间'  # 分区月份与scan日期范围所依据的列
+
+_COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+                '>': operator.gt, '>=': operator.ge}
+OPERATORS = tuple(_COMPARISONS) + ('in', 'not in', 'between')
+
+
+def _is_datetime(column):
+    return str(FLIGHT_SCHEMA.get(column, '')).startswith('datetime64')
+
+
+def _normalize(column, op, value):
+    """校验运算符与取值形式；时间列的取值转为Timestamp"""
+    if op not in OPERATORS:
+        raise ValueError(f"不支持的运算符: {op}（可选 {list(OPERATORS)}）")
+    if op in ('in', 'not in'):
+        value = [value] if isinstance(value, str) else list(value)
+    elif op == 'between':
+        value = tuple(value)
+        if len(value) != 2:
+            raise ValueError(f"between 取值须为(下限, 上限): {value}")
+    if _is_datetime(column):
+        value = [pd.Timestamp(v) for v in value] if isinstance(value, (list, tuple)) else pd.Timestamp(value)
+    return column, op, value
+
+
+def _scope_predicates(start=None, end=None):
+    """scan日期范围 → 计划起飞时间条件（月份或日期粒度，同filter_flights）"""
+    predicates = []
+    if start is not None:
+        lower = pd.Timestamp(start) if len(str(start)) > 7 else pd.Period(start, 'M').start_time
+        predicates.append((TIME_COLUMN, '>=', lower))
+    if end is not None:
+        upper = (pd.Timestamp(end) + pd.Timedelta(days=1) if len(str(end)) > 7
+                 else (pd.Period(end, 'M') + 1).start_time)
+        predicates.append((TIME_COLUMN, '<', upper))
+    return predicates
+
+
+def _month_range(predicates):
+    """计划起飞时间条件推出的月份范围（用于分区裁剪），无约束的一端为None"""
+    start = end = None
+    for column, op, value in predicates:
+        if column != TIME_COLUMN:
+            continue
+        low = value[0] if op == 'between' else value if op in ('>', '>=', '==') else None
+        high = value[1] if op == 'between' else value if op in ('<', '<=', '==') else None
+        if low is not None:
+            start = max(start, low) if start is not None else low
+        if high is not None:
+            end = min(end, high) if end is not None else high
+    return start, end
+
+
+def _expression(column, op, value):
+    """单个条件 → pyarrow表达式"""
+    field = ds.field(column)
+    if op == 'between':
+        return (field >= pa.scalar(value[0])) & (field <= pa.scalar(value[1]))
+    if op == 'in':
+        return field.isin(value)
+    if op == 'not in':
+        return ~field.isin(value)
+    return _COMPARISONS[op](field, pa.scalar(value))
+
+
+def _airport_expression(airports, owner=None, earlier=()):
+    """机场范围 → pyarrow表达式（同flight_io.partition_mask；单文件读取时earlier为空，只按起降机场筛选）"""
+    origin, dest = ds.field('起飞机场三字码'), ds.field('到达机场三字码')
+    expression = None
+    if airports is not None:
+        expression = origin.isin(airports) | dest.isin(airports)
+    if earlier:
+        shared = ((origin == owner) & dest.isin(earlier)) | ((dest == owner) & origin.isin(earlier))
+        expression = ~shared if expression is None else expression & ~shared
+    return expression
+
+
+def _mask(df, column, op, value):
+    """单个条件 → 布尔掩码（内存筛选路径，与_expression等价）"""
+    series = df[column]
+    if op == 'between':
+        return series.between(*value)
+    if op == 'in':
+        return series.isin(value)
+    if op == 'not in':
+        return ~series.isin(value)
+    return _COMPARISONS[op](series, value)
+
+
+class FlightQuery:
+    """
+    链式查询（不可变：每个方法返回新查询，原查询可复用）
+    load() 执行读取；groupby(...).agg(...) 执行分组统计
+    """
+
+    def __init__(self, store, airports=None, start=None, end=None):
+        self.store = store
+        self.airports = [airports] if isinstance(airports, str) else airports
+        self.start, self.end = start, end
+        self.predicates = []
+        self.columns = None
+        self.group_keys = []
+
+    def _derive(self, **changes):
+        query = FlightQuery.__new__(FlightQuery)
+        query.__dict__.update(self.__dict__, **changes)
+        return query
+
+    def where(self, column=None, op='==', value=None, **equals):
+        """
+        筛选条件（多次调用为“且”）：where('delayMin', 'between', (-60, 300))、where('小时段', 'in', [8, 9])、
+        where(所属航司代码='CJX')；运算符见OPERATORS，between两端均包含
+        """
+        predicates = list(self.predicates)
+        if column is not None:
+            predicates.append(_normalize(column, op, value))
+        predicates += [_normalize(col, '==', val) for col, val in equals.items()]
+        return self._derive(predicates=predicates)
+
+    def select(self, *columns):
+        """结果只保留这些列（读取时即只解码这些列）"""
+        return self._derive(columns=list(columns))
+
+    def groupby(self, *keys):
+        return self._derive(group_keys=list(keys))
+
+    @traced('flight_store.agg')
+    def agg(self, metrics=DEFAULT_METRICS, value='delayMin', **kwargs):
+        """分组统计：只读取分组键与取值列，指标与参数同kpi.group_kpis"""
+        df = self.select(*dict.fromkeys(self.group_keys + [value])).load()
+        return group_kpis(df, self.group_keys, metrics, value=value, **kwargs)
+
+    @traced('flight_store.load')
+    def load(self):
+        """执行查询，返回DataFrame（列类型同FLIGHT_SCHEMA）"""
+        return self.store.read(self)
+
+
+class FlightStore:
+    """
+    处理后航班数据的查询入口
+    路径参数同load_processed_flights；scan(airports, start, end) 开始一个查询
+    """
+
+    def __init__(self, source_path=PROCESSED_XLSX, parquet_path=PROCESSED_PARQUET,
+                 manifest_path=MANIFEST_PATH, dataset_dir=DATASET_DIR):
+        self.source_path = source_path
+        self.parquet_path = parquet_path
+        self.manifest_path = manifest_path
+        self.dataset_dir = dataset_dir
+
+    def scan(self, airports=None, start=None, end=None):
+        """
+        查询范围：机场（起飞或到达命中）与日期范围（'YYYY-MM'为整月，'YYYY-MM-DD'精确到日）
+        指定范围且存在分区数据集时按分区读取
+        """
+        return FlightQuery(self, airports, start, end)
+
+    def read(self, query):
+        scoped = query.airports is not None or query.start is not None or query.end is not None
+        if HAS_PYARROW and scoped and list_partitions(self.dataset_dir):
+            # 先按所属机场与月份裁剪分区目录，再按起降机场行级筛选（同load_partitions），日期条件下推到行级
+            predicates = _scope_predicates(query.start, query.end) + query.predicates
+            start, end = _month_range(predicates)
+            partitions = scope_partitions(query.airports, start, end, self.dataset_dir)
+            sources = [(sorted(d.glob('*.parquet')),
+                        _airport_expression(query.airports, owner, shared_owners(owner, partitions)))
+                       for owner, d in partitions]
+            sources = [(files, expression) for files, expression in sources if files]
+            if not sources:  # 没有匹配的分区：按列类型声明返回空表（与filter_flights一致）
+                return empty_flights(query.columns)
+            return self._read_parquet(sources, predicates, query.columns)
+
+        if HAS_PYARROW and is_cache_fresh(self.source_path, self.parquet_path, self.manifest_path):
+            predicates = _scope_predicates(query.start, query.end) + query.predicates
+            sources = [([self.parquet_path], _airport_expression(query.airports))]
+            return self._read_parquet(sources, predicates, query.columns)
+
+        # 副本缺失/过期（回退Excel并重建副本）或未安装pyarrow：读取全表后在内存中筛选
+        df = load_processed_flights(source_path=self.source_path, parquet_path=self.parquet_path,
+                                    manifest_path=self.manifest_path, dataset_dir=self.dataset_dir)
+        df = filter_flights(df, query.airports, query.start, query.end)
+        if query.predicates:
+            mask = pd.Series(True, index=df.index)
+            for predicate in query.predicates:
+                mask &= _mask(df, *predicate)
+            df = df.loc[mask].reset_index(drop=True)
+        return df[query.columns] if query.columns is not None else df
+
+    def _read_parquet(self, sources, predicates, columns=None):
+        """
+        下推读取：统计信息可排除的行组不解码，命中行组内逐行过滤，只解码所需列
+        sources 为[(文件列表, 机场表达式), ...]（分区读取时每个所属机场一组，表达式各不相同），
+        每组由pyarrow一次扫描完成；行组命中数另由统计信息算出，仅用于输出
+        """
+        tables, n_files, total_groups, hit_groups = [], 0, 0, 0
+        for files, extra in sources:
+            dataset = ds.dataset([str(f) for f in files], format='parquet')
+            missing = [c for c in (columns or []) + [p[0] for p in predicates] if c not in dataset.schema.names]
+            if missing:
+                raise KeyError(f"数据中没有这些列: {missing}")
+            expression = extra
+            for predicate in predicates:
+                condition = _expression(*predicate)
+                expression = condition if expression is None else expression & condition
+            read_columns = dataset.schema.names if columns is None else columns
+            tables.append(dataset.to_table(columns=read_columns, filter=expression))
+
+            fragments = list(dataset.get_fragments())
+            n_files += len(fragments)
+            total_groups += sum(fragment.metadata.num_row_groups for fragment in fragments)
+            hit_groups += sum(len(fragment.split_by_row_group(expression))
+                              for fragment in dataset.get_fragments(filter=expression))
+
+        df = apply_schema(pa.concat_tables(tables).to_pandas())
+        print(f"✓ 下推读取: {n_files}个文件，行组{hit_groups}/{total_groups}，"
+              f"{len(read_columns)}列，{len(df)}条记录")
+        return df
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+多进程分区聚合（多年份、多机场数据的第三章分组统计）
+
+把航班数据切成任务（分区文件 airport=XXX/month=YYYY-MM/part-*.parquet，或内存表的行区间），
+在进程池中各自计算部分聚合，再在主进程中确定性合并：
+（分区选取与行级机场筛选同flight_io.load_partitions：起飞或到达机场命中，两端机场均有分区的航班只计一次）
+- 度量表：航班数、延误分钟和、平方和、延误等级列联表（准点/轻微/中度/重度计数）
+- 分位数摘要：quantile_sketch.build_sketch 构建、merge_sketches 合并（极值为单独质心，精确）
+分组（AGG_GROUPINGS）：小时段、日期类型（工作日/周末）、所属航司、机型分类、到达机场
+
+确定性：
+- 任务划分只取决于数据（命中的分区文件列表 / 每任务行数），与进程数无关
+- 结果按任务编号排序后合并；度量均为整数累加，分组按键排序，与完成先后无关
+因此 workers=1（串行路径）与任意进程数的结果逐位一致。
+计数、均值、比率、列联表与 kpi.group_kpis 全量计算一致；中位数/分位数在分组内
+不同取值数不超过摘要压缩参数时同样一致，超过时误差受摘要质心跨度限制。
+
+进程池沿用run_pipeline的做法：内存表经initializer交给子进程（fork时直接继承，不复制），
+分区文件由子进程各自读取（只读所需列），主进程只接收KB级的部分结果。
+
+运行方式：
+    python parallel_agg.py                                    # 全部分区，进程数=CPU核数
+    python parallel_agg.py --workers 1                        # 串行路径
+    python parallel_agg.py --airports KHN --start 2025-06 --end 2025-08
+    python parallel_agg.py --verify                           # 与串行路径、group_kpis全量结果逐项核对
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aircraft_types import ensure_aircraft_family
+from flight_io import (DATASET_DIR, DELAY_LEVELS, HAS_PYARROW, apply_schema, list_partitions, load_processed_flights,
+                       partition_mask, scope_partitions, shared_owners)
+from kpi import DELAY_THRESHOLD, NORMAL_THRESHOLD, group_codes
+from quantile_sketch import COMPRESSION, build_sketch, merge_sketches, sketch_kpis
+from tracing import traced
+
+AGG_GROUPINGS = {
+    '小时段': ['小时段'],
+    '日期类型': ['日期类型'],
+    '所属航司代码': ['所属航司代码'],
+    '机型分类': ['机型分类'],
+    '到达机场三字码': ['到达机场三字码'],
+}
+
+WEEKEND_DAYS = ['Saturday', 'Sunday', '周六', '周日']  # 与图3-2口径一致
+DAY_TYPES = pd.CategoricalDtype(['工作日', '周末'])
+
+LEVEL_COLUMNS = [f'n_{level}' for level in DELAY_LEVELS]  # 延误等级列联表
+LEVEL_BINS = [0, DELAY_THRESHOLD, NORMAL_THRESHOLD]  # 同derive_fields：(-∞,0] (0,15] (15,60] (60,∞)
+MEASURES = ['count', 'delay_sum', 'delay_sq_sum'] + LEVEL_COLUMNS
+
+ROWS_PER_TASK = 500_000  # 内存表按行区间切分时每个任务的行数
+
+# 派生分组键 → 所需的源列
+_DERIVED_KEYS = {'日期类型': ['星期'], '机型分类': ['机型分类', '机型']}
+
+
+def _source_columns(groupings):
+    columns = ['delayMin', '起飞机场三字码', '到达机场三字码']  # 起降机场用于分区内的行级筛选
+    for by in groupings.values():
+        for key in by:
+            for col in _DERIVED_KEYS.get(key, [key]):
+                if col not in columns:
+                    columns.append(col)
+    return columns
+
+
+def _prepare(df, groupings):
+    """补齐派生分组键（日期类型、旧版数据缺少的机型分类）"""
+    keys = {key for by in groupings.values() for key in by}
+    if '日期类型' in keys and '日期类型' not in df.columns:
+        weekend = df['星期'].isin(WEEKEND_DAYS).to_numpy()
+        df['日期类型'] = pd.Categorical.from_codes(weekend.astype(np.int8), dtype=DAY_TYPES)
+    if '机型分类' in keys:
+        ensure_aircraft_family(df)
+    return df
+
+
+# ==========================================
+# 部分聚合与合并
+# ==========================================
+def _measure_table(index, counts, sums, sq_sums, levels):
+    table = index.to_frame(index=False)
+    table['count'] = counts
+    table['delay_sum'] = sums
+    table['delay_sq_sum'] = sq_sums
+    for i, col in enumerate(LEVEL_COLUMNS):
+        table[col] = levels[:, i]
+    return apply_schema(table)
+
+
+def partial_measures(df, by):
+    """单个任务、单个分组的度量表（整数累加：bincount在和不超过2^53时精确）"""
+    codes, index = group_codes(df, by)
+    delay = df['delayMin'].to_numpy()
+    valid = codes >= 0
+    if delay.dtype.kind == 'f':
+        valid &= ~np.isnan(delay)
+    codes, delay = codes[valid], delay[valid]
+
+    n_groups = len(index)
+    counts = np.bincount(codes, minlength=n_groups)
+    sums = np.bincount(codes, weights=delay, minlength=n_groups).astype(np.int64)
+    sq_sums = np.bincount(codes, weights=delay.astype(np.float64) ** 2, minlength=n_groups).astype(np.int64)
+    levels = np.searchsorted(LEVEL_BINS, delay, side='left')
+    n_levels = len(LEVEL_COLUMNS)
+    level_counts = np.bincount(codes * n_levels + levels, minlength=n_groups * n_levels).reshape(n_groups, n_levels)
+    return _measure_table(index, counts, sums, sq_sums, level_counts)
+
+
+def partial_aggregates(df, groupings=AGG_GROUPINGS, compression=COMPRESSION):
+    """单个任务的部分聚合：{分组名: (度量表, 摘要表)}"""
+    df = _prepare(df, groupings)
+    return {name: (partial_measures(df, by), build_sketch(df, by, compression=compression))
+            for name, by in groupings.items()}
+
+
+def _merge_measures(tables, by):
+    table = pd.concat(tables, ignore_index=True) if len(tables) > 1 else tables[0]
+    codes, index = group_codes(table, by)
+    valid = codes >= 0
+    codes = codes[valid]
+    merged = {m: np.bincount(codes, weights=table[m].to_numpy()[valid], minlength=len(index)).astype(np.int64)
+              for m in MEASURES}
+    return _measure_table(index, merged['count'], merged['delay_sum'], merged['delay_sq_sum'],
+                          np.column_stack([merged[col] for col in LEVEL_COLUMNS]))
+
+
+@traced
+def merge_partials(partials, groupings=AGG_GROUPINGS, compression=COMPRESSION):
+    """
+    合并各任务的部分聚合（partials须按任务编号排序）
+    返回 {分组名: (度量表, 摘要表)}，结构与partial_aggregates一致，可继续合并
+    """
+    merged = {}
+    for name, by in groupings.items():
+        # 行级筛选后为空的任务不参与合并（全部为空时保留一个以确定列结构）
+        measures = [partial[name][0] for partial in partials if len(partial[name][0])] or [partials[0][name][0]]
+        sketches = [partial[name][1] for partial in partials if len(partial[name][1])] or [partials[0][name][1]]
+        merged[name] = (_merge_measures(measures, by), merge_sketches(sketches, by, compression))
+    return merged
+
+
+def summarize(merged, groupings=AGG_GROUPINGS):
+    """
+    合并结果 → 各分组指标表（指标名同kpi.group_kpis）
+    count、share、mean、std、delay_rate、normal_rate、late_rate、min、p25、median、p75、max，
+    以及延误等级列联表（n_准点、n_轻微、n_中度、n_重度）
+    """
+    summaries = {}
+    for name, (measures, sketch) in merged.items():
+        by = groupings[name]
+        table = measures.set_index(by if len(by) > 1 else by[0])
+        n = table['count'].astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = table['delay_sum'] / n
+            variance = (table['delay_sq_sum'] - table['delay_sum'].astype(np.float64) ** 2 / n) / (n - 1)
+            summary = pd.DataFrame({
+                'count': table['count'],
+                'share': n / n.sum() * 100,
+                'mean': mean,
+                'std': np.sqrt(variance.clip(lower=0)).where(n > 1),
+                'delay_rate': (table['n_中度'] + table['n_重度']) / n * 100,
+                'normal_rate': (table['count'] - table['n_重度']) / n * 100,
+                'late_rate': (table['count'] - table['n_准点']) / n * 100,
+            })
+        quantiles = sketch_kpis(sketch, by, ['min', 'p25', 'median', 'p75', 'max'])
+        summary = summary.join(quantiles.reindex(table.index))
+        summaries[name] = pd.concat([summary, table[LEVEL_COLUMNS]], axis=1)
+    return summaries
+
+
+# ==========================================
+# 任务划分与进程池
+# ==========================================
+_DF = None
+_GROUPINGS = AGG_GROUPINGS
+
+
+def _init_worker(df, groupings):
+    global _DF, _GROUPINGS
+    _DF, _GROUPINGS = df, groupings
+
+
+def _read_file(path, columns):
+    import pyarrow.parquet as pq
+    available = set(pq.read_schema(path).names)
+    return apply_schema(pd.read_parquet(path, columns=[col for col in columns if col in available]))
+
+
+def _run_task(task):
+    """
+    执行单个任务：(编号, 'file', (路径, 机场, 所属机场, 排在前面的机场)) 或 (编号, 'rows', (起, 止))，
+    返回(编号, 部分聚合, 行数, 耗时)
+    """
+    task_id, kind, target = task
+    start = time.perf_counter()
+    if kind == 'file':
+        path, airports, owner, earlier = target
+        df = _read_file(path, _source_columns(_GROUPINGS))
+        df = df.loc[partition_mask(df, airports, owner, earlier)].reset_index(drop=True)
+    else:
+        df = _DF.iloc[target[0]:target[1]].copy()
+    return task_id, partial_aggregates(df, _GROUPINGS), len(df), time.perf_counter() - start
+
+
+def plan_tasks(df=None, airports=None, start=None, end=None, dataset_dir=DATASET_DIR, rows_per_task=ROWS_PER_TASK):
+    """
+    任务划分：传入df时按行区间切分；否则每个命中的分区文件一个任务
+    （分区选取见scope_partitions，月份粒度；任务内按起降机场筛选并跳过与排在前面的分区共有的航班）
+    划分结果与进程数无关，保证不同进程数下合并结果一致
+    """
+    if df is not None:
+        bounds = list(range(0, len(df), rows_per_task)) + [len(df)]
+        return [(i, 'rows', (lo, hi)) for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))]
+    if isinstance(airports, str):
+        airports = [airports]
+    partitions = scope_partitions(airports, start, end, dataset_dir)
+    files = [(path, airports, owner, shared_owners(owner, partitions))
+             for owner, d in partitions for path in sorted(d.glob('*.parquet'))]
+    return [(i, 'file', target) for i, target in enumerate(files)]
+
+
+@traced
+def parallel_aggregate(df=None, airports=None, start=None, end=None, workers=None, groupings=AGG_GROUPINGS,
+                       rows_per_task=ROWS_PER_TASK, dataset_dir=DATASET_DIR):
+    """
+    分区并行聚合，返回合并结果 {分组名: (度量表, 摘要表)}（summarize转为指标表）
+    df: 已加载的航班表；为None时读取分区数据集（无分区数据集时读取处理后数据全表）
+    workers: 进程数，默认CPU核数；1为串行路径（同一套任务划分与合并，结果与多进程一致）
+    """
+    if df is None and not (HAS_PYARROW and list_partitions(dataset_dir)):
+        print("⚠ 未找到分区数据集，改为读取处理后数据后按行区间切分")
+        df = load_processed_flights(airports=airports, start=start, end=end)
+    tasks = plan_tasks(df, airports, start, end, dataset_dir, rows_per_task)
+    if not tasks:
+        raise ValueError("没有可聚合的数据")
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    wall_start = time.perf_counter()
+    if workers == 1:
+        _init_worker(df, groupings)
+        results = [_run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df, groupings)) as pool:
+            results = list(pool.map(_run_task, tasks))
+    results.sort(key=lambda result: result[0])
+    merged = merge_partials([partial for _, partial, _, _ in results], groupings)
+    wall = time.perf_counter() - wall_start
+
+    task_seconds = sum(seconds for *_, seconds in results)
+    rows = sum(n for _, _, n, _ in results)
+    print(f"✅ 分区聚合: {rows:,}行 / {len(tasks)}个任务，进程数{workers}，墙钟{wall:.2f}s，"
+          f"任务耗时合计{task_seconds:.2f}s（并行效率{task_seconds / wall / workers:.0%}）")
+    return merged
+
+
+def verify(df=None, airports=None, start=None, end=None, workers=None, groupings=AGG_GROUPINGS):
+    """
+    核对：多进程结果与串行路径逐位一致；计数/均值/比率/列联表与group_kpis全量计算一致
+    返回不一致项列表（空列表表示全部通过）
+    """
+    parallel = summarize(parallel_aggregate(df, airports, start, end, workers, groupings), groupings)
+    serial = summarize(parallel_aggregate(df, airports, start, end, 1, groupings), groupings)
+    if df is None:
+        df = load_processed_flights(airports=airports, start=start, end=end)
+    df = _prepare(df, groupings)
+
+    from kpi import group_kpis
+    metrics = ['count', 'mean', 'std', 'min', 'max', 'delay_rate', 'normal_rate', 'late_rate']
+    problems = []
+    for name, by in groupings.items():
+        if not parallel[name].equals(serial[name]):
+            problems.append(f"{name}: 多进程与串行结果不一致")
+        exact = group_kpis(df, by, metrics).reindex(parallel[name].index)
+        for metric in metrics:
+            if not np.allclose(parallel[name][metric], exact[metric], rtol=1e-9, equal_nan=True):
+                problems.append(f"{name}.{metric}: 与group_kpis全量结果不一致")
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='多进程分区聚合（小时段/日期类型/航司/机型分类/到达机场）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数（默认CPU核数，1为串行）')
+    parser.add_argument('--airports', default=None, help='逗号分隔的机场三字码（分区裁剪）')
+    parser.add_argument('--start', default=None, help='起始月份，如2025-06')
+    parser.add_argument('--end', default=None, help='结束月份，如2025-08')
+    parser.add_argument('--verify', action='store_true', help='与串行路径及group_kpis全量结果核对')
+    args = parser.parse_args()
+    airports = args.airports.split(',') if args.airports else None
+
+    if args.verify:
+        problems = verify(None, airports, args.start, args.end, args.workers)
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        print("✅ 核对通过：多进程与串行逐位一致，与全量计算一致" if not problems else f"✗ {len(problems)}项不一致")
+        raise SystemExit(1 if problems else 0)
+
+    summaries = summarize(parallel_aggregate(None, airports, args.start, args.end, args.workers))
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        for name, summary in summaries.items():
+            print(f"\n📊 按{name}:")
+            print(summary.round(2).head(30))
@@ -17,6 +17,13 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 import warnings
 
+from aircraft_types import classify_series
+from flight_io import apply_schema, write_columnar_cache, write_partitions, DATASET_DIR
+from flight_cube import CUBE_DIR, build_cube, rollup, save_cube, write_cube_partitions
+from outliers import detect_outliers
+from quantile_sketch import SKETCH_DIR, write_sketch_partitions
+from tracing import record_output, span, traced
+
 # 全局配置
 warnings.filterwarnings('ignore')  # 忽略版本兼容性警告
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
@@ -25,18 +32,177 @@ plt.rcParams['axes.unicode_minus'] = False
 # =============== 路径配置 ===============
 DATA_PATH = Path('data/khn_flight.xlsx')  # 原始脱敏数据
 OUTPUT_DIR = Path('output')               # 成果输出目录
+BASE_AIRPORT = 'KHN'                      # 数据所属机场（分区键airport）
+
+# =============== 判定阈值 ===============
+ANOMALY_THRESHOLD = 180  # |delayMin|超过该值（分钟）标记为极端异常
+DELAY_THRESHOLD = 15     # delayMin超过该值（分钟）判定为延误
 
 # ===================================================
 
 
-def load_data():
-    """加载原始脱敏数据"""
-    print(f"📂 正在读取: {DATA_PATH}")
-    df = pd.read_excel(DATA_PATH)
+@traced
+def load_data(path=DATA_PATH):
+    """加载原始脱敏数据（xlsx；超出Excel行数上限的大样本可为csv/parquet）"""
+    path = Path(path)
+    print(f"📂 正在读取: {path}")
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        df = pd.read_csv(path)
+    elif suffix == '.parquet':
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_excel(path)
     print(f"✅ 读取成功: {df.shape[0]}行 × {df.shape[1]}列")
     return df
 
 
+def iter_raw_chunks(path=DATA_PATH, chunk_size=50_000):
+    """
+    流式读取原始数据，按块产出DataFrame
+    - xlsx：openpyxl只读模式逐行迭代，不整表载入
+    - csv：pandas分块读取
+    - parquet：pyarrow按批读取（如synth_flights生成的大样本）
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+    if path.suffix.lower() == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = list(next(rows))
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        wb.close()
+
+
+def _peak_rss_mb():
+    """进程峰值常驻内存（MB）：Linux/macOS用resource，Windows用psutil，均不可用时返回nan"""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    except ImportError:
+        return float('nan')
+
+
+def _format_rate(rows_per_sec):
+    """吞吐显示（耗时为0时无法计算，记录为None）"""
+    return '—行/秒' if rows_per_sec is None else f"{rows_per_sec:,.0f}行/秒"
+
+
+@traced
+def stream_process(path=DATA_PATH, chunk_size=50_000, airport=BASE_AIRPORT, out_dir=DATASET_DIR,
+                   sketch_dir=SKETCH_DIR, cube_dir=CUBE_DIR):
+    """
+    流式处理大体量原始数据（峰值内存取决于块大小与单月数据量，与总月份数无关）
+    1. 逐块执行 clean_data → derive_fields，每块按月份追加写入 airport=XXX/month=YYYY-MM 分区
+    2. 逐个月份分区去除跨块重复（航班号+计划起飞时间）：去重键含计划起飞时间，重复行必在同一月份，
+       每次只读入一个月的数据；去重后重写该分区，并按相同分区写出该月的分位数摘要与预聚合立方体
+       （各机场分别入库，互不覆盖；读取时按机场/月份裁剪后合并）
+    返回处理报告（各块行数、吞吐、峰值内存）。
+    """
+    import contextlib
+    import io
+    import json
+    import time
+
+    out_dir = Path(out_dir)
+    airport_dir = out_dir / f'airport={airport}'
+    airport_dir.mkdir(parents=True, exist_ok=True)
+    for old in [*airport_dir.glob('month=*/*.parquet'),  # 整个机场重跑，清空旧分区、摘要与立方体文件
+                *(Path(sketch_dir) / f'airport={airport}').glob('month=*/*.parquet'),
+                *(Path(cube_dir) / f'airport={airport}').glob('month=*/*.parquet')]:
+        old.unlink()
+
+    print(f"📂 流式读取: {path}（每块{chunk_size:,}行）→ {airport_dir}")
+    report = []
+    total_in = total_out = 0
+    start = time.perf_counter()
+
+    for i, chunk in enumerate(iter_raw_chunks(path, chunk_size)):
+        t0 = time.perf_counter()
+        rows_in = len(chunk)
+        with contextlib.redirect_stdout(io.StringIO()):  # 块级清洗不逐条打印
+            chunk = derive_fields(clean_data(chunk))
+
+        write_partitions(chunk, airport, out_dir, part_name=f'part-{i:05d}', replace=False)
+
+        elapsed = time.perf_counter() - t0
+        stats = {
+            'chunk': i,
+            'rows_in': rows_in,
+            'rows_out': len(chunk),
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows_in / elapsed, 1) if elapsed > 0 else None,
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+        }
+        report.append(stats)
+        total_in += rows_in
+        total_out += len(chunk)
+        print(f"   块{i:>4}: {rows_in:,}行 → {len(chunk):,}行 | "
+              f"{_format_rate(stats['rows_per_sec'])} | 峰值内存 {stats['peak_rss_mb']:.1f}MB")
+
+    # 逐月去除跨块重复，重写分区并构建摘要与立方体
+    duplicates = n_months = 0
+    for month_dir in sorted(airport_dir.glob('month=*')):
+        files = sorted(month_dir.glob('*.parquet'))
+        if not files:
+            continue
+        month = apply_schema(pd.concat([pd.read_parquet(f) for f in files], ignore_index=True))
+        before = len(month)
+        month = month.drop_duplicates(subset=['航班号', '计划起飞时间']).reset_index(drop=True)
+        duplicates += before - len(month)
+        write_partitions(month, airport, out_dir)
+        write_sketch_partitions(month, airport, sketch_dir)
+        write_cube_partitions(build_cube(month, ANOMALY_THRESHOLD), airport, cube_dir)
+        n_months += 1
+    total_out -= duplicates
+    print(f"   跨块去重: 删除 {duplicates:,} 条重复记录（{n_months}个月份分区）")
+
+    total_seconds = time.perf_counter() - start
+    summary = {
+        'source': str(path),
+        'chunk_size': chunk_size,
+        'rows_in': total_in,
+        'rows_out': total_out,
+        'duplicates_across_chunks': duplicates,
+        'seconds': round(total_seconds, 3),
+        'rows_per_sec': round(total_in / total_seconds, 1) if total_seconds > 0 else None,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'chunks': report,
+    }
+    with open(airport_dir / '_ingest_report.json', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print(f"✅ 流式处理完成: {total_in:,}行 → {total_out:,}行，{len(report)}个数据块，"
+          f"{_format_rate(summary['rows_per_sec'])}，峰值内存 {summary['peak_rss_mb']:.1f}MB")
+    return summary
+
+
+@traced
 def clean_data(df):
     """
     数据质量控制
@@ -67,8 +233,8 @@ def clean_data(df):
     print(f"   删除重复值: {before - after} 条记录")
 
     # 异常值标记
-    df['is_anomaly'] = np.abs(df['delayMin']) > 180
-    print(f"   标记异常值: {df['is_anomaly'].sum()} 条记录（|delayMin|>180）")
+    df['is_anomaly'], _ = detect_outliers(df, rule='threshold', lower=-ANOMALY_THRESHOLD, upper=ANOMALY_THRESHOLD)
+    print(f"   标记异常值: {df['is_anomaly'].sum()} 条记录（|delayMin|>{ANOMALY_THRESHOLD}）")
 
     # 取消航班标记
     df['is_cancelled'] = df['实际起飞时间'].isna()
@@ -78,6 +244,7 @@ def clean_data(df):
     return df
 
 
+@traced
 def derive_fields(df):
     """
     衍生分析字段
@@ -85,6 +252,8 @@ def derive_fields(df):
     - 小时段：提取计划起飞时间的小时
     - 星期：提取星期信息
     - isDelay：布尔值，延误>15分钟为True
+    - 机型分类：按aircraft_types规则表，每种机型只判断一次
+    最后按flight_io.FLIGHT_SCHEMA压缩列类型（category/小整数）
     """
     print("\n🔧 正在衍生新字段...")
 
@@ -95,12 +264,15 @@ def derive_fields(df):
     )
     df['小时段'] = df['计划起飞时间'].dt.hour
     df['星期'] = df['计划起飞时间'].dt.day_name()
-    df['isDelay'] = df['delayMin'] > 15
+    df['isDelay'] = df['delayMin'] > DELAY_THRESHOLD
+    df['机型分类'] = classify_series(df['机型'])
 
-    print("✅ 衍生字段完成")
+    df = apply_schema(df)
+    print(f"✅ 衍生字段完成（内存占用: {df.memory_usage(deep=True).sum() / 1024 ** 2:.2f} MB）")
     return df
 
 
+@traced
 def assess_quality(df):
     """生成数据质量评估表（表2-4）——动态联动版"""
     print("\n📊 正在评估数据质量...")
@@ -136,42 +308,49 @@ def assess_quality(df):
     return quality_df
 
 
-def descriptive_stats(df):
-    """生成描述性统计表格（表2-5、表2-6）"""
+@traced
+def descriptive_stats(df, cube=None):
+    """
+    生成描述性统计表格（表2-5、表2-6）
+    cube: 预聚合立方体（flight_cube），为None时由df构建
+    """
     print("\n📈 正在生成统计表格...")
+    cube = build_cube(df, ANOMALY_THRESHOLD) if cube is None else cube
+    total = int(cube['count'].sum())
 
     # 表2-5: 航司统计TOP 10
+    airline = rollup(cube, '所属航司代码', normal_threshold=DELAY_THRESHOLD)  # 表2-5口径：未延误（≤15分钟）即正常
     airline_stats = (
-        df.groupby('所属航司代码')
-        .agg(
-            航班量=('航班号', 'count'),
-            平均延误=('delayMin', 'mean'),
-            正常率=('isDelay', lambda x: (1 - x.mean()) * 100)
-        )
+        pd.DataFrame({
+            '航班量': airline['count'],
+            '平均延误': airline['mean_delay'],
+            '正常率': airline['normal_rate']
+        })
         .round(1)
         .sort_values('航班量', ascending=False)
         .head(10)
     )
-    airline_stats['占比'] = (airline_stats['航班量'] / len(df) * 100).round(1)
+    airline_stats['占比'] = (airline_stats['航班量'] / total * 100).round(1)
     airline_stats['正常率'] = airline_stats['正常率'].round(1)
 
     # 表2-6: 机型统计
+    aircraft = rollup(cube, '机型')
     aircraft_stats = (
-        df.groupby('机型')
-        .agg(
-            航班量=('航班号', 'count'),
-            平均延误=('delayMin', 'mean'),
-            最大延误=('delayMin', 'max')
-        )
+        pd.DataFrame({
+            '航班量': aircraft['count'],
+            '平均延误': aircraft['mean_delay'],
+            '最大延误': aircraft['delay_max']
+        })
         .round(1)
         .sort_values('航班量', ascending=False)
         .head(10)
     )
-    aircraft_stats['占比'] = (aircraft_stats['航班量'] / len(df) * 100).round(1)
+    aircraft_stats['占比'] = (aircraft_stats['航班量'] / total * 100).round(1)
 
     return airline_stats, aircraft_stats
 
 
+@traced
 def plot_delay_distribution(df):
     """
     生成图2-1: delayMin频次直方图
@@ -316,7 +495,9 @@ def plot_delay_distribution(df):
     figure_dir = OUTPUT_DIR / 'figures'
     figure_dir.mkdir(parents=True, exist_ok=True)
     output_path = figure_dir / '图2-1_delayMin直方图.png'
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    with span('savefig', 'matplotlib') as current:
+        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        current.add_output(output_path)
     plt.close(fig)
 
     print(f"✅ 图表已保存: {output_path}")
@@ -326,18 +507,43 @@ def plot_delay_distribution(df):
     print(f">15分钟延误占比: {df['isDelay'].mean() * 100:.1f}%")
 
 
-def save_all_tables(df, quality_df, airline_stats, aircraft_stats):
-    """保存所有表格至Excel（表2-4至表2-6）"""
-    print("\n💾 正在保存表格...")
+@traced
+def save_quality_table(quality_df):
+    """保存表2-4"""
     tables_dir = OUTPUT_DIR / 'tables'
     tables_dir.mkdir(parents=True, exist_ok=True)
-
     quality_df.to_excel(tables_dir / '表2-4_数据质量评估.xlsx', index=False)
+    record_output(tables_dir / '表2-4_数据质量评估.xlsx')
+
+
+@traced
+def save_stats_tables(airline_stats, aircraft_stats):
+    """保存表2-5、表2-6"""
+    tables_dir = OUTPUT_DIR / 'tables'
+    tables_dir.mkdir(parents=True, exist_ok=True)
     airline_stats.to_excel(tables_dir / '表2-5_航司统计TOP10.xlsx')
     aircraft_stats.to_excel(tables_dir / '表2-6_机型统计.xlsx')
-    df.to_excel(OUTPUT_DIR / 'khn_flight_processed.xlsx', index=False)
+    record_output(tables_dir / '表2-5_航司统计TOP10.xlsx', tables_dir / '表2-6_机型统计.xlsx')
+
 
-    print(f"✅ 所有表格已保存至: {tables_dir}")
+@traced
+def save_processed_data(df):
+    """保存处理后数据（Excel + 列式副本）"""
+    with span('write_excel', 'io', rows_in=len(df)) as current:
+        df.to_excel(OUTPUT_DIR / 'khn_flight_processed.xlsx', index=False)
+        current.add_output(OUTPUT_DIR / 'khn_flight_processed.xlsx')
+    # 列式副本（供图表/核查脚本快速读取，需在Excel写出后生成以记录其签名）
+    write_columnar_cache(df, source_path=OUTPUT_DIR / 'khn_flight_processed.xlsx')
+
+
+def save_all_tables(df, quality_df, airline_stats, aircraft_stats):
+    """保存所有表格至Excel（表2-4至表2-6）"""
+    print("\n💾 正在保存表格...")
+    save_quality_table(quality_df)
+    save_stats_tables(airline_stats, aircraft_stats)
+    save_processed_data(df)
+
+    print(f"✅ 所有表格已保存至: {OUTPUT_DIR / 'tables'}")
 
 
 def main():
@@ -351,9 +557,14 @@ def main():
     df = load_data()
     df = clean_data(df)
     df = derive_fields(df)
+    cube = build_cube(df, ANOMALY_THRESHOLD)
     quality_df = assess_quality(df)
-    airline_stats, aircraft_stats = descriptive_stats(df)
+    airline_stats, aircraft_stats = descriptive_stats(df, cube)
     save_all_tables(df, quality_df, airline_stats, aircraft_stats)
+    save_cube(cube)
+    write_cube_partitions(cube, BASE_AIRPORT)
+    write_partitions(df, BASE_AIRPORT)
+    write_sketch_partitions(df, BASE_AIRPORT)
     plot_delay_distribution(df)
 
     # 最终验证
@@ -362,6 +573,9 @@ def main():
     print("=" * 50)
     print(f"📁 处理后的数据: {OUTPUT_DIR / 'khn_flight_processed.xlsx'}")
     print(f"📊 统计表格: {OUTPUT_DIR / 'tables'}")
+    print(f"🗂️  分区数据集: {DATASET_DIR / f'airport={BASE_AIRPORT}'}")
+    print(f"📐 分位数摘要: {SKETCH_DIR / f'airport={BASE_AIRPORT}'}")
+    print(f"🧊 立方体分区: {CUBE_DIR / f'airport={BASE_AIRPORT}'}")
     print(f"🖼️  图表: {OUTPUT_DIR / 'figures'}")
 
     # 数据规模确认
@@ -382,4 +596,16 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='第二章数据处理流水线')
+    parser.add_argument('--stream', action='store_true', help='流式分块处理原始数据（大体量数据）')
+    parser.add_argument('--input', default=str(DATA_PATH), help='流式处理的原始数据路径（xlsx/csv）')
+    parser.add_argument('--chunk-size', type=int, default=50_000, help='流式处理每块行数')
+    parser.add_argument('--airport', default=BASE_AIRPORT, help='流式处理数据所属机场（分区键）')
+    args = parser.parse_args()
+
+    if args.stream:
+        stream_process(args.input, chunk_size=args.chunk_size, airport=args.airport)
+    else:
+        main()
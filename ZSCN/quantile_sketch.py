@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+可合并的延误分位数摘要（t-digest思路，第二章写出，第三章箱型图/中位数与核查脚本共用）
+
+每个分组保存一组质心（均值, 权重）：
+- 分组内不同取值数不超过压缩参数（COMPRESSION）时，每个取值即一个质心，分位数与np.percentile完全一致
+- 超过时按t-digest的k1尺度（k = δ/2π·arcsin(2q−1)）合并相邻取值：两端质心细、中部粗，
+  单个取值权重跨越一个k单位的（如整数分钟的高频值）始终单独成质心；质心数约为δ/2
+- 均值按权重加总，任意合并后保持精确；分位数误差受所在质心跨度限制
+
+构建与合并全部向量化（分组编码 + 排序/直方图 + bincount），不逐组循环。
+process_data 写出分区数据集的同时，按相同分区（airport=XXX/month=YYYY-MM）写出各分组的摘要表，
+跨月份、跨机场查询时只读取并合并KB级的摘要，无需扫描全部航班行。
+分区内的摘要另按航线（起飞×到达机场）细分，读取时按起降机场筛选并跳过与其他分区共有的航班
+（口径同flight_io.load_partitions），再合并到分组键。
+
+分组（SKETCH_GROUPINGS）：小时段、所属航司代码、机型分类、航线（起飞×到达机场）
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from flight_io import HAS_PYARROW, apply_schema, list_partitions, load_processed_flights, partition_mask, \
+    scope_partitions, shared_owners
+from kpi import OrderStatistics, group_codes, quantile_level
+from tracing import record_output, traced
+
+SKETCH_DIR = Path('output/sketches')  # 摘要分区：airport=XXX/month=YYYY-MM/<分组>-part-*.parquet
+
+COMPRESSION = 500  # δ：分组内不同取值数不超过δ时保存精确分布；越大越精确，摘要越大
+
+SKETCH_GROUPINGS = {
+    '小时段': ['小时段'],
+    '所属航司代码': ['所属航司代码'],
+    '机型分类': ['机型分类'],
+    '航线': ['起飞机场三字码', '到达机场三字码'],
+}
+
+ROUTE_KEYS = ['起飞机场三字码', '到达机场三字码']  # 分区摘要附加的键：读取时按起降机场筛选
+
+_HIST_LIMIT = 1 << 24  # 分组数×取值范围不超过此值时用直方图去重计数
+
+
+def _k_scale(q, compression):
+    return compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+
+def _compress(groups, means, weights, compression):
+    """
+    合并质心（输入按（分组, 均值）排序且无重复）
+    不同取值数超过compression的分组按k1尺度合并，其余分组原样保留
+    """
+    if compression is None or len(groups) == 0:
+        return groups, means, weights
+    n_groups = int(groups[-1]) + 1
+    oversized = (np.bincount(groups, minlength=n_groups) > compression)[groups]
+    if not oversized.any():
+        return groups, means, weights
+
+    totals = np.bincount(groups, weights=weights, minlength=n_groups)
+    cumulative = np.cumsum(weights)
+    offsets = np.cumsum(totals) - totals
+    right = (cumulative - offsets[groups]) / totals[groups]
+    left = right - weights / totals[groups]
+    k_left, k_right = _k_scale(left, compression), _k_scale(right, compression)
+    heavy = (k_right - k_left) >= 1  # 单个取值已跨越一个k单位，不与相邻取值合并
+    boundaries = np.flatnonzero(groups[1:] != groups[:-1])
+    heavy[np.concatenate(([0], boundaries, boundaries + 1, [len(groups) - 1]))] = True  # 各分组极值单独成质心
+    unit = np.floor(k_left)
+
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = ((groups[1:] != groups[:-1]) | (unit[1:] != unit[:-1]) | heavy[1:] | heavy[:-1] |
+                  ~oversized[1:])
+    ids = np.cumsum(starts) - 1
+    merged_weights = np.bincount(ids, weights=weights).astype(np.int64)
+    merged_means = np.bincount(ids, weights=weights * means) / merged_weights
+    return groups[starts], merged_means, merged_weights
+
+
+def _to_table(index, groups, means, weights):
+    """分组编码 → 以分组键为列的摘要表（mean, weight）"""
+    keys = index[groups].to_frame(index=False)
+    keys['mean'] = means
+    keys['weight'] = weights
+    return apply_schema(keys)
+
+
+@traced
+def build_sketch(df, by, value='delayMin', compression=COMPRESSION):
+    """由航班表构建一个分组的摘要表"""
+    codes, index = group_codes(df, by)
+    values = df[value].to_numpy()
+    valid = codes >= 0
+    if values.dtype.kind == 'f':
+        valid &= ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    if len(values) == 0:
+        return _to_table(index, np.array([], dtype=np.int64), np.array([]), np.array([], dtype=np.int64))
+
+    # 各分组内的不同取值及其计数（按（分组, 取值）有序）
+    if values.dtype.kind in 'biu':
+        low = int(values.min())
+        span = int(values.max()) - low + 1
+        keys = codes * span + (values.astype(np.int64) - low)
+        if len(index) * span <= _HIST_LIMIT:
+            hist = np.bincount(keys, minlength=len(index) * span)
+            keys = np.flatnonzero(hist)
+            weights = hist[keys]
+        else:
+            keys, weights = np.unique(keys, return_counts=True)
+        groups, means = keys // span, (keys % span + low).astype(np.float64)
+    else:
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        starts = np.ones(len(values), dtype=bool)
+        starts[1:] = (codes[1:] != codes[:-1]) | (values[1:] != values[:-1])
+        positions = np.flatnonzero(starts)
+        groups, means = codes[positions], values[positions].astype(np.float64)
+        weights = np.diff(np.append(positions, len(values)))
+
+    return _to_table(index, *_compress(groups, means, weights.astype(np.int64), compression))
+
+
+def build_sketches(df, groupings=SKETCH_GROUPINGS, compression=COMPRESSION):
+    """构建全部分组的摘要：{分组名: 摘要表}"""
+    return {name: build_sketch(df, by, compression=compression) for name, by in groupings.items()}
+
+
+def _key_columns(table):
+    return [col for col in table.columns if col not in ('mean', 'weight')]
+
+
+def _merge(table, by, compression):
+    """按分组键合并质心，返回(分组索引, 分组编码, 均值, 权重)，按（分组, 均值）有序"""
+    by = _key_columns(table) if by is None else ([by] if isinstance(by, str) else list(by))
+    codes, index = group_codes(table, by)
+    valid = codes >= 0
+    codes, means, weights = codes[valid], table['mean'].to_numpy()[valid], table['weight'].to_numpy()[valid]
+
+    order = np.lexsort((means, codes))
+    codes, means, weights = codes[order], means[order], weights[order]
+    starts = np.ones(len(codes), dtype=bool)
+    starts[1:] = (codes[1:] != codes[:-1]) | (means[1:] != means[:-1])  # 相同取值的质心直接合并
+    ids = np.cumsum(starts) - 1
+    weights = np.bincount(ids, weights=weights).astype(np.int64)
+    return (index, *_compress(codes[starts], means[starts], weights, compression))
+
+
+@traced
+def merge_sketches(tables, by=None, compression=COMPRESSION):
+    """
+    合并摘要表（多个月份、机场或数据块）
+    by: 合并后的分组键，默认沿用摘要表的全部键列；可传入更粗的键或新增的标签列（如主基地/外航）
+    compression: 合并后的压缩参数，None表示不压缩
+    """
+    table = pd.concat(tables, ignore_index=True) if isinstance(tables, (list, tuple)) else tables
+    return _to_table(*_merge(table, by, compression))
+
+
+def sketch_kpis(table, by=None, metrics=('count', 'mean', 'median'), value_range=None):
+    """
+    由摘要表计算分组指标（指标名同kpi.group_kpis）：count、mean、min、max、median、pXX
+    by: 分组键，默认摘要表的全部键列
+    value_range: (下限, 上限)，只统计取值在闭区间内的部分（如箱型图的清洗口径）
+    """
+    metrics = list(metrics)
+    unknown = [m for m in metrics if m not in ('count', 'mean', 'min', 'max') and quantile_level(m) is None]
+    if unknown:
+        raise ValueError(f"摘要不支持的指标: {unknown}")
+
+    if value_range is not None:
+        low, high = value_range
+        table = table[(table['mean'] >= low) & (table['mean'] <= high)]
+    index, codes, means, weights = _merge(table, by, compression=None)  # 查询时保留全部质心
+
+    order_stats = OrderStatistics.weighted(codes, means, weights, len(index))
+    counts = order_stats.counts
+    results = {}
+    for metric in metrics:
+        if metric == 'count':
+            results[metric] = counts
+        elif metric == 'mean':
+            results[metric] = np.bincount(codes, weights=weights * means, minlength=len(index)) / counts
+        elif metric in ('min', 'max'):
+            results[metric] = order_stats.quantile(0.0 if metric == 'min' else 1.0)
+        else:
+            results[metric] = order_stats.quantile(quantile_level(metric))
+    return pd.DataFrame(results, index=index, columns=metrics)
+
+
+# ==========================================
+# 分区存储
+# ==========================================
+def _partition_groupings():
+    """分区摘要的分组键：各分组前附加航线键"""
+    return {name: ROUTE_KEYS + [key for key in by if key not in ROUTE_KEYS] for name, by in SKETCH_GROUPINGS.items()}
+
+
+def _empty_sketch(by):
+    return apply_schema(pd.DataFrame({**{key: [] for key in by}, 'mean': np.array([], dtype=np.float64),
+                                      'weight': np.array([], dtype=np.int64)}))
+
+
+@traced
+def write_sketch_partitions(df, airport, sketch_dir=SKETCH_DIR, part_name='part-00000', replace=True):
+    """
+    按 airport=XXX/month=YYYY-MM 分区写出各分组摘要（与flight_io.write_partitions的分区一致）
+    流式处理时每块使用不同part_name追加，读取时合并
+    """
+    if not HAS_PYARROW:
+        print("⚠ 未安装pyarrow，跳过分位数摘要写出")
+        return []
+
+    months = df['计划起飞时间'].dt.strftime('%Y-%m').fillna('unknown')
+    written = []
+    for month, part in df.groupby(months, sort=True):
+        part_dir = Path(sketch_dir) / f'airport={airport}' / f'month={month}'
+        part_dir.mkdir(parents=True, exist_ok=True)
+        if replace:
+            for old in part_dir.glob('*.parquet'):
+                old.unlink()
+        for name, table in build_sketches(part, _partition_groupings()).items():
+            path = part_dir / f'{name}-{part_name}.parquet'
+            table.to_parquet(path, index=False)
+            record_output(path)
+            written.append(path)
+    return written
+
+
+@traced
+def load_sketches(groupings=None, airports=None, start=None, end=None, sketch_dir=SKETCH_DIR):
+    """
+    读取并合并摘要（按机场/月份裁剪分区，月份粒度）
+    机场口径同flight_io.load_partitions：分区选取见scope_partitions，航线键按起飞或到达机场筛选，
+    两端机场均有分区的航线只取所属机场排序靠前的一份
+    groupings: 分组名列表，默认全部；返回 {分组名: 合并后的摘要表}，无匹配航班时为空表
+    摘要分区缺失时由处理后数据重新构建（不写出）
+    """
+    groupings = list(SKETCH_GROUPINGS) if groupings is None else list(groupings)
+    if isinstance(airports, str):
+        airports = [airports]
+    available = {f.name.split('-part-')[0] for *_, d in list_partitions(sketch_dir) for f in d.glob('*.parquet')}
+    if not set(groupings) <= available:
+        print(f"⚠ 未找到分位数摘要（{sorted(set(groupings) - available)}），由处理后数据重建")
+        df = load_processed_flights(airports=airports, start=start, end=end)
+        return build_sketches(df, {g: SKETCH_GROUPINGS[g] for g in groupings})
+
+    partitions = scope_partitions(airports, start, end, sketch_dir)
+    sketches = {}
+    for name in groupings:
+        tables = []
+        for owner, part_dir in partitions:
+            earlier = shared_owners(owner, partitions)
+            for f in sorted(part_dir.glob(f'{name}-*.parquet')):
+                table = pd.read_parquet(f)
+                table = table.loc[partition_mask(table, airports, owner, earlier)]
+                if len(table):
+                    tables.append(table)
+        tables = tables or [_empty_sketch(_partition_groupings()[name])]
+        sketches[name] = merge_sketches(tables, SKETCH_GROUPINGS[name])
+    return sketches
+
+
+def get_sketches(df=None, sketches=None, airports=None, start=None, end=None, groupings=None):
+    """
+    图表取摘要：已传入sketches直接使用；传入df时由df构建；否则从摘要分区加载
+    """
+    if sketches is not None:
+        return sketches
+    if df is not None:
+        groupings = SKETCH_GROUPINGS if groupings is None else {g: SKETCH_GROUPINGS[g] for g in groupings}
+        return build_sketches(df, groupings)
+    return load_sketches(groupings, airports, start, end)
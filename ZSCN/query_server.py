@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+本地航班延误查询服务（asyncio + 标准库HTTP，运控临时查询，无需重跑脚本）
+
+启动时加载一次处理后航班数据，整理为查询所需的列（派生日期、月份、日期类型），
+之后每个查询只做：按筛选条件生成布尔掩码 → kpi.group_kpis 分组计算。
+KPI口径与图表、统计表完全一致（同一计算核）：
+- normal_rate 默认 delayMin ≤ 60分钟（图3-3口径）；normal_threshold=15 即表2-5口径（未延误即正常）
+- delay_rate 为 delayMin > 15分钟；median/pXX 为精确分位数（非立方体近似）
+热点查询结果（已序列化的JSON）按LRU缓存，容量 CACHE_SIZE；字段别名与中文列名规范化后
+再作缓存键，写法不同的同一查询共用缓存。
+
+查询（POST /query 请求体，或 GET /query?q=<URL编码的JSON>）：
+    {
+      "filters": {"airline": "CJX", "day_type": "工作日", "hour": [8, 9], "aircraft_class": "E190支线"},
+      "group_by": [],
+      "metrics": ["count", "normal_rate"]
+    }
+- filters：字段 → 取值 / 取值列表 / {"from": 下限, "to": 上限}（两端均包含）
+  如 "date": {"from": "2025-07-01", "to": "2025-07-15"}，"hour": [8, 9] 即08:00—10:00
+- 字段（FIELDS别名，也可直接用列名）：date、month、hour、weekday（Monday…Sunday）、
+  day_type（工作日/周末，同图3-2口径）、airline、aircraft、aircraft_class、origin、destination
+- group_by：字段列表（空为总计）；metrics：kpi.group_kpis 支持的指标（默认 DEFAULT_METRICS）
+- order_by：指标名，前缀“-”为降序；limit：返回前N组
+- normal_threshold：正常率阈值（分钟）
+返回 {"rows": [...], "matched": 命中航班数, "elapsed_ms": 计算耗时, "cached": 是否命中缓存}
+
+其他接口：GET /health、GET /fields（各字段可选取值与指标）、GET /stats（缓存命中与请求延迟分位数）
+
+查询在事件循环内同步计算（单次为毫秒级，避免线程切换开销）；连接支持HTTP/1.1 keep-alive。
+
+运行方式：
+    python query_server.py                                   # 全部数据，监听 127.0.0.1:8765
+    python query_server.py --airports KHN --start 2025-01 --end 2025-12 --port 9000
+    python query_server.py --measure                         # 不启动服务，测量示例查询的延迟分位数
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from aircraft_types import ensure_aircraft_family
+from flight_store import FlightStore
+from kpi import DEFAULT_METRICS, NORMAL_THRESHOLD, group_kpis
+from parallel_agg import DAY_TYPES, WEEKEND_DAYS
+from tracing import traced
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_SIZE = 256         # LRU缓存的查询结果数
+LATENCY_WINDOW = 10_000  # /stats 统计最近多少个请求的延迟
+MAX_BODY_BYTES = 1 << 20
+
+# 查询字段别名 → 列名
+FIELDS = {
+    'date': '日期',
+    'month': '月份',
+    'hour': '小时段',
+    'weekday': '星期',
+    'day_type': '日期类型',
+    'airline': '所属航司代码',
+    'aircraft': '机型',
+    'aircraft_class': '机型分类',
+    'origin': '起飞机场三字码',
+    'destination': '到达机场三字码',
+}
+
+# prepare_query_frame 用到的航班列（加载时只读取这些列）
+QUERY_COLUMNS = ['计划起飞时间', '小时段', '星期', '所属航司代码', '机型', '机型分类',
+                 '起飞机场三字码', '到达机场三字码', 'delayMin']
+
+# 示例查询（--measure 与 benchmark 的延迟测量用）
+SAMPLE_QUERIES = [
+    {'filters': {'airline': 'CJX', 'day_type': '工作日', 'hour': [8, 9], 'aircraft_class': 'E190支线'},
+     'metrics': ['count', 'normal_rate', 'mean', 'median']},
+    {'group_by': ['airline'], 'metrics': ['count', 'share', 'mean', 'normal_rate', 'median'],
+     'order_by': '-count', 'limit': 10},
+    {'group_by': ['airline'], 'metrics': ['count', 'mean', 'normal_rate'], 'normal_threshold': 15,
+     'order_by': '-count', 'limit': 10},
+    {'filters': {'day_type': '周末'}, 'group_by': ['hour'], 'metrics': ['count', 'mean', 'median', 'p90']},
+    {'group_by': ['aircraft_class', 'day_type'], 'metrics': ['count', 'delay_rate', 'normal_rate', 'p75']},
+    {'filters': {'hour': {'from': 6, 'to': 12}}, 'group_by': ['destination'],
+     'metrics': ['count', 'mean', 'delay_rate'], 'order_by': '-mean', 'limit': 20},
+    {'group_by': ['date'], 'metrics': ['count', 'mean', 'normal_rate']},
+]
+
+
+class QueryError(ValueError):
+    """查询格式或取值错误（HTTP 400）"""
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"无法序列化: {type(value).__name__}")
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+def _column(field):
+    """字段别名或列名 → 列名"""
+    if field in FIELDS:
+        return FIELDS[field]
+    if field in FIELDS.values():
+        return field
+    raise QueryError(f"未知查询字段: {field}（可选 {list(FIELDS)}）")
+
+
+@traced
+def prepare_query_frame(df):
+    """
+    整理查询列：日期、月份为字符串category（由去重后的日期派生，不逐行格式化），
+    日期类型同图3-2口径，机型分类缺失时补算
+    """
+    ensure_aircraft_family(df)
+    day_codes, days = pd.factorize(df['计划起飞时间'].dt.floor('D'), sort=True)
+    months = pd.Index(days.strftime('%Y-%m'))
+    month_categories = months.unique()
+    month_codes = np.append(month_categories.get_indexer(months), -1)[day_codes]  # 日期缺失(-1)取末尾-1
+    weekend = df['星期'].isin(WEEKEND_DAYS).to_numpy()
+    return pd.DataFrame({
+        '日期': pd.Categorical.from_codes(day_codes, categories=days.strftime('%Y-%m-%d')),
+        '月份': pd.Categorical.from_codes(month_codes, categories=month_categories),
+        '日期类型': pd.Categorical.from_codes(weekend.astype(np.int8), dtype=DAY_TYPES),
+        # .array保留category（to_numpy会转为object数组，分组时需重新编码）
+        **{column: df[column].array for column in ['小时段', '星期', '所属航司代码', '机型', '机型分类',
+                                                    '起飞机场三字码', '到达机场三字码', 'delayMin']},
+    })
+
+
+class FlightQueryEngine:
+    """
+    查询引擎：持有整理后的航班列，执行查询并按LRU缓存序列化结果
+    df: 处理后航班数据（含衍生字段）
+    """
+
+    def __init__(self, df, cache_size=CACHE_SIZE):
+        self.frame = prepare_query_frame(df)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = self.misses = 0
+
+    # ---------- 查询规范化 ----------
+    def normalize(self, query):
+        """别名 → 列名，取值统一类型；返回规范化查询（缓存键由其序列化得到）"""
+        if not isinstance(query, dict):
+            raise QueryError("查询须为JSON对象")
+        unknown = set(query) - {'filters', 'group_by', 'metrics', 'order_by', 'limit', 'normal_threshold'}
+        if unknown:
+            raise QueryError(f"未知查询参数: {sorted(unknown)}")
+        filters = {}
+        for field, spec in (query.get('filters') or {}).items():
+            column = _column(field)
+            filters[column] = self._normalize_spec(column, spec)
+        group_by = query.get('group_by') or []
+        group_by = [_column(field) for field in ([group_by] if isinstance(group_by, str) else group_by)]
+        metrics = query.get('metrics') or list(DEFAULT_METRICS)
+        metrics = [metrics] if isinstance(metrics, str) else list(metrics)
+        order_by = query.get('order_by')
+        if order_by is not None and (not isinstance(order_by, str) or order_by.lstrip('-') not in metrics):
+            raise QueryError(f"order_by须为所选指标之一: {order_by}")
+        limit = query.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            raise QueryError(f"limit须为正整数: {limit}")
+        normal_threshold = query.get('normal_threshold', NORMAL_THRESHOLD)
+        if not isinstance(normal_threshold, (int, float)):
+            raise QueryError(f"normal_threshold须为数值: {normal_threshold}")
+        return {'filters': dict(sorted(filters.items())), 'group_by': group_by, 'metrics': metrics,
+                'order_by': order_by, 'limit': limit, 'normal_threshold': normal_threshold}
+
+    def _normalize_value(self, column, value):
+        try:
+            if column == '日期':
+                return pd.Timestamp(value).strftime('%Y-%m-%d')
+            if column == '月份':
+                return pd.Timestamp(value).strftime('%Y-%m')
+            if column == '小时段':
+                return int(value)
+        except (TypeError, ValueError) as e:
+            raise QueryError(f"{column} 取值无效: {value!r}") from e
+        return str(value)
+
+    def _normalize_spec(self, column, spec):
+        if isinstance(spec, dict):
+            unknown = set(spec) - {'from', 'to'}
+            if unknown or not spec:
+                raise QueryError(f"{column} 范围须为 {{\"from\": …, \"to\": …}}")
+            return {key: self._normalize_value(column, value) for key, value in sorted(spec.items())}
+        values = spec if isinstance(spec, list) else [spec]
+        return sorted({self._normalize_value(column, value) for value in values})
+
+    # ---------- 执行 ----------
+    def _match(self, column, spec):
+        """单个筛选条件的布尔掩码：category列在类别上判断后按编码查表，数值列直接比较"""
+        series = self.frame[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if isinstance(spec, dict):
+                allowed = np.ones(len(categories), dtype=bool)
+                if 'from' in spec:
+                    allowed &= categories >= spec['from']
+                if 'to' in spec:
+                    allowed &= categories <= spec['to']
+            else:
+                allowed = categories.isin(spec)
+            return np.append(allowed, False)[series.cat.codes.to_numpy()]  # 缺失值（编码-1）不命中
+        values = series.to_numpy()
+        if isinstance(spec, dict):
+            mask = np.ones(len(values), dtype=bool)
+            if 'from' in spec:
+                mask &= values >= spec['from']
+            if 'to' in spec:
+                mask &= values <= spec['to']
+            return mask
+        return np.isin(values, spec, kind='table')  # 小整数取值：查表，不排序
+
+    def _execute(self, query):
+        mask = None
+        for column, spec in query['filters'].items():
+            matched = self._match(column, spec)
+            mask = matched if mask is None else mask & matched
+        frame = self.frame if mask is None else self.frame.loc[mask, query['group_by'] + ['delayMin']]
+        try:
+            table = group_kpis(frame, query['group_by'], query['metrics'],
+                               normal_threshold=query['normal_threshold'])
+        except ValueError as e:
+            raise QueryError(str(e)) from e
+        if query['order_by']:
+            metric = query['order_by'].lstrip('-')
+            table = table.sort_values(metric, ascending=not query['order_by'].startswith('-'), kind='stable')
+        if query['limit']:
+            table = table.head(query['limit'])
+        if query['group_by']:
+            table = table.reset_index()
+        rows = [{key: None if isinstance(value, float) and math.isnan(value) else value
+                 for key, value in row.items()} for row in table.to_dict('records')]
+        return rows, len(frame)
+
+    def query(self, query):
+        """执行查询，返回(JSON字节, 是否命中缓存)；查询无效时抛出QueryError"""
+        normalized = self.normalize(query)
+        key = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached, True
+
+        self.misses += 1
+        start = time.perf_counter()
+        rows, matched = self._execute(normalized)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        result = {'rows': rows, 'matched': matched, 'elapsed_ms': round(elapsed_ms, 3)}
+        self._cache[key] = _dumps({**result, 'cached': True})
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return _dumps({**result, 'cached': False}), False
+
+    def fields(self):
+        """各查询字段的可选取值（category列为类别，小时段为取值范围）"""
+        result = {}
+        for field, column in FIELDS.items():
+            series = self.frame[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                result[field] = {'column': column, 'values': series.cat.categories.tolist()}
+            else:
+                result[field] = {'column': column, 'range': [int(series.min()), int(series.max())]}
+        return result
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        return {'size': len(self._cache), 'capacity': self.cache_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else None}
+
+
+# ==========================================
+# HTTP服务
+# ==========================================
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class QueryServer:
+    """asyncio流式HTTP/1.1服务：路由到FlightQueryEngine，记录请求延迟"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 毫秒
+
+    def dispatch(self, method, target, body):
+        """路由：返回(状态码, JSON字节)"""
+        url = urlsplit(target)
+        if url.path == '/query':
+            if method == 'POST':
+                text = body.decode('utf-8')
+            elif method == 'GET':
+                text = parse_qs(url.query).get('q', [''])[0]
+            else:
+                return 405, _dumps({'error': f"不支持的方法: {method}"})
+            try:
+                payload, _ = self.engine.query(json.loads(text or '{}'))
+            except json.JSONDecodeError as e:
+                return 400, _dumps({'error': f"JSON解析失败: {e}"})
+            except QueryError as e:
+                return 400, _dumps({'error': str(e)})
+            return 200, payload
+        if method != 'GET':
+            return 405, _dumps({'error': f"不支持的方法: {method}"})
+        if url.path == '/health':
+            return 200, _dumps({'status': 'ok', 'rows': len(self.engine.frame)})
+        if url.path == '/fields':
+            return 200, _dumps({'fields': self.engine.fields(), 'default_metrics': list(DEFAULT_METRICS)})
+        if url.path == '/stats':
+            return 200, _dumps({'cache': self.engine.cache_info(), 'latency_ms': latency_summary(self.latencies)})
+        return 404, _dumps({'error': f"未知路径: {url.path}"})
+
+    async def handle(self, reader, writer):
+        """处理一个连接（keep-alive时依次处理多个请求）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                start = time.perf_counter()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, _dumps({'error': '请求行格式错误'}), False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, _dumps({'error': f"请求体超过{MAX_BODY_BYTES}字节"}), False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, payload = self.dispatch(method, target, body)
+                except Exception as e:  # 单个请求出错不影响服务
+                    status, payload = 500, _dumps({'error': f"{type(e).__name__}: {e}"})
+                await self._respond(writer, status, payload, keep_alive)
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"🚀 查询服务已启动: http://{host}:{port}（POST /query，GET /fields、/stats、/health）")
+        async with server:
+            await server.serve_forever()
+
+
+def latency_summary(latencies):
+    """延迟分位数（毫秒）"""
+    if not latencies:
+        return None
+    values = np.fromiter(latencies, dtype=np.float64)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'n': len(values), 'p50': round(p50, 3), 'p90': round(p90, 3), 'p99': round(p99, 3),
+            'max': round(values.max(), 3)}
+
+
+@traced
+def measure_latency(engine, queries=SAMPLE_QUERIES, repeat=20):
+    """
+    测量查询延迟：每轮清空缓存后依次执行全部查询（未命中），再执行一遍（命中）
+    返回 {'uncached': 分位数, 'cached': 分位数}
+    """
+    uncached, cached = [], []
+    for _ in range(repeat):
+        engine._cache.clear()
+        for timings in (uncached, cached):
+            for query in queries:
+                start = time.perf_counter()
+                engine.query(query)
+                timings.append((time.perf_counter() - start) * 1000)
+    result = {'uncached': latency_summary(uncached), 'cached': latency_summary(cached)}
+    for name, summary in result.items():
+        print(f"⏱️ {name:<8} p50 {summary['p50']:.2f}ms | p90 {summary['p90']:.2f}ms | "
+              f"p99 {summary['p99']:.2f}ms | max {summary['max']:.2f}ms（{summary['n']}次）")
+    return result
+
+
+@traced
+def load_engine(airports=None, start=None, end=None, cache_size=CACHE_SIZE):
+    """加载处理后数据（按机场/月份裁剪，只读取QUERY_COLUMNS）并构建查询引擎"""
+    df = FlightStore().scan(airports, start, end).select(*QUERY_COLUMNS).load()
+    engine = FlightQueryEngine(df, cache_size)
+    print(f"✓ 查询引擎就绪: {len(engine.frame)}条航班")
+    return engine
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地航班延误查询服务（JSON查询，KPI口径同图表与统计表）')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--airports', nargs='*', default=None, help='只加载这些机场（三字码）')
+    parser.add_argument('--start', default=None, help='起始月份，如 2025-01')
+    parser.add_argument('--end', default=None, help='结束月份，如 2025-12')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='LRU缓存的查询结果数')
+    parser.add_argument('--measure', action='store_true', help='测量示例查询的延迟分位数后退出')
+    args = parser.parse_args()
+
+    engine = load_engine(args.airports, args.start, args.end, args.cache_size)
+    if args.measure:
+        measure_latency(engine)
+    else:
+        try:
+            asyncio.run(QueryServer(engine).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print("\n👋 查询服务已停止")
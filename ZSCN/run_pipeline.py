@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+全流程一键运行脚本（第二章数据处理 + 第三章全部图表）
+
+单进程内只加载/清洗/衍生一次数据，随后把内存中的DataFrame交给各图表构建函数，
+相互独立的图表在进程池中并发渲染。运行结束输出各阶段耗时，
+加 --compare 时先按原方式逐个脚本运行一遍，给出端到端加速比。
+
+增量构建：每个阶段按“输入文件哈希 + 阈值参数 + 代码版本 + 上游指纹”计算指纹，
+与上次记录一致且产物仍在的阶段直接复用（见build_state.py），--force 强制全部重建。
+代码版本含阶段所用本地模块及其import展开的全部依赖（如outliers → kpi），不手工列出。
+
+第三章图表渲染后合成单页离线合集 output/figures/图3_图表合集.html（共用本地ECharts，见figure_bundle.py）。
+
+运行方式：
+    python run_pipeline.py                 # 增量构建，并发渲染（默认进程数=min(图表数, CPU核数)）
+    python run_pipeline.py --workers 1     # 串行渲染
+    python run_pipeline.py --force         # 忽略构建记录，全部重建
+    python run_pipeline.py --compare       # 同时测量原逐脚本流程耗时
+    python run_pipeline.py --trace         # 记录各阶段/图表的追踪跨度，导出到output/traces/（见tracing.py）
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import tracing
+from build_state import (BuildState, fingerprint, function_code_hash,
+                         module_code_hash, module_constants, module_dependencies)
+
+# 路径与process_data保持一致（此处不导入process_data，避免无需重建时加载pandas）
+DATA_PATH = Path('data/khn_flight.xlsx')
+OUTPUT_DIR = Path('output')
+TABLES_DIR = OUTPUT_DIR / 'tables'
+FIGURES_DIR = OUTPUT_DIR / 'figures'
+TIMINGS_PATH = OUTPUT_DIR / 'pipeline_timings.json'
+PROCESS_DATA = 'process_data.py'
+FIGURE_BUNDLE = 'figure_bundle.py'
+
+# 原逐脚本流程（用于 --compare 对比）
+LEGACY_SCRIPTS = [
+    'process_data.py',
+    'chart_3_1_24h_trend.py',
+    'chart_3_2_weekday_vs_weekend.py',
+    'chart_3_3_airline_normal_rate.py',
+    'chart_3_4_boxplot_base_vs_external.py',
+    'chart_3_5_aircraft_type_boxplot.py',
+    'chart_3_6_aircraft_scatter.py',
+    'chart_3_7_geo_distribution.py',
+]
+
+
+def _geo_job(df, cube=None):
+    chart_3_7 = importlib.import_module('chart_3_7_geo_distribution')
+    df = chart_3_7.prepare_flight_data(df)
+    return chart_3_7.plot_geo_distribution_enhanced(df, chart_3_7.load_airport_coords(), cube=cube)
+
+
+# 图表任务：构建函数（'模块:函数'或可调用对象）、代码文件、参数常量、额外输入文件、产物；
+# 依赖的本地模块由代码文件的import语句静态展开（build_state.module_dependencies），不手工列出；
+# cube=True 的图表由预聚合立方体上卷，运行时额外传入cube
+CHART_JOBS = {
+    '图2-1': {'func': 'process_data:plot_delay_distribution', 'code': PROCESS_DATA,
+              'outputs': [FIGURES_DIR / '图2-1_delayMin直方图.png']},
+    '图3-1': {'func': 'chart_3_1_24h_trend:plot_24h_trend_standalone', 'code': 'chart_3_1_24h_trend.py',
+              'cube': True,
+              'outputs': [FIGURES_DIR / '图3-1_24小时延误趋势.html']},
+    '图3-2': {'func': 'chart_3_2_weekday_vs_weekend:chart_3_2_weekday_vs_weekend',
+              'code': 'chart_3_2_weekday_vs_weekend.py', 'cube': True,
+              'outputs': [FIGURES_DIR / '图3-2_工作日周末差异.html']},
+    '图3-3': {'func': 'chart_3_3_airline_normal_rate:chart_3_3_airline_normal_rate',
+              'code': 'chart_3_3_airline_normal_rate.py', 'params': ['MIN_FLIGHTS'], 'cube': True,
+              'outputs': [FIGURES_DIR / '图3-3_航司正常率Top10.html']},
+    '图3-4': {'func': 'chart_3_4_boxplot_base_vs_external:plot_base_vs_external_boxplot',
+              'code': 'chart_3_4_boxplot_base_vs_external.py',
+              'outputs': [FIGURES_DIR / '图3-4_主基地与外航延误分布对比.html']},
+    '图3-5': {'func': 'chart_3_5_aircraft_type_boxplot:chart_3_5_aircraft_boxplot',
+              'code': 'chart_3_5_aircraft_type_boxplot.py',
+              'outputs': [FIGURES_DIR / '图3-5_机型箱型对比.html']},
+    '图3-6': {'func': 'chart_3_6_aircraft_scatter:plot_aircraft_scatter', 'code': 'chart_3_6_aircraft_scatter.py',
+              'params': ['OUTLIER_THRESHOLD', 'MIN_DISTANCE_KM', 'PLOT_MODE', 'HEATMAP_DELAY_BIN', 'HEATMAP_DISTANCE_BIN'],
+              'inputs': [OUTPUT_DIR / 'airport_coords.json'],
+              'outputs': [FIGURES_DIR / '图3-6_机型延误散点.html']},
+    '图3-7': {'func': _geo_job, 'code': 'chart_3_7_geo_distribution.py', 'cube': True,
+              'inputs': [OUTPUT_DIR / 'airport_coords.json'],
+              'outputs': [FIGURES_DIR / '图3-7_地理分布.html']},
+}
+
+# 离线合集收录的图表（figure_bundle：单页、共用本地ECharts、懒初始化）
+BUNDLE_CHARTS = [name for name in CHART_JOBS if name.startswith('图3-')]
+
+
+def _resolve(func):
+    """'模块:函数' → 函数对象（按需导入模块）"""
+    if callable(func):
+        return func
+    module_name, func_name = func.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+# ==========================================
+# 阶段指纹
+# ==========================================
+def _module_code(*paths):
+    """模块及其本地依赖（module_dependencies递归展开）的源码哈希"""
+    files = sorted({dep for path in paths for dep in [path] + module_dependencies(path)})
+    return [module_code_hash(path) for path in files]
+
+
+def compute_fingerprints(state):
+    """计算全部阶段指纹（只读源码与文件哈希，不导入任何重型依赖）"""
+    fps = {}
+    fps['load_data'] = fingerprint(
+        inputs={str(DATA_PATH): state.file_hash(DATA_PATH)},
+        code=function_code_hash(PROCESS_DATA, 'load_data'))
+    fps['clean_data'] = fingerprint(
+        upstream=fps['load_data'],
+        params=module_constants(PROCESS_DATA, ['ANOMALY_THRESHOLD']),
+        code=[function_code_hash(PROCESS_DATA, 'clean_data')] + _module_code('outliers.py'))
+    fps['derive_fields'] = fingerprint(
+        upstream=fps['clean_data'],
+        params=module_constants(PROCESS_DATA, ['DELAY_THRESHOLD']),
+        code=[function_code_hash(PROCESS_DATA, 'derive_fields'),
+              function_code_hash(PROCESS_DATA, 'save_processed_data')] +
+             _module_code('aircraft_types.py', 'flight_io.py', 'quantile_sketch.py'))
+    fps['assess_quality'] = fingerprint(
+        upstream=fps['derive_fields'],
+        code=[function_code_hash(PROCESS_DATA, 'assess_quality'),
+              function_code_hash(PROCESS_DATA, 'save_quality_table')])
+    fps['build_cube'] = fingerprint(
+        upstream=fps['derive_fields'],
+        params=module_constants(PROCESS_DATA, ['ANOMALY_THRESHOLD']),
+        code=_module_code('flight_cube.py'))  # 含kpi（上卷口径）、flight_io
+    fps['descriptive_stats'] = fingerprint(
+        upstream=fps['build_cube'],
+        code=[function_code_hash(PROCESS_DATA, 'descriptive_stats'),
+              function_code_hash(PROCESS_DATA, 'save_stats_tables')])
+
+    for name, job in CHART_JOBS.items():
+        if job['code'] == PROCESS_DATA:
+            code = function_code_hash(PROCESS_DATA, job['func'].split(':')[1])
+        else:
+            code = _module_code(job['code'])
+        fps[name] = fingerprint(
+            upstream=fps['build_cube' if job.get('cube') else 'derive_fields'],
+            inputs={str(p): state.file_hash(p) for p in job.get('inputs', [])},
+            params=module_constants(job['code'], job.get('params', [])),
+            code=code)
+
+    # 合集只读取各图HTML：上游为收录图表的指纹，另含vendor目录中的本地资源
+    vendor_dir = Path(module_constants(FIGURE_BUNDLE, ['VENDOR_DIR'])['VENDOR_DIR'])
+    fps['figure_bundle'] = fingerprint(
+        upstream=[fps[name] for name in BUNDLE_CHARTS],
+        inputs={str(p): state.file_hash(p) for p in sorted(vendor_dir.rglob('*.js'))},
+        code=_module_code(FIGURE_BUNDLE))
+    return fps
+
+
+# ==========================================
+# 图表任务（在子进程中执行，数据与立方体由进程初始化时传入）
+# ==========================================
+_DF = None
+_CUBE = None
+
+
+def _init_worker(df, cube=None):
+    global _DF, _CUBE
+    _DF, _CUBE = df, cube
+
+
+def _run_chart(name):
+    """执行单个图表任务，捕获其控制台输出，返回(名称, 耗时, 输出, 错误, 追踪跨度)"""
+    buffer = io.StringIO()
+    start = time.perf_counter()
+    error = None
+    with contextlib.redirect_stdout(buffer), tracing.span(f'chart:{name}', 'pipeline'):
+        try:
+            kwargs = {'cube': _CUBE} if CHART_JOBS[name].get('cube') else {}
+            _resolve(CHART_JOBS[name]['func'])(_DF.copy(), **kwargs)  # 各图表可能增改列，传入副本互不干扰
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return name, time.perf_counter() - start, buffer.getvalue(), error, tracing.collect()
+
+
+# ==========================================
+# 流水线
+# ==========================================
+def _timed(timings, stage, func, *args):
+    start = time.perf_counter()
+    with tracing.span(f'stage:{stage}', 'pipeline'):
+        result = func(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def run_pipeline(workers=None, verbose=False, force=False):
+    """执行全流程（增量），返回(各阶段耗时字典, 复用阶段列表, 重建阶段列表)"""
+    timings = {}
+    total_start = time.perf_counter()
+    state = BuildState()
+    fps = compute_fingerprints(state)
+    fresh = {stage: (not force) and state.is_fresh(stage, fp) for stage, fp in fps.items()}
+    reused, rebuilt = [], []
+
+    stale_tables = [s for s in ('assess_quality', 'descriptive_stats') if not fresh[s]]
+    stale_charts = [name for name in CHART_JOBS if not fresh[name]]
+    needs_cube = 'descriptive_stats' in stale_tables or any(CHART_JOBS[n].get('cube') for n in stale_charts)
+
+    # 第二章：数据只加载、清洗、衍生一次（衍生产物未变时直接读取列式副本）
+    df = None
+    if not fresh['derive_fields']:
+        process_data = importlib.import_module('process_data')
+        df = _timed(timings, 'load_data', process_data.load_data)
+        df = _timed(timings, 'clean_data', process_data.clean_data, df)
+        df = _timed(timings, 'derive_fields', process_data.derive_fields, df)
+        _timed(timings, 'save_processed_data', process_data.save_processed_data, df)
+        _timed(timings, 'write_partitions', process_data.write_partitions, df, process_data.BASE_AIRPORT)
+        _timed(timings, 'write_sketches', process_data.write_sketch_partitions, df, process_data.BASE_AIRPORT)
+        for stage in ('load_data', 'clean_data'):
+            state.record(stage, fps[stage])
+            rebuilt.append(stage)
+        state.record('derive_fields', fps['derive_fields'],
+                     [OUTPUT_DIR / 'khn_flight_processed.xlsx', OUTPUT_DIR / 'khn_flight_processed.parquet'])
+        rebuilt.append('derive_fields')
+    else:
+        reused += ['load_data', 'clean_data', 'derive_fields']
+        if stale_tables or stale_charts:
+            from flight_io import load_processed_flights
+            df = _timed(timings, 'load_processed', load_processed_flights)
+
+    # 预聚合立方体：衍生数据或立方体代码变化时重建，否则按需读取
+    cube = None
+    if not fresh['build_cube']:
+        process_data = importlib.import_module('process_data')
+        cube = _timed(timings, 'build_cube', process_data.build_cube, df, process_data.ANOMALY_THRESHOLD)
+        process_data.save_cube(cube)
+        process_data.write_cube_partitions(cube, process_data.BASE_AIRPORT)
+        state.record('build_cube', fps['build_cube'], [OUTPUT_DIR / 'khn_flight_cube.parquet'])
+        rebuilt.append('build_cube')
+    else:
+        reused.append('build_cube')
+        if needs_cube:
+            from flight_cube import load_cube
+            cube = _timed(timings, 'load_cube', load_cube)
+
+    if 'assess_quality' in stale_tables:
+        process_data = importlib.import_module('process_data')
+        quality_df = _timed(timings, 'assess_quality', process_data.assess_quality, df)
+        process_data.save_quality_table(quality_df)
+        state.record('assess_quality', fps['assess_quality'], [TABLES_DIR / '表2-4_数据质量评估.xlsx'])
+    if 'descriptive_stats' in stale_tables:
+        process_data = importlib.import_module('process_data')
+        airline_stats, aircraft_stats = _timed(timings, 'descriptive_stats', process_data.descriptive_stats, df, cube)
+        process_data.save_stats_tables(airline_stats, aircraft_stats)
+        state.record('descriptive_stats', fps['descriptive_stats'],
+                     [TABLES_DIR / '表2-5_航司统计TOP10.xlsx', TABLES_DIR / '表2-6_机型统计.xlsx'])
+    rebuilt += stale_tables
+    reused += [s for s in ('assess_quality', 'descriptive_stats') if fresh[s]]
+
+    # 图表：进程池并发渲染（仅渲染指纹变化的图表）
+    failures = []
+    if stale_charts:
+        for name in stale_charts:  # 主进程先导入，fork出的子进程直接继承已导入模块
+            _resolve(CHART_JOBS[name]['func'])
+        workers = workers or min(len(stale_charts), os.cpu_count() or 1)
+        print(f"\n🚀 渲染{len(stale_charts)}张图表（进程数: {workers}）...")
+        chart_start = time.perf_counter()
+        if workers == 1:
+            _init_worker(df, cube)
+            results = [_run_chart(name) for name in stale_charts]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df, cube)) as pool:
+                futures = [pool.submit(_run_chart, name) for name in stale_charts]
+                results = [future.result() for future in as_completed(futures)]
+        for name, seconds, output, error, spans in results:
+            tracing.extend(spans)
+            timings[f'chart:{name}'] = seconds
+            if verbose:
+                print(output)
+            if error:
+                failures.append(name)
+                print(f"  ✗ {name} 失败（{seconds:.2f}s）: {error}")
+            else:
+                state.record(name, fps[name], CHART_JOBS[name]['outputs'])
+                rebuilt.append(name)
+                print(f"  ✓ {name} 完成（{seconds:.2f}s）")
+        timings['charts_wall'] = time.perf_counter() - chart_start
+    reused += [name for name in CHART_JOBS if fresh[name]]
+
+    # 离线合集：收录图表或vendor资源变化时重新合成（不重新渲染图表）
+    if fresh['figure_bundle']:
+        reused.append('figure_bundle')
+    elif any(name in failures for name in BUNDLE_CHARTS):
+        print("⚠ 存在失败图表，跳过图表合集")
+    else:
+        figure_bundle = importlib.import_module('figure_bundle')
+        print()
+        try:
+            bundle_path, asset_paths = _timed(timings, 'figure_bundle', figure_bundle.build_bundle,
+                                              [CHART_JOBS[name]['outputs'][0] for name in BUNDLE_CHARTS])
+        except FileNotFoundError as e:  # vendor资源缺失：不记录该阶段，补齐资源后下次运行重建
+            print(f"⚠ 跳过图表合集: {e}")
+        else:
+            state.record('figure_bundle', fps['figure_bundle'], [bundle_path, *asset_paths])
+            rebuilt.append('figure_bundle')
+
+    state.save()
+    timings['total'] = time.perf_counter() - total_start
+
+    print(f"\n♻️  复用: {', '.join(reused) if reused else '无'}")
+    print(f"🔨 重建: {', '.join(rebuilt) if rebuilt else '无'}")
+    if failures:
+        print(f"✗ 失败图表: {failures}")
+    return timings, reused, rebuilt
+
+
+def run_legacy():
+    """按原方式逐个脚本独立运行，返回总耗时（秒）"""
+    print("\n⏱️  原逐脚本流程计时中...")
+    start = time.perf_counter()
+    for script in LEGACY_SCRIPTS:
+        t0 = time.perf_counter()
+        result = subprocess.run([sys.executable, script], capture_output=True, text=True,
+                                env={**os.environ, 'MPLBACKEND': 'Agg'})
+        status = '✓' if result.returncode == 0 else '✗'
+        print(f"  {status} {script}: {time.perf_counter() - t0:.2f}s")
+    return time.perf_counter() - start
+
+
+def print_timings(timings, legacy_seconds=None):
+    print("\n" + "=" * 50)
+    print("⏱️  各阶段耗时")
+    print("=" * 50)
+    for stage, seconds in timings.items():
+        print(f"  {stage:<20} {seconds:>8.3f}s")
+    if legacy_seconds is not None:
+        print(f"\n  原逐脚本流程总耗时: {legacy_seconds:.2f}s")
+        print(f"  一体化流程总耗时:   {timings['total']:.2f}s")
+        print(f"  端到端加速比:       {legacy_seconds / timings['total']:.2f}×")
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('MPLBACKEND', 'Agg')  # 无界面渲染（不在此导入matplotlib，无需重建时保持秒级以内）
+
+    parser = argparse.ArgumentParser(description='第二章数据处理 + 第三章图表一体化运行')
+    parser.add_argument('--workers', type=int, default=None, help='图表渲染进程数（1为串行）')
+    parser.add_argument('--force', action='store_true', help='忽略构建记录，全部重建')
+    parser.add_argument('--compare', action='store_true', help='先按原逐脚本方式运行并计时，输出加速比')
+    parser.add_argument('--verbose', action='store_true', help='输出各图表的完整控制台信息')
+    parser.add_argument('--trace', action='store_true', help='记录追踪跨度并导出JSON与Chrome trace')
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()  # 须在创建进程池之前开启，子进程随fork继承
+
+    legacy_seconds = run_legacy() if args.compare else None
+    timings, reused, rebuilt = run_pipeline(workers=args.workers, verbose=args.verbose,
+                                            force=args.force or args.compare)
+    print_timings(timings, legacy_seconds)
+
+    report = {'timings': timings, 'legacy_total': legacy_seconds, 'workers': args.workers,
+              'reused': reused, 'rebuilt': rebuilt}
+    with open(TIMINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📁 耗时报告: {TIMINGS_PATH}")
+
+    if tracing.is_enabled():
+        tracing.print_summary()
+        spans_path, trace_path = tracing.export(f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}")
+        print(f"📁 追踪结果: {trace_path}（chrome://tracing 打开）, 跨度明细: {spans_path}")
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+批量显著性检验（第三章图表与核查脚本共用）
+
+compare_groups(df, by, mode) 一次完成一整组比较，每个比较给出三种检验、精确效应量与多重比较校正：
+- Mann-Whitney U（双侧，正态近似+连续性校正+结差校正，同scipy.stats.mannwhitneyu的asymptotic方法）
+  效应量：秩二列相关 rank_biserial = 2U/(n₁n₂) − 1（>0表示本组延误偏大），r = Z/√N
+- t检验（默认等方差，同scipy.stats.ttest_ind；equal_var=False为Welch）；效应量：Cohen's d（合并标准差）
+- 卡方检验（延误/未延误2×2列联表，Yates校正，同scipy.stats.chi2_contingency）；效应量：φ系数、延误率差
+比较方式（mode）：
+- 'vs_rest'：每组对其余全部航班（如各航司vs其余、各小时段vs其余）
+- 'pairwise'：组间两两比较（如机型分类两两）
+校正（correction）：'holm'、'bh'（Benjamini-Hochberg）、'bonferroni'，在同一组比较内对每种检验分别校正。
+
+实现：每组比较只排序一次——取值去重（整数取值用直方图，不排序）后得到“分组×取值”计数矩阵，
+任意两组（或某组与其余）的U统计量与结差校正项均由该矩阵的累计计数与矩阵乘法一次算出；
+t检验与卡方检验只需各组的计数、和、平方和与延误数（bincount）。全部比较向量化，不逐对调用scipy。
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from kpi import DELAY_THRESHOLD, group_codes
+from tracing import traced
+
+TESTS = ('mannwhitney', 'ttest', 'chi2')
+CORRECTIONS = ('holm', 'bh', 'bonferroni')
+MIN_GROUP_SIZE = 10  # 样本量低于此值的分组不参与比较（仍计入“其余”）
+REST_LABEL = '其余'
+
+# 常用比较集：名称 → (分组键, 比较方式)
+COMPARISON_SETS = {
+    '航司vs其余': ('所属航司代码', 'vs_rest'),
+    '机型分类两两': ('机型分类', 'pairwise'),
+    '小时段vs其余': ('小时段', 'vs_rest'),
+}
+
+_HIST_LIMIT = 1 << 24  # 整数取值范围不超过此值时用直方图去重
+
+
+# ==========================================
+# 单项检验（输入为数组，逐元素向量化）
+# ==========================================
+def adjust_pvalues(p_values, method='holm'):
+    """多重比较校正（NaN不参与、原样保留）"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full(p_values.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    m = len(valid)
+    if m == 0:
+        return adjusted
+    order = valid[np.argsort(p_values[valid], kind='stable')]
+    ranked = p_values[order]
+    if method == 'holm':
+        values = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == 'bh':
+        values = np.minimum.accumulate((m / np.arange(1, m + 1) * ranked)[::-1])[::-1]
+    elif method == 'bonferroni':
+        values = m * ranked
+    else:
+        raise ValueError(f"未知校正方法: {method}（可选 {list(CORRECTIONS)}）")
+    adjusted[order] = np.minimum(values, 1.0)
+    return adjusted
+
+
+def ttest_from_stats(n1, mean1, std1, n2, mean2, std2, equal_var=True):
+    """两样本t检验（由样本量、均值、样本标准差），返回(t, p, Cohen's d)"""
+    n1, n2 = np.asarray(n1, dtype=np.float64), np.asarray(n2, dtype=np.float64)
+    var1, var2 = np.asarray(std1, dtype=np.float64) ** 2, np.asarray(std2, dtype=np.float64) ** 2
+    diff = np.asarray(mean1, dtype=np.float64) - np.asarray(mean2, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled = ((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2)
+        if equal_var:
+            se = np.sqrt(pooled * (1 / n1 + 1 / n2))
+            dof = n1 + n2 - 2
+        else:
+            a, b = var1 / n1, var2 / n2
+            se = np.sqrt(a + b)
+            dof = (a + b) ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n2 - 1))
+        t = diff / se
+        return t, 2 * stats.t.sf(np.abs(t), dof), diff / np.sqrt(pooled)
+
+
+def chi2_2x2(k1, n1, k2, n2, correction=True):
+    """
+    2×2列联表卡方检验（两组的“事件数/样本量”，如延误航班数/航班数）
+    返回(χ², p, φ)；φ按未校正表计算，符号表示第一组事件率更高
+    """
+    k1, n1, k2, n2 = (np.asarray(x, dtype=np.float64) for x in (k1, n1, k2, n2))
+    total, events = n1 + n2, k1 + k2
+    cross = k1 * (n2 - k2) - k2 * (n1 - k1)
+    denominator = n1 * n2 * events * (total - events)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        deviation = np.abs(cross) / total  # 各格|观测−期望|（2×2表四格相同）
+        if correction:
+            deviation = np.maximum(deviation - 0.5, 0)
+        chi2 = deviation ** 2 * total ** 3 / denominator
+        return chi2, stats.chi2.sf(chi2, 1), cross / np.sqrt(denominator)
+
+
+def _mann_whitney_p(u, n1, n2, tie_term):
+    """U统计量 → (Z, p, 秩二列相关, r)；tie_term 为合并样本的 Σ(t³−t)"""
+    n1, n2 = np.asarray(n1, dtype=np.float64), np.asarray(n2, dtype=np.float64)
+    n = n1 + n2
+    deviation = u - n1 * n2 / 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        z = deviation / sigma
+        p = np.minimum(2 * stats.norm.sf((np.abs(deviation) - 0.5) / sigma), 1.0)
+        return z, p, 2 * deviation / (n1 * n2), z / np.sqrt(n)
+
+
+# ==========================================
+# 批量比较
+# ==========================================
+def _count_matrix(codes, values, n_groups):
+    """“分组×不同取值”计数矩阵（取值按升序），整数取值用直方图去重，其余排序一次"""
+    if values.dtype.kind in 'biu' and len(values):
+        low = int(values.min())
+        span = int(values.max()) - low + 1
+        if span <= _HIST_LIMIT:
+            shifted = values.astype(np.int64) - low
+            present = np.bincount(shifted, minlength=span) > 0
+            lookup = np.cumsum(present) - 1
+            inverse, n_values = lookup[shifted], int(present.sum())
+        else:
+            _, inverse = np.unique(values, return_inverse=True)
+            n_values = int(inverse.max()) + 1
+    else:
+        _, inverse = np.unique(values, return_inverse=True)
+        n_values = int(inverse.max()) + 1 if len(values) else 0
+    counts = np.bincount(codes * n_values + inverse, minlength=n_groups * n_values)
+    return counts.reshape(n_groups, n_values).astype(np.float64)
+
+
+@traced
+def compare_groups(df, by, mode='vs_rest', value='delayMin', tests=TESTS, groups=None, correction='holm',
+                   min_count=MIN_GROUP_SIZE, delay_threshold=DELAY_THRESHOLD, equal_var=True):
+    """
+    一组比较的批量检验
+    by: 分组键；mode: 'vs_rest' 或 'pairwise'
+    groups: 只比较这些分组（默认样本量不低于min_count的全部分组）
+    返回每个比较一行的DataFrame：group、other、n、n_other、mean、mean_other、delay_rate、delay_rate_other，
+    以及各检验的统计量、p值、校正后p值（*_adj）与效应量
+    """
+    if mode not in ('vs_rest', 'pairwise'):
+        raise ValueError(f"未知比较方式: {mode}（可选 'vs_rest'、'pairwise'）")
+    unknown = [t for t in tests if t not in TESTS]
+    if unknown:
+        raise ValueError(f"未知检验: {unknown}（可选 {list(TESTS)}）")
+
+    codes, index = group_codes(df, by)
+    values = df[value].to_numpy()
+    valid = codes >= 0
+    if values.dtype.kind == 'f':
+        valid &= ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    n_groups = len(index)
+
+    counts = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    selected = counts >= min_count
+    if groups is not None:
+        selected &= index.isin(groups)
+    selected = np.flatnonzero(selected)
+    if mode == 'vs_rest':
+        left, right = selected, None
+    else:
+        first, second = np.triu_indices(len(selected), 1)
+        left, right = selected[first], selected[second]
+
+    # 各组充分统计量（以总体均值为中心，减小平方和的舍入误差）
+    center = values.mean() if len(values) else 0.0
+    shifted = values - center
+    sums = np.bincount(codes, weights=shifted, minlength=n_groups)
+    squares = np.bincount(codes, weights=shifted ** 2, minlength=n_groups)
+    delayed = np.bincount(codes, weights=values > delay_threshold, minlength=n_groups)
+
+    def side(stat, total):
+        """比较的另一方：vs_rest为全体减本组，pairwise为第二组"""
+        return total - stat[left] if right is None else stat[right]
+
+    n1, n2 = counts[left], side(counts, counts.sum())
+    s1, s2 = sums[left], side(sums, sums.sum())
+    q1, q2 = squares[left], side(squares, squares.sum())
+    k1, k2 = delayed[left], side(delayed, delayed.sum())
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean1, mean2 = s1 / n1, s2 / n2
+        std1 = np.sqrt(np.maximum(q1 - s1 * mean1, 0) / (n1 - 1))
+        std2 = np.sqrt(np.maximum(q2 - s2 * mean2, 0) / (n2 - 1))
+        result = pd.DataFrame({
+            'group': index[left],
+            'other': REST_LABEL if right is None else index[right],
+            'n': n1.astype(np.int64),
+            'n_other': n2.astype(np.int64),
+            'mean': mean1 + center,
+            'mean_other': mean2 + center,
+            'delay_rate': k1 / n1 * 100,
+            'delay_rate_other': k2 / n2 * 100,
+        })
+
+    if 'mannwhitney' in tests:
+        matrix = _count_matrix(codes, values, n_groups)
+        below = np.cumsum(matrix, axis=1) - matrix  # 各组中严格小于该取值的个数
+        if right is None:
+            total, total_below = matrix.sum(axis=0), below.sum(axis=0)
+            rest, rest_below = total - matrix[left], total_below - below[left]
+            u = np.einsum('gv,gv->g', matrix[left], rest_below + 0.5 * rest)
+            tie_term = np.full(len(left), np.sum(total ** 3 - total))
+        else:
+            sub, sub_below = matrix[selected], below[selected]
+            u_matrix = sub @ (sub_below + 0.5 * sub).T
+            cross = (sub ** 2) @ sub.T  # Σ c_a²·c_b
+            cubes = (sub ** 3).sum(axis=1)
+            u = u_matrix[first, second]
+            tie_term = (cubes[first] + cubes[second] + 3 * cross[first, second] + 3 * cross[second, first]
+                        - n1 - n2)
+        z, p, rank_biserial, r = _mann_whitney_p(u, n1, n2, tie_term)
+        result['U'] = u
+        result['z'] = z
+        result['p_mw'] = p
+        result['p_mw_adj'] = adjust_pvalues(p, correction)
+        result['rank_biserial'] = rank_biserial
+        result['r'] = r
+
+    if 'ttest' in tests:
+        t, p, d = ttest_from_stats(n1, mean1, std1, n2, mean2, std2, equal_var)
+        result['t'] = t
+        result['p_t'] = p
+        result['p_t_adj'] = adjust_pvalues(p, correction)
+        result['cohen_d'] = d
+
+    if 'chi2' in tests:
+        chi2, p, phi = chi2_2x2(k1, n1, k2, n2)
+        result['chi2'] = chi2
+        result['p_chi2'] = p
+        result['p_chi2_adj'] = adjust_pvalues(p, correction)
+        result['phi'] = phi
+    return result
+
+
+def run_comparison_sets(df, sets=COMPARISON_SETS, **kwargs):
+    """按COMPARISON_SETS逐组批量检验，返回 {比较集名称: 结果表}"""
+    return {name: compare_groups(df, by, mode, **kwargs) for name, (by, mode) in sets.items()}
+
+
+if __name__ == '__main__':
+    import argparse
+    from pathlib import Path
+
+    from aircraft_types import ensure_aircraft_family
+    from flight_io import load_processed_flights
+
+    parser = argparse.ArgumentParser(description='批量显著性检验（航司vs其余、机型分类两两、小时段vs其余）')
+    parser.add_argument('--airports', default=None, help='逗号分隔的机场三字码（分区裁剪）')
+    parser.add_argument('--start', default=None, help='起始月份，如2025-06')
+    parser.add_argument('--end', default=None, help='结束月份，如2025-08')
+    parser.add_argument('--correction', choices=CORRECTIONS, default='holm', help='多重比较校正方法')
+    parser.add_argument('--alpha', type=float, default=0.05, help='显著性水平（按校正后p值判断）')
+    args = parser.parse_args()
+
+    df = load_processed_flights(airports=args.airports.split(',') if args.airports else None,
+                                start=args.start, end=args.end)
+    ensure_aircraft_family(df)
+
+    start = time.perf_counter()
+    results = run_comparison_sets(df, correction=args.correction)
+    seconds = time.perf_counter() - start
+    n_comparisons = sum(len(result) for result in results.values())
+    print(f"✅ 批量检验完成: {n_comparisons}个比较 × {len(TESTS)}种检验，耗时{seconds:.3f}s"
+          f"（{n_comparisons / seconds:,.0f}个比较/秒）")
+
+    columns = ['group', 'other', 'n', 'n_other', 'mean', 'mean_other', 'rank_biserial', 'p_mw_adj', 'cohen_d',
+               'p_t_adj', 'phi', 'p_chi2_adj']
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        for name, result in results.items():
+            significant = result[result['p_mw_adj'] < args.alpha]
+            print(f"\n📊 {name}: {len(result)}个比较，Mann-Whitney校正后显著{len(significant)}个（{args.correction}）")
+            print(result[columns].round(4).to_string(index=False))
+
+    output_path = Path('output/tables/批量显著性检验.xlsx')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with pd.ExcelWriter(output_path) as writer:
+        for name, result in results.items():
+            result.to_excel(writer, sheet_name=name, index=False)
+    print(f"\n✅ 检验结果已保存: {output_path}")
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+合成航班数据生成器（与 data/khn_flight.xlsx 同结构的10列原始数据，用于大样本压测流水线与图表）
+
+分布由真实样本标定（calibrate）：
+- 航司 × 机型 × 起飞/到达机场：按真实组合频率联合抽样（保留航司机型搭配与进出港比例）
+- 计划起飞时刻：按真实样本的分钟级时刻分布抽样（保留各小时航班波）
+- 计划航段时长：取真实航线的计划时长中位数
+- delayMin：分小时的经验分位数（≤180分钟部分）+ 帕累托重尾（>180分钟，尾部指数由Hill估计），
+  各小时的重尾比例同样取自真实样本
+- 实际到达：在起飞延误基础上叠加真实的“到达延误−起飞延误”经验分布
+航班号按（日期, 航班号前缀）内的时刻顺序编号，航班号+计划起飞时间不重复，清洗去重不会丢行。
+
+全部按列向量化生成、按整天分块产出；同一种子、同一参数的输出完全一致。
+
+运行方式：
+    python synth_flights.py 1000000                                  # 默认写出 output/synthetic/*.parquet
+    python synth_flights.py 50000000 -o output/synthetic/khn_50m.csv --seed 7
+    python synth_flights.py 8600 -o output/synthetic/khn_small.xlsx --days 31
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = Path('data/khn_flight.xlsx')
+OUTPUT_DIR = Path('output/synthetic')
+
+RAW_COLUMNS = ['航班号', '起飞机场三字码', '到达机场三字码', '计划起飞时间', '计划到达时间',
+               '实际起飞时间', '实际到达时间', '机型', '所属航司代码', 'delayMin']
+TIME_COLS = ['计划起飞时间', '计划到达时间', '实际起飞时间', '实际到达时间']
+COMBO_COLS = ['所属航司代码', '机型', '起飞机场三字码', '到达机场三字码']
+
+DEFAULT_SEED = 2025
+DEFAULT_START = '2025-07-01'
+TAIL_THRESHOLD = 180       # 重尾起点（分钟），与process_data.ANOMALY_THRESHOLD一致
+MIN_HOUR_SAMPLES = 30      # 某小时真实样本少于该值时使用全天合并分布
+QUANTILE_POINTS = 201      # 经验分位数网格点数
+BLOCK_RANGE = (20, 900)    # 有效计划航段时长（分钟），超出视为脏数据不参与标定
+OFFSET_RANGE = (-120, 120) # 有效“到达延误−起飞延误”（分钟），超出视为脏数据不参与标定
+MAX_DAYS = 3650            # 自动推算的日期跨度上限（超出后按日加密航班）
+CHUNK_ROWS = 2_000_000     # 每块生成行数上限（按整天切分）
+XLSX_MAX_ROWS = 1_048_575  # Excel单表行数上限（不含表头）
+FLIGHT_NO_BASE = 1001      # 航班号数字部分起点
+FLIGHT_NO_SPAN = 8999      # 航班号数字部分可用个数（1001-9999）
+
+_MINUTE_NS = 60 * 10 ** 9
+
+
+class FlightProfile:
+    """
+    由真实样本标定的分布参数
+    航司/机型/机场按“组合”存放：组合频率combo_p，各列取值以(组合→类别编码, 类别)形式保存，
+    生成时只需抽样组合下标，再按下标取编码构造category列。
+    """
+
+    def __init__(self, raw):
+        raw = raw.dropna(subset=['航班号', 'delayMin', '计划起飞时间']).copy()
+        for col in TIME_COLS:
+            raw[col] = pd.to_datetime(raw[col], errors='coerce')
+        delay = raw['delayMin'].to_numpy(dtype=np.float64)
+        hour = raw['计划起飞时间'].dt.hour.to_numpy()
+
+        # 航司 × 机型 × 起降机场的联合频率
+        combos = raw.groupby(COMBO_COLS, observed=True).size().rename('n').reset_index()
+        self.combo_p = (combos['n'] / combos['n'].sum()).to_numpy()
+        self.combo_codes = {}
+        for col in COMBO_COLS:
+            categories, codes = np.unique(combos[col].astype(str).to_numpy(), return_inverse=True)
+            self.combo_codes[col] = (codes, categories)
+
+        # 航班号前缀：各航司最常用的两位代码（不同航司可能共用前缀，编号时按前缀分组）
+        prefix = raw['航班号'].astype(str).str[:2].groupby(raw['所属航司代码']).agg(lambda s: s.mode().iloc[0])
+        self.prefixes, self.combo_prefix = np.unique(
+            prefix.reindex(combos['所属航司代码']).to_numpy(dtype=str), return_inverse=True)
+
+        # 航线计划时长中位数（脏数据剔除；无有效记录的航线用全体中位数）
+        block = (raw['计划到达时间'] - raw['计划起飞时间']).dt.total_seconds() / 60
+        valid = block.between(*BLOCK_RANGE)
+        route_block = block[valid].groupby([raw.loc[valid, '起飞机场三字码'], raw.loc[valid, '到达机场三字码']]).median()
+        route_index = pd.MultiIndex.from_frame(combos[['起飞机场三字码', '到达机场三字码']])
+        self.combo_block = (route_block.reindex(route_index).fillna(block[valid].median())
+                            .round().to_numpy(np.int64))
+
+        # 计划起飞时刻（一天内第几分钟）
+        tod = (raw['计划起飞时间'].dt.hour * 60 + raw['计划起飞时间'].dt.minute).to_numpy()
+        counts = np.bincount(tod, minlength=1440).astype(np.float64)
+        self.tod_p = counts / counts.sum()
+
+        # delayMin：分小时的主体分位数与重尾比例（第24行为全天合并，样本不足的小时沿用）
+        grid = np.linspace(0, 1, QUANTILE_POINTS)
+        body = delay <= TAIL_THRESHOLD
+        self.body_quantiles = np.tile(np.quantile(delay[body], grid), (25, 1))
+        self.tail_rate = np.full(25, (~body).mean())
+        for h in range(24):
+            in_hour = hour == h
+            if in_hour.sum() >= MIN_HOUR_SAMPLES and (in_hour & body).any():
+                self.body_quantiles[h] = np.quantile(delay[in_hour & body], grid)
+                self.tail_rate[h] = (~body[in_hour]).mean()
+
+        tail = delay[~body]
+        self.tail_alpha = float(len(tail) / np.log(tail / TAIL_THRESHOLD).sum()) if len(tail) else 3.0
+        self.tail_max = float(tail.max()) if len(tail) else TAIL_THRESHOLD * 10.0
+
+        # 到达延误 − 起飞延误（分钟）的经验分位数
+        dep_delay = (raw['实际起飞时间'] - raw['计划起飞时间']).dt.total_seconds() / 60
+        arr_delay = (raw['实际到达时间'] - raw['计划到达时间']).dt.total_seconds() / 60
+        offset = (arr_delay - dep_delay).dropna()
+        self.arrival_offset_quantiles = np.quantile(offset[offset.between(*OFFSET_RANGE)].to_numpy(), grid)
+
+        self.daily_flights = len(raw) / max(1, raw['计划起飞时间'].dt.normalize().nunique())
+        self.n_samples = len(raw)
+        self._flight_labels = None
+
+    @classmethod
+    def from_file(cls, path=DATA_PATH):
+        path = Path(path)
+        raw = pd.read_csv(path) if path.suffix.lower() == '.csv' else pd.read_excel(path)
+        return cls(raw)
+
+    def flight_labels(self):
+        """全部可用航班号（前缀 × 1001-9999），编码 = 前缀序号 × FLIGHT_NO_SPAN + 数字偏移"""
+        if self._flight_labels is None:
+            numbers = np.char.mod('%d', FLIGHT_NO_BASE + np.arange(FLIGHT_NO_SPAN))
+            self._flight_labels = np.char.add(np.repeat(self.prefixes, FLIGHT_NO_SPAN),
+                                              np.tile(numbers, len(self.prefixes))).astype(object)
+        return self._flight_labels
+
+    def summary(self):
+        return (f"样本{self.n_samples:,}行 | {len(self.combo_p)}个航司-机型-航线组合 | "
+                f"日均{self.daily_flights:.0f}班 | >{TAIL_THRESHOLD}分钟占比{self.tail_rate[24] * 100:.2f}% | "
+                f"尾部指数α={self.tail_alpha:.2f}")
+
+
+def calibrate(path=DATA_PATH):
+    """由真实数据标定分布参数"""
+    profile = FlightProfile.from_file(path)
+    print(f"📐 分布标定: {profile.summary()}")
+    return profile
+
+
+# ==========================================
+# 生成
+# ==========================================
+def _inverse_cdf(quantiles, u, rows=None):
+    """经验分位数逆变换抽样；rows不为None时quantiles为二维，每个样本取其所在行"""
+    pos = u * (QUANTILE_POINTS - 1)
+    lo = np.minimum(pos.astype(np.int64), QUANTILE_POINTS - 2)
+    frac = pos - lo
+    if rows is None:
+        return quantiles[lo] * (1 - frac) + quantiles[lo + 1] * frac
+    return quantiles[rows, lo] * (1 - frac) + quantiles[rows, lo + 1] * frac
+
+
+def _sample_delay(profile, hour, rng):
+    """delayMin：按小时的重尾比例决定是否落入尾部，主体取该小时经验分位数，尾部取帕累托分布"""
+    n = len(hour)
+    in_tail = rng.random(n) < profile.tail_rate[hour]
+    delay = np.round(_inverse_cdf(profile.body_quantiles, rng.random(n), rows=hour))
+    tail = TAIL_THRESHOLD * (1 - rng.random(int(in_tail.sum()))) ** (-1 / profile.tail_alpha)
+    delay[in_tail] = np.minimum(np.floor(tail) + 1, profile.tail_max)
+    return delay.astype(np.int64)
+
+
+def _flight_numbers(profile, combo, day, tod):
+    """按（日期, 前缀）内的计划时刻顺序编号，保证航班号+计划起飞时间不重复"""
+    prefix = profile.combo_prefix[combo]
+    order = np.lexsort((tod, prefix, day))
+    key = day[order] * len(profile.prefixes) + prefix[order]
+    positions = np.arange(len(order))
+    group_start = np.maximum.accumulate(np.where(np.r_[True, key[1:] != key[:-1]], positions, 0))
+    rank = np.empty_like(positions)
+    rank[order] = positions - group_start
+
+    codes = prefix * FLIGHT_NO_SPAN + rank % FLIGHT_NO_SPAN
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    return pd.Categorical.from_codes(inverse, categories=profile.flight_labels()[uniques])
+
+
+def _generate_days(profile, first_day, per_day, n_rows, start_ns, rng):
+    """从第first_day天起生成n_rows行（每天per_day班）"""
+    day = first_day + np.arange(n_rows, dtype=np.int64) // per_day
+    combo = rng.choice(len(profile.combo_p), size=n_rows, p=profile.combo_p)
+    tod = rng.choice(1440, size=n_rows, p=profile.tod_p).astype(np.int64)
+
+    delay = _sample_delay(profile, tod // 60, rng)
+    jitter_ns = rng.integers(-29, 30, size=n_rows) * 10 ** 9  # 实际时间精确到秒，delayMin为其取整分钟
+    offset_ns = np.round(_inverse_cdf(profile.arrival_offset_quantiles, rng.random(n_rows)) * 60).astype(np.int64) * 10 ** 9
+
+    sched_dep = start_ns + (day * 1440 + tod) * _MINUTE_NS
+    sched_arr = sched_dep + profile.combo_block[combo] * _MINUTE_NS
+    actual_dep = sched_dep + delay * _MINUTE_NS + jitter_ns
+    actual_arr = sched_arr + delay * _MINUTE_NS + offset_ns
+
+    columns = {col: pd.Categorical.from_codes(codes[combo], categories=categories)
+               for col, (codes, categories) in profile.combo_codes.items()}
+    columns['航班号'] = _flight_numbers(profile, combo, day, tod)
+    columns.update({
+        '计划起飞时间': sched_dep.view('datetime64[ns]'),
+        '计划到达时间': sched_arr.view('datetime64[ns]'),
+        '实际起飞时间': actual_dep.view('datetime64[ns]'),
+        '实际到达时间': actual_arr.view('datetime64[ns]'),
+        'delayMin': delay,
+    })
+    return pd.DataFrame(columns)[RAW_COLUMNS]
+
+
+def iter_generate(n_rows, seed=DEFAULT_SEED, profile=None, start=DEFAULT_START, days=None, chunk_rows=CHUNK_ROWS):
+    """
+    分块生成 n_rows 行合成数据（每块为若干整天）
+    days: 日期跨度，默认按真实日均航班量推算（上限MAX_DAYS天，超出后按日加密）
+    每块使用独立的随机流（种子 + 块序号），结果与运行环境、调用次数无关
+    """
+    profile = profile or calibrate()
+    days = days or int(min(MAX_DAYS, max(1, np.ceil(n_rows / profile.daily_flights))))
+    per_day = int(np.ceil(n_rows / days))
+    days_per_chunk = max(1, chunk_rows // per_day)
+    start_ns = pd.Timestamp(start).value
+
+    done = 0
+    for chunk_index, first_day in enumerate(range(0, days, days_per_chunk)):
+        rows = min(days_per_chunk * per_day, n_rows - done)
+        if rows <= 0:
+            break
+        rng = np.random.default_rng([seed, chunk_index])
+        yield _generate_days(profile, first_day, per_day, rows, start_ns, rng)
+        done += rows
+
+
+def generate(n_rows, seed=DEFAULT_SEED, profile=None, start=DEFAULT_START, days=None):
+    """一次性生成 n_rows 行合成数据（DataFrame，代码类字段为category）"""
+    chunks = list(iter_generate(n_rows, seed, profile, start, days))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True).astype({col: 'category' for col in COMBO_COLS + ['航班号']})
+
+
+def write_synthetic(path, n_rows, seed=DEFAULT_SEED, profile=None, start=DEFAULT_START, days=None):
+    """
+    生成并写出合成数据，格式按扩展名：.xlsx / .csv / .parquet
+    csv与parquet逐块追加写出，内存占用与总行数无关；xlsx受单表行数上限约束
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    suffix = path.suffix.lower()
+    chunks = iter_generate(n_rows, seed, profile, start, days)
+
+    if suffix == '.xlsx':
+        if n_rows > XLSX_MAX_ROWS:
+            raise ValueError(f"xlsx单表最多{XLSX_MAX_ROWS:,}行，请改用.csv或.parquet")
+        pd.concat(chunks, ignore_index=True).to_excel(path, index=False)
+    elif suffix == '.csv':
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+    elif suffix == '.parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                # 各块的类别集合不同，统一转为字符串列写出（Parquet自身按字典编码存储）
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = pa.schema([pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f
+                                        for f in table.schema])
+                    writer = pq.ParquetWriter(path, schema)
+                table = table.cast(schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"不支持的输出格式: {suffix}（可选 .xlsx / .csv / .parquet）")
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='按真实样本标定的合成航班数据生成器')
+    parser.add_argument('rows', type=int, help='生成行数')
+    parser.add_argument('-o', '--output', default=None, help='输出路径（.xlsx/.csv/.parquet，默认parquet）')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='随机种子')
+    parser.add_argument('--start', default=DEFAULT_START, help='起始日期')
+    parser.add_argument('--days', type=int, default=None, help='日期跨度（天），默认按真实日均航班量推算')
+    parser.add_argument('--source', default=str(DATA_PATH), help='用于标定的真实数据')
+    args = parser.parse_args()
+
+    output = Path(args.output) if args.output else OUTPUT_DIR / f'khn_flight_synth_{args.rows}.parquet'
+    profile = calibrate(args.source)
+    t0 = time.perf_counter()
+    write_synthetic(output, args.rows, seed=args.seed, profile=profile, start=args.start, days=args.days)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ 合成数据已写出: {output}（{args.rows:,}行，{elapsed:.1f}s，{args.rows / elapsed:,.0f}行/秒）")
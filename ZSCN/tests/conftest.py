@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""测试配置：脚本按扁平模块相互导入（from flight_io import ...），将ZSCN目录加入导入路径"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
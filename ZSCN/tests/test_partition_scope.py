@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+分区读取与全表筛选的机场口径一致性（起飞或到达机场命中即保留）
+两个机场（KHN、SHA）各有分区，KHN⇄SHA航班在两处各存一份；PEK、CAN没有自己的分区
+load_partitions 与 FlightStore（分区读取、单文件副本读取）的结果均须与 filter_flights 一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aircraft_types import AIRCRAFT_FAMILIES
+from flight_cube import load_cube
+from flight_io import filter_flights, load_partitions, write_columnar_cache, write_partitions
+from flight_store import FlightStore
+from kpi import group_kpis
+from parallel_agg import parallel_aggregate, summarize
+from quantile_sketch import SKETCH_GROUPINGS, load_sketches, sketch_kpis, write_sketch_partitions
+
+FLIGHTS = [
+    # 航班号, 起飞, 到达, 计划起飞时间, delayMin
+    ('A1', 'KHN', 'PEK', '2025-06-03 08:00', 5),
+    ('A2', 'PEK', 'KHN', '2025-06-20 10:00', 40),
+    ('A3', 'KHN', 'SHA', '2025-06-21 12:00', -3),
+    ('A4', 'SHA', 'KHN', '2025-07-02 09:00', 75),
+    ('A5', 'SHA', 'CAN', '2025-07-05 18:00', 12),
+    ('A6', 'CAN', 'SHA', '2025-07-30 21:00', 0),
+    ('A7', 'KHN', 'CAN', '2025-07-31 07:00', 200),
+]
+KEY = ['航班号', '计划起飞时间']
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=['航班号', '起飞机场三字码', '到达机场三字码', '计划起飞时间', 'delayMin']) \
+        .assign(计划起飞时间=lambda d: pd.to_datetime(d['计划起飞时间']),
+                小时段=lambda d: d['计划起飞时间'].dt.hour,
+                所属航司代码=lambda d: ['CJX', 'CES'] * 3 + ['CJX'],
+                机型分类=AIRCRAFT_FAMILIES[0])
+
+
+def _sorted(df):
+    return df.sort_values(KEY).reset_index(drop=True).astype({c: str for c in df.columns})
+
+
+def _write_owned(flights, write, directory):
+    """按机场写出分区：KHN、SHA各写出与自己起降相关的航班"""
+    for airport in ('KHN', 'SHA'):
+        touches = (flights['起飞机场三字码'] == airport) | (flights['到达机场三字码'] == airport)
+        write(flights[touches], airport, directory)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    flights = _frame(FLIGHTS)
+    _write_owned(flights, write_partitions, tmp_path)
+    return flights, tmp_path
+
+
+SCOPES = [
+    (None, None, None),
+    ('KHN', None, None),
+    ('SHA', '2025-07', None),
+    (['KHN', 'SHA'], '2025-06', '2025-07'),
+    ('PEK', None, None),              # 没有自己的分区，航班在KHN分区中
+    (['KHN', 'CAN'], None, '2025-07-30'),
+    ('XXX', None, None),              # 无航班：各条路径均为空表
+]
+
+
+@pytest.mark.parametrize('airports, start, end', SCOPES)
+def test_partitions_match_filter_flights(dataset, airports, start, end):
+    flights, dataset_dir = dataset
+    expected = filter_flights(flights, airports, start, end)
+    result = load_partitions(airports, start, end, columns=list(flights.columns), dataset_dir=dataset_dir)
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected))
+
+
+@pytest.mark.parametrize('partitioned', [True, False])
+@pytest.mark.parametrize('airports, start, end', SCOPES)
+def test_flight_store_matches_filter_flights(dataset, tmp_path, airports, start, end, partitioned):
+    flights, dataset_dir = dataset
+    parquet_path, manifest_path = tmp_path / 'flights.parquet', tmp_path / 'manifest.json'
+    write_columnar_cache(flights, source_path=tmp_path / 'missing.xlsx',
+                         parquet_path=parquet_path, manifest_path=manifest_path)
+    store = FlightStore(source_path=tmp_path / 'missing.xlsx', parquet_path=parquet_path,
+                        manifest_path=manifest_path,
+                        dataset_dir=dataset_dir if partitioned else tmp_path / 'no_dataset')
+    expected = filter_flights(flights, airports, start, end)
+    result = store.scan(airports, start, end).select(*flights.columns).load()
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected))
+
+
+@pytest.mark.parametrize('airports, start, end', SCOPES)
+def test_sketch_weight_matches_filter_flights(tmp_path, airports, start, end):
+    # 摘要按月份粒度裁剪
+    start, end = start and start[:7], end and end[:7]
+    flights = _frame(FLIGHTS)
+    _write_owned(flights, write_sketch_partitions, tmp_path)
+    expected = filter_flights(flights, airports, start, end)
+    sketches = load_sketches(airports=airports, start=start, end=end, sketch_dir=tmp_path)
+    for name, by in SKETCH_GROUPINGS.items():
+        assert sketches[name]['weight'].sum() == len(expected)
+        counts = sketch_kpis(sketches[name], metrics=['count'])['count']
+        expected_counts = expected.groupby(by, observed=True).size()
+        assert sorted(counts.astype(int).items()) == sorted(expected_counts.astype(int).items())
+
+
+AGG_GROUPINGS = {name: [name] for name in ('小时段', '所属航司代码', '到达机场三字码')}  # 测试数据不含星期、机型列
+
+
+@pytest.mark.parametrize('airports, start, end', [scope for scope in SCOPES if scope[0] != 'XXX'])
+def test_parallel_aggregate_matches_group_kpis(dataset, airports, start, end):
+    # 分区任务按月份粒度裁剪
+    start, end = start and start[:7], end and end[:7]
+    flights, dataset_dir = dataset
+    expected = filter_flights(flights, airports, start, end)
+    summaries = summarize(parallel_aggregate(airports=airports, start=start, end=end, workers=1,
+                                             groupings=AGG_GROUPINGS, dataset_dir=dataset_dir), AGG_GROUPINGS)
+    metrics = ['count', 'mean', 'delay_rate', 'normal_rate', 'late_rate', 'median']
+    for name, by in AGG_GROUPINGS.items():
+        exact = group_kpis(expected, by, metrics)
+        result = summaries[name][metrics].reindex(exact.index)
+        np.testing.assert_allclose(result.to_numpy(np.float64), exact.to_numpy(np.float64), rtol=1e-9)
+
+
+@pytest.mark.parametrize('layout', ['no_partitions', 'empty_partition'])
+def test_empty_dataset_returns_empty_frame(tmp_path, layout):
+    if layout == 'empty_partition':
+        (tmp_path / 'airport=KHN' / 'month=2025-06').mkdir(parents=True)
+    flights = load_partitions('KHN', columns=['航班号', 'delayMin'], dataset_dir=tmp_path)
+    assert flights.empty and list(flights.columns) == ['航班号', 'delayMin']
+    assert str(flights['delayMin'].dtype) == 'int32'
+    if layout == 'empty_partition':  # 存在分区目录时load_cube走分区路径
+        cube = load_cube('KHN', cube_dir=tmp_path)
+        assert cube.empty and 'count' in cube.columns
+
+
+def test_shared_flight_read_once(dataset):
+    _, dataset_dir = dataset
+    result = load_partitions(dataset_dir=dataset_dir)
+    assert result['航班号'].value_counts().max() == 1
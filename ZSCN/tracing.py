@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+轻量级运行追踪（第二章处理阶段与第三章图表构建共用）
+
+用 @traced 装饰函数、或用 with span(...) 包住一段代码，记录一个“跨度”（span）：
+墙钟耗时、CPU耗时、输入/输出行数、写出字节数，以及嵌套关系（父跨度）。
+据此可区分时间花在Excel读写、groupby、pyecharts配置构建还是HTML写出上。
+
+开关：
+- 环境变量 KHN_TRACE=1：进程退出时自动导出到 output/traces/（Chrome trace + 跨度JSON）
+- run_pipeline.py --trace：流水线结束后导出（含各图表子进程的跨度）
+- 代码中 tracing.enable()
+关闭时被装饰函数只多一次布尔判断，with span(...) 返回共享的空跨度，开销可忽略。
+
+导出格式：
+- export_json：跨度列表
+- export_chrome_trace：Chrome trace事件格式，可在 chrome://tracing 或 ui.perfetto.dev 中打开
+"""
+
+import atexit
+import contextlib
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+TRACE_DIR = Path('output/traces')
+
+_ENABLED = os.environ.get('KHN_TRACE', '').strip().lower() not in ('', '0', 'false', 'off')
+_SPANS = []            # 已结束的跨度（字典）
+_LOCAL = threading.local()
+_IDS = itertools.count(1)
+_EXPORTED = False      # 已显式导出时，退出时不再重复导出
+
+
+def enable(flag=True):
+    global _ENABLED
+    _ENABLED = bool(flag)
+
+
+def is_enabled():
+    return _ENABLED
+
+
+class Span:
+    """进行中的跨度：rows_out / bytes_written / attrs 可在跨度内补充"""
+
+    __slots__ = ('id', 'name', 'category', 'parent', 'depth', 'rows_in', 'rows_out', 'bytes_written', 'attrs',
+                 '_start_ns', '_cpu_start')
+
+    def __init__(self, name, category, parent, depth, rows_in, attrs):
+        self.id = next(_IDS)
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_written = 0
+        self.attrs = attrs
+
+    def add_output(self, path):
+        """累计写出文件的字节数（文件不存在时忽略）"""
+        try:
+            self.bytes_written += os.path.getsize(path)
+        except OSError:
+            pass
+
+
+class _NullSpan:
+    """追踪关闭时的占位跨度：本身即空的上下文管理器，属性赋值与记录均为空操作"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+    def add_output(self, path):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _stack():
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    return stack
+
+
+def current_span():
+    """当前线程内最内层的跨度（追踪关闭或不在跨度内时返回空跨度）"""
+    stack = _stack() if _ENABLED else None
+    return stack[-1] if stack else _NULL_SPAN
+
+
+def record_output(*paths):
+    """把写出文件的大小计入当前跨度"""
+    if _ENABLED:
+        span_ = current_span()
+        for path in paths:
+            span_.add_output(path)
+
+
+def span(name, category='', rows_in=None, **attrs):
+    """追踪一段代码：with span('render_html', category='pyecharts') as s: ...（关闭时直接返回空跨度）"""
+    if not _ENABLED:
+        return _NULL_SPAN
+    return _active_span(name, category, rows_in, attrs)
+
+
+@contextlib.contextmanager
+def _active_span(name, category, rows_in, attrs):
+    stack = _stack()
+    current = Span(name, category, stack[-1] if stack else None, len(stack), rows_in, attrs)
+    stack.append(current)
+    current._cpu_start = time.process_time()
+    current._start_ns = time.perf_counter_ns()
+    try:
+        yield current
+    finally:
+        end_ns = time.perf_counter_ns()
+        cpu = time.process_time() - current._cpu_start
+        stack.pop()
+        _SPANS.append({
+            'id': current.id,
+            'name': current.name,
+            'category': current.category,
+            'parent_id': current.parent.id if current.parent else None,
+            'parent': current.parent.name if current.parent else None,
+            'depth': current.depth,
+            'start_ns': current._start_ns,
+            'wall_s': (end_ns - current._start_ns) / 1e9,
+            'cpu_s': cpu,
+            'rows_in': current.rows_in,
+            'rows_out': current.rows_out,
+            'bytes_written': current.bytes_written,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'attrs': current.attrs,
+        })
+
+
+def _rows(obj):
+    """DataFrame/Series/数组取行数；元组取其中第一个有行数的元素；其余返回None"""
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(obj, tuple):
+        for item in obj:
+            rows = _rows(item)
+            if rows is not None:
+                return rows
+    return None
+
+
+def traced(name=None, category=None):
+    """
+    函数装饰器：每次调用记录一个跨度，输入行数取第一个位置参数，输出行数取返回值
+    用法：@traced 或 @traced('图3-1')
+    """
+    def decorate(func):
+        span_name = name or func.__name__
+        span_category = category or func.__module__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            with span(span_name, span_category, rows_in=_rows(args[0]) if args else None) as current:
+                result = func(*args, **kwargs)
+                current.rows_out = _rows(result)
+                return result
+        return wrapper
+
+    if callable(name):  # @traced 不带括号
+        func, name = name, None
+        return decorate(func)
+    return decorate
+
+
+def traced_render(chart, path):
+    """pyecharts图表写出HTML（单独记为render_html跨度，含写出字节数）"""
+    with span('render_html', 'pyecharts', path=str(path)) as current:
+        result = chart.render(path)
+        current.add_output(path)
+    return result
+
+
+# ==========================================
+# 收集与导出
+# ==========================================
+def spans():
+    return list(_SPANS)
+
+
+def collect():
+    """取出并清空本进程已记录的跨度（图表子进程把结果带回主进程时使用）"""
+    collected = list(_SPANS)
+    _SPANS.clear()
+    return collected
+
+
+def extend(records):
+    """并入其他进程记录的跨度"""
+    _SPANS.extend(records)
+
+
+def export_json(path, records=None):
+    records = _SPANS if records is None else records
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'spans': records}, f, indent=2, ensure_ascii=False, default=str)
+    return path
+
+
+def export_chrome_trace(path, records=None):
+    """Chrome trace事件格式（完整事件ph='X'，时间单位微秒）"""
+    records = _SPANS if records is None else records
+    origin = min((r['start_ns'] for r in records), default=0)
+    events = []
+    for r in records:
+        args = {'cpu_ms': round(r['cpu_s'] * 1000, 3), 'rows_in': r['rows_in'], 'rows_out': r['rows_out'],
+                'bytes_written': r['bytes_written'], **r['attrs']}
+        events.append({'name': r['name'], 'cat': r['category'], 'ph': 'X', 'pid': r['pid'], 'tid': r['tid'],
+                       'ts': (r['start_ns'] - origin) / 1000, 'dur': r['wall_s'] * 1e6,
+                       'args': {k: v for k, v in args.items() if v is not None}})
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False, default=str)
+    return path
+
+
+def export(prefix=None, trace_dir=TRACE_DIR):
+    """同时导出跨度JSON与Chrome trace，返回(跨度JSON路径, trace路径)"""
+    global _EXPORTED
+    if prefix is None:
+        prefix = f"{Path(sys.argv[0]).stem or 'python'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    trace_dir = Path(trace_dir)
+    paths = (export_json(trace_dir / f'{prefix}.spans.json'),
+             export_chrome_trace(trace_dir / f'{prefix}.trace.json'))
+    _EXPORTED = True
+    return paths
+
+
+def print_summary(records=None):
+    """按跨度名称汇总：调用次数、墙钟/自身/CPU总耗时、行数、写出字节（自身耗时 = 墙钟 − 子跨度墙钟）"""
+    records = _SPANS if records is None else records
+    child_wall = {}
+    for r in records:
+        if r['parent_id'] is not None:
+            key = (r['pid'], r['parent_id'])
+            child_wall[key] = child_wall.get(key, 0.0) + r['wall_s']
+
+    totals = {}
+    for r in records:
+        t = totals.setdefault(r['name'], {'calls': 0, 'wall_s': 0.0, 'self_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0,
+                                          'rows_out': 0, 'bytes_written': 0})
+        t['calls'] += 1
+        t['wall_s'] += r['wall_s']
+        t['self_s'] += r['wall_s'] - child_wall.get((r['pid'], r['id']), 0.0)
+        t['cpu_s'] += r['cpu_s']
+        t['rows_in'] += r['rows_in'] or 0
+        t['rows_out'] += r['rows_out'] or 0
+        t['bytes_written'] += r['bytes_written']
+
+    print("\n" + "=" * 96)
+    print(f"🔍 追踪汇总（{len(records)}个跨度）")
+    print("=" * 96)
+    print(f"  {'跨度':<32}{'次数':>6}{'墙钟(s)':>10}{'自身(s)':>10}{'CPU(s)':>10}{'输入行':>11}{'输出行':>11}{'写出KB':>10}")
+    for name, t in sorted(totals.items(), key=lambda item: -item[1]['self_s']):
+        print(f"  {name:<32}{t['calls']:>6}{t['wall_s']:>10.3f}{t['self_s']:>10.3f}{t['cpu_s']:>10.3f}"
+              f"{t['rows_in']:>11,}{t['rows_out']:>11,}{t['bytes_written'] / 1024:>10.1f}")
+
+
+def _export_at_exit():
+    if _ENABLED and _SPANS and not _EXPORTED:
+        spans_path, trace_path = export()
+        print_summary()
+        print(f"\n📁 追踪结果: {trace_path}（chrome://tracing 打开）")
+
+
+if _ENABLED:
+    atexit.register(_export_at_exit)